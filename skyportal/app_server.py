@@ -20,11 +20,13 @@ from skyportal.handlers.api import (
     InvalidEndpointHandler,
     NewsFeedHandler,
     ObservingRunHandler,
+    ObservingRunStarlistHandler,
     PhotometryHandler,
     BulkDeletePhotometryHandler,
     ObjPhotometryHandler,
     SharingHandler,
     SourceHandler,
+    SourceCrossmatchHandler,
     SourceOffsetsHandler,
     SourceFinderHandler,
     SpectrumHandler,
@@ -37,6 +39,8 @@ from skyportal.handlers.api import (
     UserHandler,
 )
 from skyportal.handlers.api.internal import (
+    SourceIDAutocompleteHandler,
+    ScanningBundleHandler,
     PlotPhotometryHandler,
     PlotSpectroscopyHandler,
     SourceViewsHandler,
@@ -46,9 +50,11 @@ from skyportal.handlers.api.internal import (
     InstrumentObservationParamsHandler,
     LogHandler,
     PlotAirmassHandler,
+    PlotModelsHandler,
+    PlotRunAirmassHandler,
 )
 
-from . import models, model_util, openapi
+from . import models, model_util, openapi, plot
 
 
 def make_app(cfg, baselayer_handlers, baselayer_settings):
@@ -79,6 +85,7 @@ def make_app(cfg, baselayer_handlers, baselayer_settings):
         (r'/api/classification(/[0-9]+)?', ClassificationHandler),
         (r'/api/comment(/[0-9]+)?', CommentHandler),
         (r'/api/comment(/[0-9]+)/attachment', CommentAttachmentHandler),
+        (r'/api/crossmatch', SourceCrossmatchHandler),
         (r'/api/filters(/.*)?', FilterHandler),
         (r'/api/followup_request(/.*)?', FollowupRequestHandler),
         (r'/api/groups/public', PublicGroupHandler),
@@ -87,6 +94,7 @@ def make_app(cfg, baselayer_handlers, baselayer_settings):
         (r'/api/groups(/[0-9]+)?', GroupHandler),
         (r'/api/instrument(/[0-9]+)?', InstrumentHandler),
         (r'/api/newsfeed', NewsFeedHandler),
+        (r'/api/observing_run/([0-9]+)/starlist', ObservingRunStarlistHandler),
         (r'/api/observing_run(/[0-9]+)?', ObservingRunHandler),
         (r'/api/photometry(/[0-9]+)?', PhotometryHandler),
         (r'/api/sharing', SharingHandler),
@@ -107,9 +115,13 @@ def make_app(cfg, baselayer_handlers, baselayer_settings):
         (r'/api/internal/profile', ProfileHandler),
         (r'/api/internal/dbinfo', DBInfoHandler),
         (r'/api/internal/source_views(/.*)?', SourceViewsHandler),
+        (r'/api/internal/autocomplete/sources', SourceIDAutocompleteHandler),
+        (r'/api/internal/scanning_bundle', ScanningBundleHandler),
         (r'/api/internal/plot/photometry/(.*)', PlotPhotometryHandler),
         (r'/api/internal/plot/spectroscopy/(.*)', PlotSpectroscopyHandler),
+        (r'/api/internal/plot/airmass/run/([0-9]+)', PlotRunAirmassHandler),
         (r'/api/internal/plot/airmass/(.*)', PlotAirmassHandler),
+        (r'/api/internal/plot/models/([0-9a-f]+)\.js', PlotModelsHandler),
         (r'/api/internal/instrument_obs_params', InstrumentObservationParamsHandler),
         (r'/api/internal/log', LogHandler),
         (r'/api/.*', InvalidEndpointHandler),
@@ -128,6 +140,7 @@ def make_app(cfg, baselayer_handlers, baselayer_settings):
     app = tornado.web.Application(handlers, **settings)
     models.init_db(**cfg['database'])
     baselayer_model_util.create_tables()
+    model_util.setup_indexes()
     model_util.setup_permissions()
     app.cfg = cfg
 
@@ -142,6 +155,9 @@ def make_app(cfg, baselayer_handlers, baselayer_settings):
 
     model_util.provision_public_group()
 
+    # Compile the custom Bokeh models once, rather than on the first plot
+    plot.custom_models_bundle()
+
     app.openapi_spec = openapi.spec_from_handlers(handlers)
 
     return app
@@ -7,7 +7,7 @@ from .group import GroupHandler, GroupUserHandler, GroupStreamHandler
 from .instrument import InstrumentHandler
 from .invalid import InvalidEndpointHandler
 from .news_feed import NewsFeedHandler
-from .observingrun import ObservingRunHandler
+from .observingrun import ObservingRunHandler, ObservingRunStarlistHandler
 from .photometry import (
     PhotometryHandler,
     ObjPhotometryHandler,
@@ -15,7 +15,12 @@ from .photometry import (
 )
 from .public_group import PublicGroupHandler
 from .sharing import SharingHandler
-from .source import SourceHandler, SourceOffsetsHandler, SourceFinderHandler
+from .source import (
+    SourceHandler,
+    SourceCrossmatchHandler,
+    SourceOffsetsHandler,
+    SourceFinderHandler,
+)
 from .spectrum import SpectrumHandler, ObjSpectraHandler
 from .stream import StreamHandler
 from .sysinfo import SysInfoHandler
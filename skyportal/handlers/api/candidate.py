@@ -1,6 +1,7 @@
 import arrow
 
-from sqlalchemy.orm import joinedload
+import sqlalchemy as sa
+from sqlalchemy.orm import joinedload, load_only
 from marshmallow.exceptions import ValidationError
 
 from baselayer.app.access import auth_or_token, permissions
@@ -17,6 +18,19 @@ from ...models import (
 )
 
 
+# Fields of listed candidates that are not Obj columns, and are computed or
+# loaded separately for each candidate
+CANDIDATE_COMPUTED_FIELDS = [
+    "last_detected",
+    "gal_lat",
+    "gal_lon",
+    "comments",
+    "thumbnails",
+    "is_source",
+    "passing_group_ids",
+]
+
+
 class CandidateHandler(BaseHandler):
     @auth_or_token
     def get(self, obj_id=None):
@@ -109,6 +123,33 @@ class CandidateHandler(BaseHandler):
             description: |
               Comma-separated string of filter IDs (e.g. "1,2"). Defaults to all of user's
               groups' filters if groupIDs is not provided.
+          - in: query
+            name: include
+            nullable: true
+            schema:
+              type: array
+              items:
+                type: string
+            explode: false
+            style: simple
+            description: |
+              Comma-separated list of fields to return for each candidate (e.g.
+              "id,ra,dec,last_detected"); only these columns are loaded from the
+              database. May be any Obj column, or one of "last_detected", "gal_lat",
+              "gal_lon", "comments", "thumbnails", "is_source" and
+              "passing_group_ids". `id` is always returned. Defaults to all fields.
+          - in: query
+            name: exclude
+            nullable: true
+            schema:
+              type: array
+              items:
+                type: string
+            explode: false
+            style: simple
+            description: |
+              Comma-separated list of fields to omit for each candidate (e.g.
+              "altdata,comments"). Cannot be combined with `include`.
           responses:
             200:
               content:
@@ -174,88 +215,43 @@ class CandidateHandler(BaseHandler):
         end_date = self.get_query_argument("endDate", None)
         group_ids = self.get_query_argument("groupIDs", None)
         filter_ids = self.get_query_argument("filterIDs", None)
-        user_accessible_group_ids = [g.id for g in self.current_user.accessible_groups]
-        user_accessible_filter_ids = [
-            filtr.id
-            for g in self.current_user.accessible_groups
-            for filtr in g.filters
-            if g.filters is not None
-        ]
-        if group_ids is not None:
-            if isinstance(group_ids, str) and "," in group_ids:
-                group_ids = [int(g_id) for g_id in group_ids.split(",")]
-            elif isinstance(group_ids, str) and group_ids.isdigit():
-                group_ids = [int(group_ids)]
-            else:
-                return self.error("Invalid groupIDs value -- select at least one group")
-            filter_ids = [
-                f.id for f in Filter.query.filter(Filter.group_id.in_(group_ids))
-            ]
-        elif filter_ids is not None:
-            if "," in filter_ids:
-                filter_ids = [int(f_id) for f_id in filter_ids.split(",")]
-            elif filter_ids.isdigit():
-                filter_ids = [int(filter_ids)]
-            else:
-                return self.error("Invalid filterIDs paramter value.")
-            group_ids = [
-                f.group_id for f in Filter.query.filter(Filter.id.in_(filter_ids))
-            ]
-        else:
-            # If 'groupIDs' & 'filterIDs' params not present in request, use all user groups
-            group_ids = user_accessible_group_ids
-            filter_ids = user_accessible_filter_ids
-
-        # Ensure user has access to specified groups/filters
-        if not (
-            all([gid in user_accessible_group_ids for gid in group_ids])
-            and all([fid in user_accessible_filter_ids for fid in filter_ids])
-        ):
-            return self.error(
-                "Insufficient permissions - you must only specify "
-                "groups/filters that you have access to."
+        try:
+            fields = parse_field_selection(
+                self.get_query_argument("include", None),
+                self.get_query_argument("exclude", None),
+                CANDIDATE_COMPUTED_FIELDS,
             )
+        except ValueError as e:
+            return self.error(str(e))
+        user_accessible_filter_ids = get_user_accessible_filter_ids(self.current_user)
+        try:
+            group_ids, filter_ids = resolve_candidate_group_and_filter_ids(
+                self.current_user, group_ids, filter_ids
+            )
+        except ValueError as e:
+            return self.error(str(e))
 
         try:
             page = int(page_number)
+            n_per_page = int(n_per_page)
         except ValueError:
             return self.error("Invalid page number value.")
-        q = (
-            Obj.query.options(
-                [
-                    joinedload(Obj.thumbnails)
-                    .joinedload(Thumbnail.photometry)
-                    .joinedload(Photometry.instrument)
-                    .joinedload(Instrument.telescope),
-                ]
-            )
-            .filter(
-                Obj.id.in_(
-                    DBSession()
-                    .query(Candidate.obj_id)
-                    .filter(Candidate.filter_id.in_(filter_ids))
-                )
+        options = obj_load_options(fields)
+        if fields is None or "thumbnails" in fields:
+            options.append(
+                joinedload(Obj.thumbnails)
+                .joinedload(Thumbnail.photometry)
+                .joinedload(Photometry.instrument)
+                .joinedload(Instrument.telescope)
             )
-            .order_by(Obj.last_detected.desc().nullslast(), Obj.id)
+        q = candidate_query(
+            filter_ids,
+            group_ids,
+            unsaved_only=unsaved_only == "true",
+            start_date=start_date,
+            end_date=end_date,
+            options=options,
         )
-        if unsaved_only == "true":
-            q = q.filter(
-                Obj.id.notin_(
-                    DBSession()
-                    .query(Source.obj_id)
-                    .filter(Source.group_id.in_(group_ids))
-                )
-            )
-        if start_date is not None and start_date.strip() not in [
-            "",
-            "null",
-            "undefined",
-        ]:
-            start_date = arrow.get(start_date).datetime
-            q = q.filter(Obj.last_detected >= start_date)
-        if end_date is not None and end_date.strip() not in ["", "null", "undefined"]:
-            end_date = arrow.get(end_date).datetime
-            q = q.filter(Obj.last_detected <= end_date)
         try:
             query_results = grab_query_results_page(
                 q, total_matches, page, n_per_page, "candidates"
@@ -272,26 +268,32 @@ class CandidateHandler(BaseHandler):
         )
         candidate_list = []
         for obj in query_results["candidates"]:
-            obj.comments = obj.get_comments_owned_by(self.current_user)
-            obj.is_source = (obj.id,) in matching_source_ids
-            obj.passing_group_ids = [
-                f.group_id
-                for f in (
-                    Filter.query.filter(Filter.id.in_(user_accessible_filter_ids))
-                    .filter(
-                        Filter.id.in_(
-                            DBSession()
-                            .query(Candidate.filter_id)
-                            .filter(Candidate.obj_id == obj.id)
+            if fields is None or "comments" in fields:
+                obj.comments = obj.get_comments_owned_by(self.current_user)
+            candidate_info = obj.to_dict()
+            candidate_info["is_source"] = (obj.id,) in matching_source_ids
+            if fields is None or "passing_group_ids" in fields:
+                candidate_info["passing_group_ids"] = [
+                    f.group_id
+                    for f in (
+                        Filter.query.filter(Filter.id.in_(user_accessible_filter_ids))
+                        .filter(
+                            Filter.id.in_(
+                                DBSession()
+                                .query(Candidate.filter_id)
+                                .filter(Candidate.obj_id == obj.id)
+                            )
                         )
+                        .all()
                     )
-                    .all()
-                )
-            ]
-            candidate_list.append(obj.to_dict())
-            candidate_list[-1]["last_detected"] = obj.last_detected
-            candidate_list[-1]["gal_lat"] = obj.gal_lat_deg
-            candidate_list[-1]["gal_lon"] = obj.gal_lon_deg
+                ]
+            if fields is None or "last_detected" in fields:
+                candidate_info["last_detected"] = obj.last_detected
+            if fields is None or "gal_lat" in fields:
+                candidate_info["gal_lat"] = obj.gal_lat_deg
+            if fields is None or "gal_lon" in fields:
+                candidate_info["gal_lon"] = obj.gal_lon_deg
+            candidate_list.append(select_fields(candidate_info, fields))
 
         query_results["candidates"] = candidate_list
         return self.success(data=query_results)
@@ -470,3 +472,153 @@ def grab_query_results_page(q, total_matches, page, n_items_per_page, items_name
     if info["totalMatches"] == 0:
         info["numberingStart"] = 0
     return info
+
+
+def parse_field_selection(include, exclude, computed_fields):
+    """Resolve `include`/`exclude` query arguments (comma-separated field
+    names) into the set of fields to return for each listed Obj, or None if
+    neither was provided, i.e. all fields should be returned.
+
+    Fields may be Obj columns or any of `computed_fields`. Raises ValueError
+    for unknown fields, or if both arguments are provided.
+    """
+    if include is None and exclude is None:
+        return None
+    if include is not None and exclude is not None:
+        raise ValueError("Only one of 'include' and 'exclude' may be provided.")
+    columns = [c.key for c in sa.inspect(Obj).column_attrs]
+    available = columns + [f for f in computed_fields if f not in columns]
+    requested = {f.strip() for f in (include or exclude).split(",") if f.strip()}
+    invalid = requested - set(available)
+    if invalid:
+        raise ValueError(
+            f"Invalid field(s) {sorted(invalid)}; must be one of {available}"
+        )
+    if include is not None:
+        return requested | {"id"}
+    return (set(available) - requested) | {"id"}
+
+
+def obj_load_options(fields):
+    """Query options restricting the Obj columns loaded to those needed for
+    `fields` (see `parse_field_selection`)."""
+    if fields is None:
+        return []
+    needed = set(fields)
+    if needed & {"gal_lat", "gal_lon"}:
+        needed |= {"ra", "dec"}
+    return [
+        load_only(
+            *[
+                getattr(Obj, c.key)
+                for c in sa.inspect(Obj).column_attrs
+                if c.key in needed
+            ]
+        )
+    ]
+
+
+def select_fields(obj_info, fields):
+    """Restrict a serialized Obj to `fields` (see `parse_field_selection`)."""
+    if fields is None:
+        return obj_info
+    return {k: v for k, v in obj_info.items() if k in fields}
+
+
+def get_user_accessible_filter_ids(user_or_token):
+    return [
+        filtr.id
+        for g in user_or_token.accessible_groups
+        for filtr in g.filters
+        if g.filters is not None
+    ]
+
+
+def resolve_candidate_group_and_filter_ids(
+    user_or_token, group_ids=None, filter_ids=None
+):
+    """Parse the comma-separated `groupIDs`/`filterIDs` candidate query
+    arguments into lists of group and filter IDs. If neither is provided,
+    all of the user's groups and filters are used.
+
+    Raises ValueError if either value is invalid, or includes groups or
+    filters the user does not have access to.
+    """
+    user_accessible_group_ids = [g.id for g in user_or_token.accessible_groups]
+    user_accessible_filter_ids = get_user_accessible_filter_ids(user_or_token)
+    if group_ids is not None:
+        if isinstance(group_ids, str) and "," in group_ids:
+            group_ids = [int(g_id) for g_id in group_ids.split(",")]
+        elif isinstance(group_ids, str) and group_ids.isdigit():
+            group_ids = [int(group_ids)]
+        else:
+            raise ValueError("Invalid groupIDs value -- select at least one group")
+        filter_ids = [f.id for f in Filter.query.filter(Filter.group_id.in_(group_ids))]
+    elif filter_ids is not None:
+        if "," in filter_ids:
+            filter_ids = [int(f_id) for f_id in filter_ids.split(",")]
+        elif filter_ids.isdigit():
+            filter_ids = [int(filter_ids)]
+        else:
+            raise ValueError("Invalid filterIDs paramter value.")
+        group_ids = [f.group_id for f in Filter.query.filter(Filter.id.in_(filter_ids))]
+    else:
+        # If 'groupIDs' & 'filterIDs' params not present in request, use all user groups
+        group_ids = user_accessible_group_ids
+        filter_ids = user_accessible_filter_ids
+
+    # Ensure user has access to specified groups/filters
+    if not (
+        all([gid in user_accessible_group_ids for gid in group_ids])
+        and all([fid in user_accessible_filter_ids for fid in filter_ids])
+    ):
+        raise ValueError(
+            "Insufficient permissions - you must only specify "
+            "groups/filters that you have access to."
+        )
+    return group_ids, filter_ids
+
+
+def candidate_query(
+    filter_ids,
+    group_ids,
+    unsaved_only=False,
+    start_date=None,
+    end_date=None,
+    options=(),
+):
+    """Query for the candidates (Objs) that passed any of `filter_ids`, most
+    recently detected first.
+
+    If `unsaved_only`, candidates already saved as sources to any of
+    `group_ids` are excluded. `start_date` and `end_date` are
+    Arrow-parseable date strings bounding `Obj.last_detected`.
+    """
+    q = (
+        Obj.query.options(list(options))
+        .filter(
+            Obj.id.in_(
+                DBSession()
+                .query(Candidate.obj_id)
+                .filter(Candidate.filter_id.in_(filter_ids))
+            )
+        )
+        .order_by(Obj.last_detected.desc().nullslast(), Obj.id)
+    )
+    if unsaved_only:
+        q = q.filter(
+            Obj.id.notin_(
+                DBSession().query(Source.obj_id).filter(Source.group_id.in_(group_ids))
+            )
+        )
+    if start_date is not None and start_date.strip() not in [
+        "",
+        "null",
+        "undefined",
+    ]:
+        start_date = arrow.get(start_date).datetime
+        q = q.filter(Obj.last_detected >= start_date)
+    if end_date is not None and end_date.strip() not in ["", "null", "undefined"]:
+        end_date = arrow.get(end_date).datetime
+        q = q.filter(Obj.last_detected <= end_date)
+    return q
@@ -12,6 +12,7 @@ from ...models import (
     ObservingRun,
     Obj,
     Group,
+    load_rise_set_times,
 )
 
 from sqlalchemy.orm import joinedload
@@ -85,9 +86,13 @@ class AssignmentHandler(BaseHandler):
         out_json = ClassicalAssignment.__schema__().dump(assignments, many=True)
 
         # calculate when the targets rise and set
+        load_rise_set_times(assignments)
         for json_obj, assignment in zip(out_json, assignments):
-            json_obj['rise_time_utc'] = assignment.rise_time.isot
-            json_obj['set_time_utc'] = assignment.set_time.isot
+            rise_time, set_time = assignment.rise_set_times
+            json_obj['rise_time_utc'] = (
+                rise_time.isot if rise_time is not None else None
+            )
+            json_obj['set_time_utc'] = set_time.isot if set_time is not None else None
             json_obj['obj'] = assignment.obj
             json_obj['requester'] = assignment.requester
 
@@ -2,10 +2,14 @@ from .plot import (
     PlotPhotometryHandler,
     PlotSpectroscopyHandler,
     PlotAirmassHandler,
+    PlotModelsHandler,
+    PlotRunAirmassHandler,
 )
 from .token import TokenHandler
 from .dbinfo import DBInfoHandler
 from .profile import ProfileHandler
 from .source_views import SourceViewsHandler
+from .autocomplete import SourceIDAutocompleteHandler
+from .scanning import ScanningBundleHandler
 from .instrument_observation_params import InstrumentObservationParamsHandler
 from .log import LogHandler
@@ -0,0 +1,83 @@
+import sqlalchemy as sa
+from baselayer.app.access import auth_or_token
+from ...base import BaseHandler
+from ....models import DBSession, Obj, Source
+
+
+MAX_AUTOCOMPLETE_RESULTS = 25
+
+
+class SourceIDAutocompleteHandler(BaseHandler):
+    @auth_or_token
+    def get(self):
+        """
+        ---
+        description: |
+          Retrieve IDs of accessible sources matching a partial ID. Prefix
+          matches are listed first, followed by other substring matches.
+        parameters:
+          - in: query
+            name: q
+            required: true
+            schema:
+              type: string
+            description: Portion of ID to match
+          - in: query
+            name: limit
+            nullable: true
+            schema:
+              type: integer
+            description: Maximum number of IDs to return. Defaults to 10, max 25.
+        responses:
+          200:
+            content:
+              application/json:
+                schema:
+                  allOf:
+                    - $ref: '#/components/schemas/Success'
+                    - type: object
+                      properties:
+                        data:
+                          type: array
+                          items:
+                            type: string
+          400:
+            content:
+              application/json:
+                schema: Error
+        """
+        partial_id = self.get_query_argument('q', '').strip()
+        try:
+            limit = min(
+                int(self.get_query_argument('limit', 10)), MAX_AUTOCOMPLETE_RESULTS
+            )
+        except ValueError:
+            return self.error('Invalid value for limit.')
+        if not partial_id:
+            return self.success(data=[])
+
+        # Both the prefix and substring matches are served by the
+        # `ix_objs_id_trgm` trigram index
+        q = (
+            DBSession()
+            .query(Obj.id)
+            .filter(Obj.id.contains(partial_id, autoescape=True))
+            .filter(
+                Obj.id.in_(
+                    DBSession()
+                    .query(Source.obj_id)
+                    .filter(
+                        Source.group_id.in_(
+                            [g.id for g in self.current_user.accessible_groups]
+                        )
+                    )
+                )
+            )
+            .order_by(
+                sa.not_(Obj.id.startswith(partial_id, autoescape=True)),
+                sa.func.length(Obj.id),
+                Obj.id,
+            )
+            .limit(limit)
+        )
+        return self.success(data=[obj_id for obj_id, in q.all()])
@@ -1,53 +1,198 @@
+import hashlib
+
 from baselayer.app.access import auth_or_token
+from baselayer.app.env import load_env
 from ...base import BaseHandler
 from .... import plot
-from ....models import ClassicalAssignment, Source
+from ....models import (
+    DBSession,
+    ClassicalAssignment,
+    Instrument,
+    ObservingRun,
+    Source,
+    Photometry,
+    GroupPhotometry,
+)
+from ....utils.cache import LRUCache
+from ....utils.executors import BoundedExecutor, ExecutorSaturated
+from ....utils.visibility import altitudes, pickering_airmass
 
 import numpy as np
 from astropy import time as ap_time
 import pandas as pd
+import sqlalchemy as sa
+from sqlalchemy.orm import joinedload
+
+
+env, cfg = load_env()
+
+# Serialized photometry plots, keyed by object, the set of groups whose
+# photometry the viewer can see, plot dimensions, and a fingerprint of
+# that photometry (so that entries are never served once it changes)
+photometry_plot_cache = LRUCache(maxsize=cfg['plots.photometry_cache_size'])
+
+# Airmass curves of all the assignments of observing runs, keyed by run,
+# resolution, night and targets
+run_airmass_cache = LRUCache(maxsize=cfg['plots.airmass_cache_size'])
+
+# Plots are built in worker threads so as not to block the IOLoop
+plot_executor = BoundedExecutor(
+    max_workers=cfg['plots.max_workers'],
+    max_queued=cfg['plots.max_queued'],
+    name='plot',
+    teardown=DBSession.remove,
+)
+
+
+def photometry_fingerprint(obj_id, group_ids):
+    """Number of points, most recent modification and most recent sharing of
+    the photometry of `obj_id` visible to `group_ids`."""
+    return tuple(
+        DBSession()
+        .execute(
+            sa.select(
+                [
+                    sa.func.count(sa.distinct(Photometry.id)),
+                    sa.func.max(Photometry.modified),
+                    sa.func.count(),
+                    sa.func.max(GroupPhotometry.created_at),
+                ]
+            )
+            .select_from(
+                Photometry.__table__.join(
+                    GroupPhotometry.__table__,
+                    GroupPhotometry.photometr_id == Photometry.id,
+                )
+            )
+            .where(Photometry.obj_id == obj_id)
+            .where(GroupPhotometry.group_id.in_(group_ids))
+        )
+        .first()
+    )
+
+
+def run_airmass_curves(run, n_points):
+    """Airmass curves, between sunset and sunrise, of the targets of all of
+    `run`'s assignments, evaluated together on a shared grid of `n_points`
+    times.
+
+    Returns
+    -------
+    dict
+        Lists of `{'time': ..., 'airmass': ...}` records, keyed by
+        assignment ID.
+    """
+    assignments = run.assignments
+    if len(assignments) == 0:
+        return {}
+    time = np.linspace(run.sunset.unix, run.sunrise.unix, n_points)
+    time = ap_time.Time(time, format='unix')
+    altitude = altitudes(
+        run.instrument.telescope.observer.location,
+        [a.obj.ra for a in assignments],
+        [a.obj.dec for a in assignments],
+        time,
+    )
+    airmass = pickering_airmass(altitude)
+    isot = time.isot
+    return {
+        a.id: [{'time': t, 'airmass': am} for t, am in zip(isot, curve.tolist())]
+        for a, curve in zip(assignments, airmass)
+    }
+
+
+def invalidate_photometry_plot_cache(obj_ids):
+    """Drop this process' cached photometry plots of `obj_ids`."""
+    obj_ids = set(obj_ids)
+    photometry_plot_cache.invalidate_where(lambda key: key[0] in obj_ids)
+
+
+class PlotHandler(BaseHandler):
+    async def build_plot(self, plot_function, *args, **kwargs):
+        """Run `plot_function` in `plot_executor`; returns None (after
+        responding with a 503) if the executor is saturated."""
+        try:
+            return await plot_executor.run(plot_function, *args, **kwargs)
+        except ExecutorSaturated:
+            self.set_header('Retry-After', '1')
+            self.error(
+                'Too many plots are being generated; try again shortly.', status=503
+            )
+            return None
+
+    def plot_response(self, result):
+        docs_json, render_items = result
+        if docs_json is None:
+            return self.success(data={'docs_json': None, 'url': self.request.path})
+        _, digest = plot.custom_models_bundle()
+        return self.success(
+            data={
+                'docs_json': docs_json,
+                'render_items': render_items,
+                'custom_model_url': f'/api/internal/plot/models/{digest}.js',
+                'url': self.request.uri,
+            }
+        )
+
+
+class PlotModelsHandler(BaseHandler):
+    def get(self, digest):
+        """Serve the JS implementations of the custom Bokeh models used by
+        plots. The URL contains the bundle's digest, so the response never
+        changes and may be cached indefinitely by browsers."""
+        js, current_digest = plot.custom_models_bundle()
+        if digest != current_digest:
+            return self.error('Unknown plot models bundle.', status=404)
+        self.set_header('Content-Type', 'application/javascript; charset=utf-8')
+        self.set_header('Cache-Control', 'public, max-age=31536000, immutable')
+        self.set_header('ETag', f'"{current_digest}"')
+        self.write(js)
 
 
 # TODO this should distinguish between "no data to plot" and "plot failed"
-class PlotPhotometryHandler(BaseHandler):
+class PlotPhotometryHandler(PlotHandler):
     @auth_or_token
-    def get(self, obj_id):
-        height = self.get_query_argument("plotHeight", 300)
-        width = self.get_query_argument("plotWidth", 600)
-        docs_json, render_items, custom_model_js = plot.photometry_plot(
-            obj_id, self.current_user, height=int(height), width=int(width),
+    async def get(self, obj_id):
+        height = int(self.get_query_argument("plotHeight", 300))
+        width = int(self.get_query_argument("plotWidth", 600))
+        group_ids = sorted(g.id for g in self.current_user.accessible_groups)
+        key = (
+            obj_id,
+            hashlib.sha1(str(group_ids).encode()).hexdigest(),
+            width,
+            height,
+            photometry_fingerprint(obj_id, group_ids),
         )
-        if docs_json is None:
-            self.success(data={'docs_json': None, 'url': self.request.path})
-        else:
-            self.success(
-                data={
-                    'docs_json': docs_json,
-                    'render_items': render_items,
-                    'custom_model_js': custom_model_js,
-                    'url': self.request.uri,
-                }
+        result = photometry_plot_cache.get(key)
+        if result is None:
+            result = await self.build_plot(
+                plot.photometry_plot,
+                obj_id,
+                group_ids,
+                height=height,
+                width=width,
+                max_points=self.cfg['plots.photometry_max_points'],
             )
+            if result is None:
+                return
+            photometry_plot_cache.set(key, result)
+        self.plot_response(result)
 
 
-class PlotSpectroscopyHandler(BaseHandler):
+class PlotSpectroscopyHandler(PlotHandler):
     @auth_or_token
-    def get(self, obj_id):
+    async def get(self, obj_id):
         spec_id = self.get_query_argument("spectrumID", None)
-        docs_json, render_items, custom_model_js = plot.spectroscopy_plot(
-            obj_id, spec_id
-        )
-        if docs_json is None:
-            self.success(data={'docs_json': None, 'url': self.request.path})
+        if self.get_query_argument("fullResolution", "false") == "true":
+            max_points = None
         else:
-            self.success(
-                data={
-                    'docs_json': docs_json,
-                    'render_items': render_items,
-                    'custom_model_js': custom_model_js,
-                    'url': self.request.uri,
-                }
-            )
+            max_points = self.cfg['plots.spectrum_max_points']
+        result = await self.build_plot(
+            plot.spectroscopy_plot, obj_id, spec_id, max_points=max_points
+        )
+        if result is None:
+            return
+        self.plot_response(result)
 
 
 class PlotAirmassHandler(BaseHandler):
@@ -63,6 +208,10 @@ class PlotAirmassHandler(BaseHandler):
 
         sunset = assignment.run.sunset
         sunrise = assignment.run.sunrise
+        if sunset is None or sunrise is None:
+            return self.error(
+                'The Sun does not both set and rise on the night of the run.'
+            )
 
         time = np.linspace(sunset.unix, sunrise.unix, 50)
         time = ap_time.Time(time, format='unix')
@@ -72,3 +221,54 @@ class PlotAirmassHandler(BaseHandler):
         df = pd.DataFrame({'time': time, 'airmass': airmass})
         json = df.to_dict(orient='records')
         return self.success(data=json)
+
+
+class PlotRunAirmassHandler(BaseHandler):
+    @auth_or_token
+    def get(self, run_id):
+        resolution = self.get_query_argument(
+            "resolution", self.cfg['plots.airmass_resolution']
+        )
+        try:
+            resolution = int(resolution)
+        except ValueError:
+            return self.error('Invalid resolution: must be an integer.')
+        if not 2 <= resolution <= 1000:
+            return self.error('Invalid resolution: must be between 2 and 1000.')
+
+        run = (
+            ObservingRun.query.options(
+                joinedload(ObservingRun.assignments).joinedload(
+                    ClassicalAssignment.obj
+                ),
+                joinedload(ObservingRun.instrument).joinedload(Instrument.telescope),
+            )
+            .filter(ObservingRun.id == run_id)
+            .first()
+        )
+        if run is None:
+            return self.error('Invalid observing run id.')
+        if run.sunset is None or run.sunrise is None:
+            return self.error(
+                'The Sun does not both set and rise on the night of the run.'
+            )
+
+        key = (
+            run.id,
+            resolution,
+            run.instrument.telescope_id,
+            run.calendar_date,
+            tuple(sorted((a.id, a.obj.ra, a.obj.dec) for a in run.assignments)),
+        )
+        curves = run_airmass_cache.get(key)
+        if curves is None:
+            curves = run_airmass_curves(run, resolution)
+            run_airmass_cache.set(key, curves)
+
+        return self.success(
+            data={
+                a.id: curves[a.id]
+                for a in run.assignments
+                if a.obj.is_owned_by(self.current_user)
+            }
+        )
@@ -0,0 +1,414 @@
+from collections import defaultdict
+from functools import lru_cache, partial
+
+import numpy as np
+import sncosmo
+from sqlalchemy.orm import joinedload, defer
+from tornado.ioloop import IOLoop
+
+from baselayer.app.access import auth_or_token
+from baselayer.app.env import load_env
+from baselayer.log import make_log
+from ...base import BaseHandler
+from ....models import (
+    DBSession,
+    Candidate,
+    Comment,
+    Filter,
+    Group,
+    Instrument,
+    Obj,
+    Photometry,
+    Source,
+    PHOT_ZP,
+    PHOT_SYS,
+)
+from ....utils.cache import LRUCache
+from ..candidate import (
+    candidate_query,
+    grab_query_results_page,
+    get_user_accessible_filter_ids,
+    resolve_candidate_group_and_filter_ids,
+)
+
+
+env, cfg = load_env()
+log = make_log('scanning')
+
+# Bundles for the page after each one requested are built in the
+# background and stored here until the scanner asks for them
+bundle_cache = LRUCache(
+    maxsize=cfg['scanning.bundle_cache_size'], ttl=cfg['scanning.bundle_cache_ttl']
+)
+
+
+@lru_cache(maxsize=None)
+def limiting_mag_correction(filter, magsys):
+    """Offset between limiting magnitudes in `magsys` and in the database
+    magnitude system, for the given bandpass."""
+    db_system = sncosmo.get_magsystem(PHOT_SYS)
+    other_system = sncosmo.get_magsystem(magsys)
+    return 2.5 * np.log10(db_system.zpbandflux(filter)) - 2.5 * np.log10(
+        other_system.zpbandflux(filter)
+    )
+
+
+def light_curves(obj_ids, accessible_group_ids):
+    """Columnar light curves (in the database magnitude system) for each of
+    `obj_ids`, from a single query for all objects' photometry."""
+    rows = (
+        DBSession()
+        .query(
+            Photometry.obj_id,
+            Photometry.mjd,
+            Photometry.mag,
+            Photometry.e_mag,
+            Photometry.fluxerr,
+            Photometry.filter,
+            Photometry.original_user_data['limiting_mag'].astext,
+            Photometry.original_user_data['magsys'].astext,
+            Instrument.name,
+        )
+        .join(Instrument, Instrument.id == Photometry.instrument_id)
+        .filter(Photometry.obj_id.in_(obj_ids))
+        .filter(Photometry.groups.any(Group.id.in_(accessible_group_ids)))
+        .order_by(Photometry.obj_id, Photometry.mjd)
+        .all()
+    )
+    curves = defaultdict(lambda: defaultdict(list))
+    for (obj_id, mjd, mag, magerr, fluxerr, filt, lim, magsys, instrument) in rows:
+        if lim is not None:
+            lim = float(lim) + limiting_mag_correction(filt, magsys or PHOT_SYS)
+        else:
+            lim = -2.5 * np.log10(5 * fluxerr) + PHOT_ZP
+        curve = curves[obj_id]
+        curve['mjd'].append(mjd)
+        curve['mag'].append(mag)
+        curve['magerr'].append(magerr)
+        curve['limiting_mag'].append(lim)
+        curve['filter'].append(filt)
+        curve['instrument_name'].append(instrument)
+    return {obj_id: dict(curve, magsys=PHOT_SYS) for obj_id, curve in curves.items()}
+
+
+def light_curve_summary(curve):
+    """Number of points/detections, first and last detection, and peak and
+    most recent detected magnitude of a light curve from `light_curves`."""
+    mjd = np.asarray(curve.get('mjd', []), dtype=float)
+    mag = np.asarray(curve.get('mag', []), dtype=float)
+    magerr = np.asarray(curve.get('magerr', []), dtype=float)
+    filters = np.asarray(curve.get('filter', []))
+    # S/N > 5 <=> magerr < 2.5 / ln(10) / 5, as for `Obj.last_detected`
+    detected = np.isfinite(mag) & (magerr < 2.5 / np.log(10) / 5)
+    summary = {
+        'n_points': int(len(mjd)),
+        'n_detections': int(detected.sum()),
+        'first_detected_mjd': None,
+        'last_detected_mjd': None,
+        'peak_mag': None,
+        'peak_mag_filter': None,
+        'last_mag': None,
+        'last_mag_filter': None,
+    }
+    if detected.any():
+        det = np.flatnonzero(detected)
+        peak = det[np.argmin(mag[det])]
+        summary.update(
+            {
+                'first_detected_mjd': float(mjd[det[0]]),
+                'last_detected_mjd': float(mjd[det[-1]]),
+                'peak_mag': float(mag[peak]),
+                'peak_mag_filter': str(filters[peak]),
+                'last_mag': float(mag[det[-1]]),
+                'last_mag_filter': str(filters[det[-1]]),
+            }
+        )
+    return summary
+
+
+def build_scanning_bundle(
+    page,
+    n_per_page,
+    accessible_group_ids,
+    accessible_filter_ids,
+    filter_ids,
+    group_ids,
+    unsaved_only=False,
+    start_date=None,
+    end_date=None,
+    total_matches=None,
+):
+    """Fetch a page of candidates, along with their thumbnails, comments,
+    light curves and light-curve summaries, using one query per kind of
+    data for the whole page.
+
+    Takes the requesting user's accessible group and filter IDs rather than
+    the user, so that it can also be run outside of the request.
+    """
+    q = candidate_query(
+        filter_ids,
+        group_ids,
+        unsaved_only=unsaved_only,
+        start_date=start_date,
+        end_date=end_date,
+        options=[joinedload(Obj.thumbnails)],
+    ).add_columns(Obj.last_detected)
+    bundle = grab_query_results_page(q, total_matches, page, n_per_page, "candidates")
+    obj_ids = [obj.id for obj, _ in bundle["candidates"]]
+
+    source_ids = {
+        obj_id
+        for obj_id, in DBSession()
+        .query(Source.obj_id)
+        .filter(Source.obj_id.in_(obj_ids))
+        .distinct()
+    }
+    passing_group_ids = defaultdict(set)
+    for obj_id, group_id in (
+        DBSession()
+        .query(Candidate.obj_id, Filter.group_id)
+        .join(Filter, Filter.id == Candidate.filter_id)
+        .filter(Candidate.obj_id.in_(obj_ids))
+        .filter(Filter.id.in_(accessible_filter_ids))
+    ):
+        passing_group_ids[obj_id].add(group_id)
+    comments = defaultdict(list)
+    for comment in (
+        Comment.query.options(defer(Comment.attachment_bytes))
+        .filter(Comment.obj_id.in_(obj_ids))
+        .filter(Comment.groups.any(Group.id.in_(accessible_group_ids)))
+        .order_by(Comment.created_at.desc())
+    ):
+        comments[comment.obj_id].append(comment.to_dict())
+    curves = light_curves(obj_ids, accessible_group_ids)
+
+    candidate_list = []
+    for obj, last_detected in bundle["candidates"]:
+        curve = curves.get(obj.id, {})
+        summary = light_curve_summary(curve)
+        candidate_info = obj.to_dict()
+        candidate_info.update(
+            {
+                "thumbnails": [t.to_dict() for t in obj.thumbnails],
+                "comments": comments[obj.id],
+                "is_source": obj.id in source_ids,
+                "passing_group_ids": sorted(passing_group_ids[obj.id]),
+                "last_detected": last_detected,
+                "gal_lat": obj.gal_lat_deg,
+                "gal_lon": obj.gal_lon_deg,
+                "photometry_summary": summary,
+                "photometry": curve,
+            }
+        )
+        candidate_list.append(candidate_info)
+    bundle["candidates"] = candidate_list
+    return bundle
+
+
+def prefetch_scanning_bundle(key, **kwargs):
+    """Build a scanning bundle into `bundle_cache` (run in a worker thread)."""
+    try:
+        bundle_cache.set(key, build_scanning_bundle(**kwargs))
+    except Exception as e:
+        log(f"Failed to prefetch scanning bundle {key}: {e}")
+    finally:
+        DBSession.remove()
+
+
+class ScanningBundleHandler(BaseHandler):
+    @auth_or_token
+    def get(self):
+        """
+        ---
+        description: |
+          Retrieve a page of candidates together with everything the scanning
+          page displays for them (thumbnails, comments and light curves). The
+          following page is prefetched in the background.
+        parameters:
+        - in: query
+          name: numPerPage
+          nullable: true
+          schema:
+            type: integer
+          description: |
+            Number of candidates to return per paginated request. Defaults to 25
+        - in: query
+          name: pageNumber
+          nullable: true
+          schema:
+            type: integer
+          description: Page number for paginated query results. Defaults to 1
+        - in: query
+          name: totalMatches
+          nullable: true
+          schema:
+            type: integer
+          description: |
+            Used only in the case of paginating query results - if provided, this
+            allows for avoiding a potentially expensive query.count() call.
+        - in: query
+          name: unsavedOnly
+          nullable: true
+          schema:
+            type: boolean
+          description: Boolean indicating whether to return only unsaved candidates
+        - in: query
+          name: startDate
+          nullable: true
+          schema:
+            type: string
+          description: |
+            Arrow-parseable date string (e.g. 2020-01-01). If provided, filter by
+            last_detected >= startDate
+        - in: query
+          name: endDate
+          nullable: true
+          schema:
+            type: string
+          description: |
+            Arrow-parseable date string (e.g. 2020-01-01). If provided, filter by
+            last_detected <= endDate
+        - in: query
+          name: groupIDs
+          nullable: true
+          schema:
+            type: array
+            items:
+              type: integer
+          explode: false
+          style: simple
+          description: |
+            Comma-separated string of group IDs (e.g. "1,2"). Defaults to all of user's
+            groups if filterIDs is not provided.
+        - in: query
+          name: filterIDs
+          nullable: true
+          schema:
+            type: array
+            items:
+              type: integer
+          explode: false
+          style: simple
+          description: |
+            Comma-separated string of filter IDs (e.g. "1,2"). Defaults to all of user's
+            groups' filters if groupIDs is not provided.
+        responses:
+          200:
+            content:
+              application/json:
+                schema:
+                  allOf:
+                    - $ref: '#/components/schemas/Success'
+                    - type: object
+                      properties:
+                        data:
+                          type: object
+                          properties:
+                            candidates:
+                              type: array
+                              items:
+                                allOf:
+                                  - $ref: '#/components/schemas/Obj'
+                                  - type: object
+                                    properties:
+                                      is_source:
+                                        type: boolean
+                                      photometry_summary:
+                                        type: object
+                                        description: |
+                                          Number of points and detections, first and
+                                          last detection MJD, and peak and most recent
+                                          detected magnitude (with filter)
+                                      photometry:
+                                        type: object
+                                        description: |
+                                          Light curve as arrays of mjd, mag, magerr,
+                                          limiting_mag, filter and instrument_name
+                            totalMatches:
+                              type: integer
+                            pageNumber:
+                              type: integer
+                            lastPage:
+                              type: boolean
+                            numberingStart:
+                              type: integer
+                            numberingEnd:
+                              type: integer
+          400:
+            content:
+              application/json:
+                schema: Error
+        """
+        try:
+            page = int(self.get_query_argument("pageNumber", None) or 1)
+            n_per_page = int(self.get_query_argument("numPerPage", None) or 25)
+        except ValueError:
+            return self.error("Invalid page number value.")
+        total_matches = self.get_query_argument("totalMatches", None)
+        try:
+            group_ids, filter_ids = resolve_candidate_group_and_filter_ids(
+                self.current_user,
+                self.get_query_argument("groupIDs", None),
+                self.get_query_argument("filterIDs", None),
+            )
+        except ValueError as e:
+            return self.error(str(e))
+
+        params = {
+            "n_per_page": n_per_page,
+            "accessible_group_ids": [g.id for g in self.current_user.accessible_groups],
+            "accessible_filter_ids": get_user_accessible_filter_ids(self.current_user),
+            "filter_ids": filter_ids,
+            "group_ids": group_ids,
+            "unsaved_only": self.get_query_argument("unsavedOnly", False) == "true",
+            "start_date": self.get_query_argument("startDate", None),
+            "end_date": self.get_query_argument("endDate", None),
+        }
+
+        # Prefetched bundles are only served once, so that e.g. a candidate
+        # saved since the prefetch is shown as saved when the page is reloaded
+        key = self.bundle_cache_key(page, params)
+        bundle = bundle_cache.get(key)
+        if bundle is not None:
+            bundle_cache.invalidate(key)
+        else:
+            try:
+                bundle = build_scanning_bundle(
+                    page, total_matches=total_matches, **params
+                )
+            except ValueError as e:
+                if "Page number out of range" in str(e):
+                    return self.error("Page number out of range.")
+                raise
+
+        next_key = self.bundle_cache_key(page + 1, params)
+        if (
+            self.cfg['scanning.prefetch_next_page']
+            and not bundle["lastPage"]
+            and next_key not in bundle_cache
+        ):
+            IOLoop.current().run_in_executor(
+                None,
+                partial(
+                    prefetch_scanning_bundle,
+                    next_key,
+                    page=page + 1,
+                    total_matches=bundle["totalMatches"],
+                    **params,
+                ),
+            )
+
+        return self.success(data=bundle)
+
+    def bundle_cache_key(self, page, params):
+        return (
+            type(self.current_user).__name__,
+            self.current_user.id,
+            page,
+            params["n_per_page"],
+            tuple(sorted(params["filter_ids"])),
+            tuple(sorted(params["group_ids"])),
+            params["unsaved_only"],
+            params["start_date"],
+            params["end_date"],
+        )
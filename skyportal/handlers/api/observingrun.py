@@ -1,9 +1,25 @@
+import asyncio
+import datetime
+import json
+
+from dateutil.parser import isoparse
 from sqlalchemy.orm import joinedload
 from marshmallow.exceptions import ValidationError
 from baselayer.app.access import permissions, auth_or_token
 from ..base import BaseHandler
-from ...models import DBSession, ObservingRun, ClassicalAssignment, Obj, Thumbnail
+from ...models import (
+    DBSession,
+    ObservingRun,
+    ClassicalAssignment,
+    Obj,
+    Thumbnail,
+    load_ephemerides,
+    load_rise_set_times,
+)
 from ...schema import ObservingRunPost, ObservingRunGet, ObservingRunGetWithAssignments
+from ...utils import get_nearby_offset_stars, facility_parameters
+from ...utils.executors import ExecutorSaturated
+from .source import offsets_executor, offsets_gaia_catalog
 
 
 class ObservingRunHandler(BaseHandler):
@@ -51,6 +67,9 @@ class ObservingRunHandler(BaseHandler):
         DBSession().add(run)
         DBSession().commit()
 
+        # Compute and store the run's ephemeris now rather than on first view
+        load_ephemerides([run])
+
         return self.success(data={"id": run.id})
 
     @auth_or_token
@@ -110,6 +129,8 @@ class ObservingRunHandler(BaseHandler):
                 return self.error(
                     f"Could not load observing run {run_id}", data={"run_id": run_id}
                 )
+            load_ephemerides([run])
+
             # order the assignments by ra
             run.assignments = sorted(run.assignments, key=lambda a: a.obj.ra)
 
@@ -129,15 +150,28 @@ class ObservingRunHandler(BaseHandler):
                 data["assignments"] = [a.to_dict() for a in data["assignments"]]
 
                 # calculate when the targets rise and set
+                load_rise_set_times(run.assignments)
                 for d, a in zip(data["assignments"], run.assignments):
-                    d["rise_time_utc"] = a.rise_time.isot
-                    d["set_time_utc"] = a.set_time.isot
+                    rise_time, set_time = a.rise_set_times
+                    d["rise_time_utc"] = (
+                        rise_time.isot if rise_time is not None else None
+                    )
+                    d["set_time_utc"] = set_time.isot if set_time is not None else None
 
                 return self.success(data=data)
 
-        runs = ObservingRun.query.all()
+        runs = ObservingRun.query.options(joinedload(ObservingRun.instrument)).all()
+        load_ephemerides(runs)
         data = ObservingRunGet.dump(runs, many=True)
-        out = sorted(data, key=lambda d: d["ephemeris"]["sunrise_utc"])
+        # Runs without a sunrise (e.g. under the midnight sun) come last
+        out = sorted(
+            data,
+            key=lambda d: (
+                d["ephemeris"]["sunrise_utc"] is None,
+                d["ephemeris"]["sunrise_utc"] or "",
+                d["calendar_date"],
+            ),
+        )
         return self.success(data=out)
 
     @permissions(["Upload data"])
@@ -225,3 +259,242 @@ class ObservingRunHandler(BaseHandler):
         DBSession().commit()
 
         return self.success()
+
+
+class ObservingRunStarlistHandler(BaseHandler):
+    async def search_offset_stars(self, targets, facility, how_many, obstime):
+        """Search for offset stars for each of `targets` in
+        `offsets_executor`, yielding per-target results as they complete.
+
+        At most `offsets_executor.max_workers` searches for this request are
+        submitted at a time. If the executor is saturated before any search
+        could be submitted, `ExecutorSaturated` is raised; if it becomes
+        saturated later, the targets not yet searched are yielded with an
+        error.
+        """
+        params = facility_parameters[facility]
+        queue = list(targets)
+        pending = {}
+        searched = False
+        while queue or pending:
+            while queue and len(pending) < offsets_executor.max_workers:
+                target = queue[0]
+                try:
+                    future = offsets_executor.submit(
+                        get_nearby_offset_stars,
+                        target['ra'],
+                        target['dec'],
+                        target['obj_id'],
+                        how_many=how_many,
+                        radius_degrees=params['radius_degrees'],
+                        mag_limit=params['mag_limit'],
+                        min_sep_arcsec=params['min_sep_arcsec'],
+                        starlist_type=facility,
+                        mag_min=params['mag_min'],
+                        obstime=obstime,
+                        allowed_queries=2,
+                        catalog=offsets_gaia_catalog,
+                    )
+                except ExecutorSaturated:
+                    if pending:
+                        # Wait for one of this request's searches to finish
+                        break
+                    if not searched:
+                        raise
+                    for target in queue:
+                        yield {**target, 'error': 'Too many offset-star searches'}
+                    return
+                pending[asyncio.wrap_future(future)] = queue.pop(0)
+                searched = True
+
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                target = pending.pop(future)
+                try:
+                    starlist_info, query, queries_issued, noffsets = future.result()
+                except Exception as e:
+                    yield {**target, 'error': str(e)}
+                    continue
+                yield {
+                    **target,
+                    'starlist_info': starlist_info,
+                    'noffsets': noffsets,
+                    'queries_issued': queries_issued,
+                    'query': query,
+                }
+
+    @auth_or_token
+    async def get(self, run_id):
+        """
+        ---
+        description: |
+          Generate a starlist, with offset stars, for all the targets of an
+          observing run
+        parameters:
+          - in: path
+            name: run_id
+            required: true
+            schema:
+              type: integer
+          - in: query
+            name: facility
+            nullable: true
+            schema:
+              type: string
+              enum: [Keck, Shane, P200]
+            description: What type of starlist should be used? Defaults to Keck.
+          - in: query
+            name: how_many
+            nullable: true
+            schema:
+              type: integer
+            description: |
+              Requested number of offset stars per target (fewer may be
+              returned). Defaults to 3.
+          - in: query
+            name: obstime
+            nullable: true
+            schema:
+              type: string
+            description: |
+              datetime of observation in isoformat (e.g. 2020-12-30T12:34:10).
+              Defaults to the middle of the run's night.
+          - in: query
+            name: stream
+            nullable: true
+            schema:
+              type: boolean
+            description: |
+              Stream the results as newline-delimited JSON
+              (application/x-ndjson): one `{"target": ...}` line per target,
+              in the order in which their offset stars are found, followed by
+              a last line with the combined starlist (without the targets).
+              Defaults to false.
+        responses:
+          200:
+            content:
+              application/json:
+                schema:
+                  allOf:
+                    - $ref: '#/components/schemas/Success'
+                    - type: object
+                      properties:
+                        data:
+                          type: object
+                          properties:
+                            facility:
+                              type: string
+                              enum: [Keck, Shane, P200]
+                              description: Facility the starlist is for
+                            obstime:
+                              type: string
+                              description: Time for which offsets were computed
+                            starlist_str:
+                              type: string
+                              description: |
+                                The starlists of all the targets (ordered by
+                                RA), with `&nbsp;` for spaces
+                            targets:
+                              type: array
+                              description: |
+                                Per-target results, ordered by RA, with the
+                                same fields as /api/sources/{obj_id}/offsets
+                                (or an `error`)
+                              items:
+                                type: object
+          400:
+            content:
+              application/json:
+                schema: Error
+          503:
+            content:
+              application/json:
+                schema: Error
+        """
+        run = (
+            DBSession()
+            .query(ObservingRun)
+            .options(
+                joinedload(ObservingRun.assignments).joinedload(
+                    ClassicalAssignment.obj
+                ),
+                joinedload(ObservingRun.instrument),
+            )
+            .filter(ObservingRun.id == run_id)
+            .first()
+        )
+        if run is None:
+            return self.error(
+                f"Could not load observing run {run_id}", data={"run_id": run_id}
+            )
+
+        facility = self.get_query_argument('facility', 'Keck')
+        if facility not in facility_parameters:
+            return self.error('Invalid facility')
+
+        try:
+            how_many = int(self.get_query_argument('how_many', '3'))
+        except ValueError:
+            return self.error('Invalid argument for `how_many`')
+
+        obstime = self.get_query_argument('obstime', None)
+        if obstime is None:
+            load_ephemerides([run])
+            if run.sunset is not None and run.sunrise is not None:
+                obstime = (run.sunset + (run.sunrise - run.sunset) / 2).isot
+            else:
+                obstime = datetime.datetime.utcnow().isoformat()
+        else:
+            try:
+                isoparse(obstime)
+            except ValueError:
+                return self.error('obstime is not valid isoformat')
+
+        stream = self.get_query_argument('stream', 'false') == 'true'
+
+        assignments = sorted(
+            (a for a in run.assignments if a.obj.is_owned_by(self.current_user)),
+            key=lambda a: a.obj.ra,
+        )
+        targets = [
+            {
+                'assignment_id': a.id,
+                'obj_id': a.obj.id,
+                'ra': a.obj.ra,
+                'dec': a.obj.dec,
+            }
+            for a in assignments
+        ]
+
+        results = {}
+        search = self.search_offset_stars(targets, facility, how_many, obstime)
+        try:
+            async for result in search:
+                if stream and len(results) == 0:
+                    self.set_header('Content-Type', 'application/x-ndjson')
+                results[result['assignment_id']] = result
+                if stream:
+                    self.write(json.dumps({'target': result}) + '\n')
+                    await self.flush()
+        except ExecutorSaturated:
+            self.set_header('Retry-After', '1')
+            return self.error(
+                'Too many offset-star searches are running; try again shortly.',
+                status=503,
+            )
+
+        targets = [results[target['assignment_id']] for target in targets]
+        starlist_str = "\n".join(
+            info["str"].replace(" ", "&nbsp;")
+            for target in targets
+            for info in target.get('starlist_info', [])
+        )
+        data = {
+            'facility': facility,
+            'obstime': obstime,
+            'starlist_str': starlist_str,
+        }
+        if stream:
+            self.set_header('Content-Type', 'application/x-ndjson')
+            return self.write(json.dumps({'status': 'success', 'data': data}) + '\n')
+        return self.success(data={**data, 'targets': targets})
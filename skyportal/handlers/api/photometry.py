@@ -15,9 +15,13 @@ from ...models import (
     Obj,
     PHOT_ZP,
     GroupPhotometry,
+    Thumbnail,
 )
 
 
+from .internal.plot import invalidate_photometry_plot_cache
+from .thumbnail import release_thumbnail_files
+from ...utils import stack_photometry
 from ...schema import PhotometryMag, PhotometryFlux, PhotFluxFlexible, PhotMagFlexible
 from ...enum_types import ALLOWED_MAGSYSTEMS
 
@@ -110,6 +114,70 @@ def serialize(phot, outsys, format):
     return retval
 
 
+def serialize_stacked(photometry, binsize, outsys, format):
+    """Stack `photometry` in bins of `binsize` days, separately for each
+    instrument and filter (see `skyportal.utils.stack_photometry`), and
+    serialize the stacked points like `serialize`."""
+    if format not in ['mag', 'flux']:
+        raise ValueError(
+            'Invalid output format specified. Must be one of '
+            f"['flux', 'mag'], got '{format}'."
+        )
+    groups = sorted({(phot.instrument_id, phot.filter) for phot in photometry})
+    group_index = {group: i for i, group in enumerate(groups)}
+    instrument_names = {phot.instrument_id: phot.instrument.name for phot in photometry}
+    stacked = stack_photometry(
+        [phot.mjd for phot in photometry],
+        [np.nan if phot.flux is None else phot.flux for phot in photometry],
+        [phot.fluxerr for phot in photometry],
+        [group_index[(phot.instrument_id, phot.filter)] for phot in photometry],
+        binsize,
+        PHOT_ZP,
+    )
+
+    magsys_db = sncosmo.get_magsystem('ab')
+    outsys = sncosmo.get_magsystem(outsys)
+    corrections = {
+        filter: 2.5 * np.log10(outsys.zpbandflux(filter))
+        - 2.5 * np.log10(magsys_db.zpbandflux(filter))
+        for filter in {filter for _, filter in groups}
+    }
+
+    retval = []
+    for i in range(len(stacked['mjd'])):
+        instrument_id, filter = groups[stacked['group'][i]]
+        point = {
+            'obj_id': photometry[0].obj_id,
+            'filter': filter,
+            'mjd': stacked['mjd'][i],
+            'instrument_id': instrument_id,
+            'instrument_name': instrument_names[instrument_id],
+            'n_points': int(stacked['n_points'][i]),
+            'stacked': True,
+            'magsys': outsys.name,
+        }
+        if format == 'mag':
+            point.update(
+                {
+                    'mag': stacked['mag'][i] + corrections[filter]
+                    if stacked['detected'][i]
+                    else None,
+                    'magerr': stacked['magerr'][i] if stacked['detected'][i] else None,
+                    'limiting_mag': stacked['lim_mag'][i] + corrections[filter],
+                }
+            )
+        else:
+            point.update(
+                {
+                    'flux': nan_to_none(stacked['flux'][i]),
+                    'fluxerr': stacked['fluxerr'][i],
+                    'zp': PHOT_ZP + corrections[filter],
+                }
+            )
+        retval.append(point)
+    return retval
+
+
 class PhotometryHandler(BaseHandler):
     @permissions(['Upload data'])
     def post(self):
@@ -407,6 +475,7 @@ class PhotometryHandler(BaseHandler):
 
         DBSession().execute(groupquery, params)
         DBSession().commit()
+        invalidate_photometry_plot_cache(df['obj_id'].unique())
 
         return self.success(data={"ids": ids, "upload_id": upload_id})
 
@@ -490,6 +559,7 @@ class PhotometryHandler(BaseHandler):
                 )
             photometry.groups = groups
         DBSession().commit()
+        invalidate_photometry_plot_cache([phot.obj_id])
         return self.success()
 
     @permissions(['Manage sources'])
@@ -513,11 +583,21 @@ class PhotometryHandler(BaseHandler):
               application/json:
                 schema: Error
         """
-        _ = Photometry.get_if_owned_by(photometry_id, self.current_user)
+        phot = Photometry.get_if_owned_by(photometry_id, self.current_user)
+        obj_id = phot.obj_id
+        # Thumbnails are deleted with their photometry
+        file_uris = [
+            file_uri
+            for file_uri, in DBSession()
+            .query(Thumbnail.file_uri)
+            .filter(Thumbnail.photometry_id == int(photometry_id))
+        ]
         DBSession().query(Photometry).filter(
             Photometry.id == int(photometry_id)
         ).delete()
         DBSession().commit()
+        invalidate_photometry_plot_cache([obj_id])
+        release_thumbnail_files(file_uris)
 
         return self.success()
 
@@ -528,9 +608,31 @@ class ObjPhotometryHandler(BaseHandler):
         obj = Obj.query.get(obj_id)
         if obj is None:
             return self.error('Invalid object id.')
-        photometry = Obj.get_photometry_owned_by_user(obj_id, self.current_user)
+        min_mjd = self.get_query_argument('minMJD', None)
+        max_mjd = self.get_query_argument('maxMJD', None)
+        try:
+            min_mjd = float(min_mjd) if min_mjd is not None else None
+            max_mjd = float(max_mjd) if max_mjd is not None else None
+        except ValueError:
+            return self.error('Invalid minMJD or maxMJD value.')
+        photometry = Obj.get_photometry_owned_by_user(
+            obj_id, self.current_user, min_mjd=min_mjd, max_mjd=max_mjd
+        )
         format = self.get_query_argument('format', 'mag')
         outsys = self.get_query_argument('magsys', 'ab')
+        binsize = self.get_query_argument('binsize', None)
+        if binsize is not None:
+            try:
+                binsize = float(binsize)
+            except ValueError:
+                return self.error('Invalid binsize value.')
+            if not binsize > 0:
+                return self.error('binsize must be positive.')
+            if not photometry:
+                return self.success(data=[])
+            return self.success(
+                data=serialize_stacked(photometry, binsize, outsys, format)
+            )
         return self.success(
             data=[serialize(phot, outsys, format) for phot in photometry]
         )
@@ -561,6 +663,20 @@ class BulkDeletePhotometryHandler(BaseHandler):
         # Permissions check:
         phot_id = Photometry.query.filter(Photometry.upload_id == upload_id).first().id
         _ = Photometry.get_if_owned_by(phot_id, self.current_user)
+        obj_ids = [
+            obj_id
+            for obj_id, in DBSession()
+            .query(Photometry.obj_id)
+            .filter(Photometry.upload_id == upload_id)
+            .distinct()
+        ]
+        file_uris = [
+            file_uri
+            for file_uri, in DBSession()
+            .query(Thumbnail.file_uri)
+            .join(Photometry)
+            .filter(Photometry.upload_id == upload_id)
+        ]
 
         n_deleted = (
             DBSession()
@@ -569,6 +685,8 @@ class BulkDeletePhotometryHandler(BaseHandler):
             .delete()
         )
         DBSession().commit()
+        invalidate_photometry_plot_cache(obj_ids)
+        release_thumbnail_files(file_uris)
 
         return self.success(f"Deleted {n_deleted} photometry points.")
 
@@ -647,6 +765,33 @@ ObjPhotometryHandler.get.__doc__ = f"""
             schema:
               type: string
               enum: {list(ALLOWED_MAGSYSTEMS)}
+          - in: query
+            name: minMJD
+            required: false
+            description: >-
+              If provided, return only photometry with mjd >= minMJD. Together
+              with maxMJD, this can be used to fetch the full-resolution data
+              for a time range of a downsampled photometry plot.
+            schema:
+              type: number
+          - in: query
+            name: maxMJD
+            required: false
+            description: If provided, return only photometry with mjd <= maxMJD.
+            schema:
+              type: number
+          - in: query
+            name: binsize
+            required: false
+            description: >-
+              If provided, return the photometry stacked in bins of this many
+              days, separately for each instrument and filter: the
+              inverse-variance weighted mean flux of the points in each bin,
+              or, for bins containing only upper limits, the combined limit.
+              Stacked points include the number of points combined
+              (`n_points`).
+            schema:
+              type: number
 
         responses:
           200:
@@ -1,6 +1,7 @@
 from baselayer.app.access import auth_or_token
 from ..base import BaseHandler
 from ...models import DBSession, Group, Photometry, Spectrum
+from .internal.plot import invalidate_photometry_plot_cache
 
 
 class SharingHandler(BaseHandler):
@@ -60,6 +61,7 @@ class SharingHandler(BaseHandler):
                 "target group you wish to share data with."
             )
         obj_id = None
+        phot_obj_ids = set()
         if phot_ids:
             query = Photometry.query.filter(Photometry.id.in_(phot_ids))
             for phot in query:
@@ -67,6 +69,7 @@ class SharingHandler(BaseHandler):
                 _ = Photometry.get_if_owned_by(phot.id, self.current_user)
                 for group in groups:
                     phot.groups.append(group)
+                phot_obj_ids.add(phot.obj_id)
                 # Grab obj_id for use in websocket message below
                 if obj_id is None:
                     obj_id = phot.obj_id
@@ -82,6 +85,7 @@ class SharingHandler(BaseHandler):
                     obj_id = spec.obj_id
         DBSession().commit()
         if phot_ids:
+            invalidate_photometry_plot_cache(phot_obj_ids)
             self.push(
                 action="skyportal/FETCH_SOURCE_PHOTOMETRY", payload={"obj_id": obj_id}
             )
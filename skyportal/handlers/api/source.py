@@ -1,12 +1,18 @@
+import asyncio
+import calendar
 import datetime
+import hashlib
+from concurrent.futures import BrokenExecutor
 
+import numpy as np
+from astropy.coordinates import SkyCoord
 from dateutil.parser import isoparse
 from sqlalchemy.orm import joinedload
-from sqlalchemy import func
 import arrow
 from marshmallow.exceptions import ValidationError
 import healpix_alchemy as ha
 from baselayer.app.access import permissions, auth_or_token
+from baselayer.app.env import load_env
 from ..base import BaseHandler
 from ...models import (
     DBSession,
@@ -20,6 +26,8 @@ from ...models import (
     FollowupRequest,
     ClassicalAssignment,
     ObservingRun,
+    CrossmatchPosition,
+    altdata_expression,
 )
 from .internal.source_views import register_source_view
 from ...utils import (
@@ -28,10 +36,85 @@ from ...utils import (
     source_image_parameters,
     get_finding_chart,
 )
-from .candidate import grab_query_results_page
+from ...utils.cache import DiskCache
+from ...utils.executors import BoundedExecutor, ExecutorSaturated
+from ...utils.gaia import gaia_catalog
+from ...utils.ztf import ZTFRefLocator
+from .candidate import (
+    grab_query_results_page,
+    parse_field_selection,
+    obj_load_options,
+    select_fields,
+)
 
 SOURCES_PER_PAGE = 100
 
+# Fields of listed sources that are not Obj columns, and are computed or
+# loaded separately for each source
+SOURCE_COMPUTED_FIELDS = ["last_detected", "gal_lat", "gal_lon", "comments"]
+MAX_CROSSMATCH_POSITIONS = 100_000
+
+env, cfg = load_env()
+
+# Gaia sources for offset stars (see the `offsets` config section)
+offsets_gaia_catalog = gaia_catalog(
+    backend=cfg['offsets.gaia_backend'],
+    level=cfg['offsets.gaia_healpix_level'],
+    parquet_path=cfg['offsets.gaia_parquet_path'],
+    cache_dir=cfg['offsets.gaia_cache_dir'],
+)
+
+# Offset-star searches run in worker threads so as not to block the IOLoop
+offsets_executor = BoundedExecutor(
+    max_workers=cfg['offsets.max_workers'],
+    max_queued=cfg['offsets.max_queued'],
+    name='offsets',
+)
+
+# Survey images for finding charts
+finder_image_cache = DiskCache(
+    cfg['finder.image_cache_dir'],
+    max_entries=cfg['finder.image_cache_max_entries'],
+    max_size=cfg['finder.image_cache_max_bytes'],
+)
+
+# Reference images of the ZTF image source
+ztfref_locator = ZTFRefLocator(
+    cache=DiskCache(cfg['finder.ztfref_cache_dir']),
+    footprints_path=cfg['finder.ztfref_footprints'],
+    level=cfg['finder.ztfref_healpix_level'],
+)
+
+# Rendered finding charts
+finder_chart_cache = DiskCache(
+    cfg['finder.chart_cache_dir'],
+    max_entries=cfg['finder.chart_cache_max_entries'],
+    max_size=cfg['finder.chart_cache_max_bytes'],
+)
+
+# Finding charts (image downloads and reprojection, offset-star searches
+# and rendering) are made in worker processes
+finder_executor = BoundedExecutor(
+    max_workers=cfg['finder.max_workers'],
+    max_queued=cfg['finder.max_queued'],
+    processes=True,
+)
+
+
+def round_obstime(obstime, window):
+    """Round an isoformat datetime (UTC if naive) down to a multiple of
+    `window` seconds, returning it in isoformat."""
+    timestamp = calendar.timegm(isoparse(obstime).utctimetuple())
+    return datetime.datetime.utcfromtimestamp(
+        timestamp - timestamp % window
+    ).isoformat()
+
+
+def invalidate_finder_chart_cache(obj_id):
+    """Drop the cached finding charts of `obj_id`."""
+    for key in finder_chart_cache.keys(f'finder/{obj_id}/'):
+        finder_chart_cache.invalidate(key)
+
 
 class SourceHandler(BaseHandler):
     @auth_or_token
@@ -94,6 +177,42 @@ class SourceHandler(BaseHandler):
             schema:
               type: boolean
             description: If true, return only those matches with TNS names
+          - in: query
+            name: altdata.<name>
+            nullable: true
+            schema:
+              type: string
+            description: |
+              Return only sources whose `altdata` value for the indexed key
+              `<name>` equals the given value. `<name>` must be one of the keys
+              of the `altdata_indexes` config section (e.g. `tns_name`).
+          - in: query
+            name: include
+            nullable: true
+            schema:
+              type: array
+              items:
+                type: string
+            explode: false
+            style: simple
+            description: |
+              Comma-separated list of fields to return for each source (e.g.
+              "id,ra,dec,last_detected"); only these columns are loaded from the
+              database. May be any Obj column, or one of "last_detected", "gal_lat",
+              "gal_lon" and "comments". `id` is always returned. Defaults to all
+              fields.
+          - in: query
+            name: exclude
+            nullable: true
+            schema:
+              type: array
+              items:
+                type: string
+            explode: false
+            style: simple
+            description: |
+              Comma-separated list of fields to omit for each source (e.g.
+              "altdata,comments"). Cannot be combined with `include`.
           - in: query
             name: numPerPage
             nullable: true
@@ -175,6 +294,17 @@ class SourceHandler(BaseHandler):
         simbad_class = self.get_query_argument('simbadClass', None)
         has_tns_name = self.get_query_argument('hasTNSname', None)
         total_matches = self.get_query_argument('totalMatches', None)
+        altdata_indexes = self.cfg.get('altdata_indexes') or {}
+        altdata_filters = {}
+        for arg in self.request.query_arguments:
+            if arg.startswith('altdata.'):
+                name = arg.split('.', 1)[1]
+                if name not in altdata_indexes:
+                    return self.error(
+                        f"Invalid altdata filter '{name}'; must be one of "
+                        f"{sorted(altdata_indexes)}"
+                    )
+                altdata_filters[name] = self.get_query_argument(arg)
         is_token_request = isinstance(self.current_user, Token)
         if obj_id:
             if is_token_request:
@@ -232,7 +362,15 @@ class SourceHandler(BaseHandler):
             )
 
             return self.success(data=source_info)
-        q = Obj.query.filter(
+        try:
+            fields = parse_field_selection(
+                self.get_query_argument('include', None),
+                self.get_query_argument('exclude', None),
+                SOURCE_COMPUTED_FIELDS,
+            )
+        except ValueError as e:
+            return self.error(str(e))
+        q = Obj.query.options(obj_load_options(fields)).filter(
             Obj.id.in_(
                 DBSession()
                 .query(Source.obj_id)
@@ -244,7 +382,7 @@ class SourceHandler(BaseHandler):
             )
         )
         if sourceID:
-            q = q.filter(Obj.id.contains(sourceID.strip()))
+            q = q.filter(Obj.id.contains(sourceID.strip(), autoescape=True))
         if any([ra, dec, radius]):
             if not all([ra, dec, radius]):
                 return self.error(
@@ -267,13 +405,22 @@ class SourceHandler(BaseHandler):
         if end_date:
             end_date = arrow.get(end_date.strip())
             q = q.filter(Obj.last_detected <= end_date)
+        # These expressions match the `altdata_indexes` defaults, so that
+        # the filters below can use the corresponding expression indexes
         if simbad_class:
             q = q.filter(
-                func.lower(Obj.altdata['simbad']['class'].astext)
+                altdata_expression(Obj.altdata, ['simbad', 'class'], lowercase=True)
                 == simbad_class.lower()
             )
         if has_tns_name in ['true', True]:
-            q = q.filter(Obj.altdata['tns']['name'].isnot(None))
+            q = q.filter(altdata_expression(Obj.altdata, ['tns', 'name']).isnot(None))
+        for name, value in altdata_filters.items():
+            index = altdata_indexes[name]
+            lowercase = index.get('lowercase', False)
+            q = q.filter(
+                altdata_expression(Obj.altdata, index['path'], lowercase=lowercase)
+                == (value.lower() if lowercase else value)
+            )
 
         if page_number:
             try:
@@ -294,11 +441,16 @@ class SourceHandler(BaseHandler):
 
         source_list = []
         for source in query_results["sources"]:
-            source.comments = source.get_comments_owned_by(self.current_user)
-            source_list.append(source.to_dict())
-            source_list[-1]["last_detected"] = source.last_detected
-            source_list[-1]["gal_lon"] = source.gal_lon_deg
-            source_list[-1]["gal_lat"] = source.gal_lat_deg
+            if fields is None or "comments" in fields:
+                source.comments = source.get_comments_owned_by(self.current_user)
+            source_info = source.to_dict()
+            if fields is None or "last_detected" in fields:
+                source_info["last_detected"] = source.last_detected
+            if fields is None or "gal_lon" in fields:
+                source_info["gal_lon"] = source.gal_lon_deg
+            if fields is None or "gal_lat" in fields:
+                source_info["gal_lat"] = source.gal_lat_deg
+            source_list.append(select_fields(source_info, fields))
         query_results["sources"] = source_list
 
         return self.success(data=query_results)
@@ -419,6 +571,9 @@ class SourceHandler(BaseHandler):
             )
         DBSession().commit()
 
+        if 'ra' in data or 'dec' in data:
+            invalidate_finder_chart_cache(obj_id)
+
         return self.success(action='skyportal/FETCH_SOURCES')
 
     @permissions(['Manage sources'])
@@ -459,9 +614,191 @@ class SourceHandler(BaseHandler):
         return self.success(action='skyportal/FETCH_SOURCES')
 
 
-class SourceOffsetsHandler(BaseHandler):
+class SourceCrossmatchHandler(BaseHandler):
+    @auth_or_token
+    def post(self):
+        """
+        ---
+        description: |
+          Crossmatch a list of positions against all sources accessible to the
+          user, in a single query.
+        requestBody:
+          content:
+            application/json:
+              schema:
+                type: object
+                properties:
+                  ra:
+                    type: array
+                    items:
+                      type: number
+                    description: Right ascensions (J2000) of the positions, in deg.
+                  dec:
+                    type: array
+                    items:
+                      type: number
+                    description: Declinations (J2000) of the positions, in deg.
+                  radius:
+                    oneOf:
+                      - type: number
+                      - type: array
+                        items:
+                          type: number
+                    description: |
+                      Match radius in deg. Either a single value applied to all
+                      positions, or one value per position.
+                required:
+                  - ra
+                  - dec
+                  - radius
+        responses:
+          200:
+            content:
+              application/json:
+                schema:
+                  allOf:
+                    - $ref: '#/components/schemas/Success'
+                    - type: object
+                      properties:
+                        data:
+                          type: object
+                          description: |
+                            One entry per (position, source) match, as columnar
+                            arrays of equal length, ordered by position index.
+                          properties:
+                            position_index:
+                              type: array
+                              items:
+                                type: integer
+                              description: Index of the matched input position
+                            obj_id:
+                              type: array
+                              items:
+                                type: string
+                            ra:
+                              type: array
+                              items:
+                                type: number
+                            dec:
+                              type: array
+                              items:
+                                type: number
+                            separation:
+                              type: array
+                              items:
+                                type: number
+                              description: Separation from the input position in arcsec
+          400:
+            content:
+              application/json:
+                schema: Error
+        """
+        data = self.get_json()
+        try:
+            ra = np.atleast_1d(np.asarray(data['ra'], dtype=float))
+            dec = np.atleast_1d(np.asarray(data['dec'], dtype=float))
+            radius = np.broadcast_to(np.asarray(data['radius'], dtype=float), ra.shape)
+        except KeyError:
+            return self.error("Fields 'ra', 'dec' and 'radius' are all required.")
+        except (TypeError, ValueError):
+            return self.error(
+                "Invalid values for ra, dec or radius - could not convert to "
+                "equal-length arrays of floats"
+            )
+        if ra.ndim != 1 or ra.shape != dec.shape:
+            return self.error("'ra' and 'dec' must be arrays of equal length.")
+        if len(ra) > MAX_CROSSMATCH_POSITIONS:
+            return self.error(
+                f"Too many positions - at most {MAX_CROSSMATCH_POSITIONS} "
+                "can be crossmatched per request."
+            )
+        if not (
+            np.isfinite(ra).all()
+            and np.isfinite(radius).all()
+            and (np.abs(dec) <= 90).all()
+            and (radius > 0).all()
+        ):
+            return self.error("Invalid values for ra, dec or radius.")
+
+        user_group_ids = [g.id for g in self.current_user.accessible_groups]
+
+        positions = CrossmatchPosition.__table__
+        positions.create(bind=DBSession().connection(), checkfirst=True)
+        DBSession().execute(positions.delete())
+        DBSession().execute(
+            positions.insert(),
+            [
+                {'id': i, 'ra': r, 'dec': d, 'radius': rad}
+                for i, (r, d, rad) in enumerate(zip(ra, dec, radius))
+            ],
+        )
+        matches = (
+            DBSession()
+            .query(CrossmatchPosition.id, Obj.id, Obj.ra, Obj.dec)
+            .join(Obj, Obj.within(CrossmatchPosition, CrossmatchPosition.radius))
+            .filter(
+                Obj.id.in_(
+                    DBSession()
+                    .query(Source.obj_id)
+                    .filter(Source.group_id.in_(user_group_ids))
+                )
+            )
+            .order_by(CrossmatchPosition.id, Obj.id)
+            .all()
+        )
+        # Committing drops the temporary table
+        DBSession().commit()
+
+        if matches:
+            index, obj_ids, obj_ra, obj_dec = map(list, zip(*matches))
+            separation = (
+                SkyCoord(ra[index], dec[index], unit='deg')
+                .separation(SkyCoord(obj_ra, obj_dec, unit='deg'))
+                .arcsec.tolist()
+            )
+        else:
+            index, obj_ids, obj_ra, obj_dec, separation = [], [], [], [], []
+
+        return self.success(
+            data={
+                'position_index': index,
+                'obj_id': obj_ids,
+                'ra': obj_ra,
+                'dec': obj_dec,
+                'separation': separation,
+            }
+        )
+
+
+class OffsetsBaseHandler(BaseHandler):
+    async def run_with_limits(self, executor, timeout, fn, *args, **kwargs):
+        """Run `fn(*args, **kwargs)` in `executor`; returns None (after
+        responding with a 503) if the executor is saturated or its worker
+        process died, or (after responding with a 504) if `fn` takes more
+        than `timeout` seconds."""
+        try:
+            return await asyncio.wait_for(
+                executor.run(fn, *args, **kwargs), timeout=timeout
+            )
+        except ExecutorSaturated:
+            self.set_header('Retry-After', '1')
+            self.error(
+                'Too many requests are being processed; try again shortly.', status=503
+            )
+        except BrokenExecutor:
+            self.set_header('Retry-After', '1')
+            self.error(
+                'The worker processing the request failed; try again shortly.',
+                status=503,
+            )
+        except asyncio.TimeoutError:
+            self.error(f'Request timed out after {timeout} seconds', status=504)
+        return None
+
+
+class SourceOffsetsHandler(OffsetsBaseHandler):
     @auth_or_token
-    def get(self, obj_id):
+    async def get(self, obj_id):
         """
         ---
         description: Retrieve offset stars to aid in spectroscopy
@@ -572,6 +909,16 @@ class SourceOffsetsHandler(BaseHandler):
             content:
               application/json:
                 schema: Error
+          503:
+            description: Too many requests are being processed
+            content:
+              application/json:
+                schema: Error
+          504:
+            description: The request timed out
+            content:
+              application/json:
+                schema: Error
         """
         source = Source.get_obj_if_owned_by(obj_id, self.current_user)
         if source is None:
@@ -600,12 +947,10 @@ class SourceOffsetsHandler(BaseHandler):
             return self.error('Invalid argument for `how_many`')
 
         try:
-            (
-                starlist_info,
-                query_string,
-                queries_issued,
-                noffsets,
-            ) = get_nearby_offset_stars(
+            result = await self.run_with_limits(
+                offsets_executor,
+                cfg['offsets.timeout'],
+                get_nearby_offset_stars,
                 source.ra,
                 source.dec,
                 obj_id,
@@ -617,10 +962,14 @@ class SourceOffsetsHandler(BaseHandler):
                 mag_min=mag_min,
                 obstime=obstime,
                 allowed_queries=2,
+                catalog=offsets_gaia_catalog,
             )
-
         except ValueError:
             return self.error('Error while querying for nearby offset stars')
+        if result is None:
+            return
+
+        starlist_info, query_string, queries_issued, noffsets = result
 
         starlist_str = "\n".join(
             [x["str"].replace(" ", "&nbsp;") for x in starlist_info]
@@ -639,9 +988,9 @@ class SourceOffsetsHandler(BaseHandler):
         )
 
 
-class SourceFinderHandler(BaseHandler):
+class SourceFinderHandler(OffsetsBaseHandler):
     @auth_or_token
-    def get(self, obj_id):
+    async def get(self, obj_id):
         """
         ---
         description: Generate a PDF finding chart to aid in spectroscopy
@@ -677,10 +1026,14 @@ class SourceFinderHandler(BaseHandler):
           schema:
             type: string
           description: |
-            datetime of observation in isoformat (e.g. 2020-12-30T12:34:10)
+            datetime of observation in isoformat (e.g. 2020-12-30T12:34:10),
+            rounded down to a multiple of the `finder.obstime_window` config
+            value
         responses:
           200:
-            description: A PDF finding chart file
+            description: |
+              A PDF finding chart file, with an ETag header; requests with a
+              matching If-None-Match header get an empty 304 response
             content:
               application/pdf:
                 schema:
@@ -690,6 +1043,16 @@ class SourceFinderHandler(BaseHandler):
             content:
               application/json:
                 schema: Error
+          503:
+            description: Too many requests are being processed
+            content:
+              application/json:
+                schema: Error
+          504:
+            description: The request timed out
+            content:
+              application/json:
+                schema: Error
         """
         source = Source.get_obj_if_owned_by(obj_id, self.current_user)
         if source is None:
@@ -708,7 +1071,6 @@ class SourceFinderHandler(BaseHandler):
         facility = self.get_query_argument('facility', 'Keck')
         image_source = self.get_query_argument('image_source', 'desi')
 
-        how_many = 3
         obstime = self.get_query_argument(
             'obstime', datetime.datetime.utcnow().isoformat()
         )
@@ -721,19 +1083,65 @@ class SourceFinderHandler(BaseHandler):
         if image_source not in source_image_parameters:
             return self.error('Invalid source image')
 
+        obstime = round_obstime(obstime, cfg['finder.obstime_window'])
+        output_format = 'pdf'
+        filename = f"finder_{obj_id}.{output_format}"
+        cache_key = (
+            f'finder/{obj_id}/{source.ra}/{source.dec}/{imsize}/{facility}/'
+            f'{image_source}/{obstime}/{output_format}'
+        )
+        image = finder_chart_cache.get(cache_key)
+        if image is None:
+            image = await self.render_finding_chart(
+                obj_id,
+                source.ra,
+                source.dec,
+                facility,
+                image_source,
+                imsize,
+                obstime,
+                output_format,
+            )
+            if image is None:
+                return
+            if len(image) > 0:
+                finder_chart_cache.set(cache_key, image)
+
+        # do not send result via `.success`, since that creates a JSON
+        self.set_status(200)
+        self.set_header("Content-Type", "application/pdf; charset='utf-8'")
+        self.set_header("Content-Disposition", f"attachment; filename={filename}")
+        # Browsers may keep the chart, but must revalidate it
+        self.set_header('Cache-Control', 'private, no-cache')
+        self.set_header('ETag', f'"{hashlib.sha256(image).hexdigest()}"')
+        if self.check_etag_header():
+            self.set_status(304)
+            return self.finish()
+
+        return self.write(image)
+
+    async def render_finding_chart(
+        self, obj_id, ra, dec, facility, image_source, imsize, obstime, output_format
+    ):
+        """Render a finding chart in `finder_executor`, returning its bytes
+        (empty if it could not be made), or None after responding with an
+        error."""
         radius_degrees = facility_parameters[facility]["radius_degrees"]
         mag_limit = facility_parameters[facility]["mag_limit"]
         min_sep_arcsec = facility_parameters[facility]["min_sep_arcsec"]
         mag_min = facility_parameters[facility]["mag_min"]
 
-        rez = get_finding_chart(
-            source.ra,
-            source.dec,
+        rez = await self.run_with_limits(
+            finder_executor,
+            cfg['finder.timeout'],
+            get_finding_chart,
+            ra,
+            dec,
             obj_id,
             image_source=image_source,
-            output_format='pdf',
+            output_format=output_format,
             imsize=imsize,
-            how_many=how_many,
+            how_many=3,
             radius_degrees=radius_degrees,
             mag_limit=mag_limit,
             mag_min=mag_min,
@@ -743,17 +1151,11 @@ class SourceFinderHandler(BaseHandler):
             use_source_pos_in_starlist=True,
             allowed_queries=2,
             queries_issued=0,
+            catalog=offsets_gaia_catalog,
+            download_timeout=cfg['finder.download_timeout'],
+            image_cache=finder_image_cache,
+            ztfref_locator=ztfref_locator,
         )
-
-        filename = rez["name"]
-        image = rez["data"]
-
-        # do not send result via `.success`, since that creates a JSON
-        self.set_status(200)
-        self.set_header("Content-Type", "application/pdf; charset='utf-8'")
-        self.set_header("Content-Disposition", f"attachment; filename={filename}")
-        self.set_header(
-            'Cache-Control', 'no-store, no-cache, must-revalidate, max-age=0'
-        )
-
-        return self.write(image)
+        if rez is None:
+            return None
+        return rez["data"] if rez["success"] else b""
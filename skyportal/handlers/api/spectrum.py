@@ -1,4 +1,5 @@
 from marshmallow.exceptions import ValidationError
+from sqlalchemy.orm import undefer_group
 from baselayer.app.access import permissions, auth_or_token
 from ..base import BaseHandler
 from ...models import DBSession, Group, Instrument, Obj, Source, Spectrum
@@ -95,7 +96,7 @@ class SpectrumHandler(BaseHandler):
               application/json:
                 schema: Error
         """
-        spectrum = Spectrum.query.get(spectrum_id)
+        spectrum = Spectrum.query.options(undefer_group('data')).get(spectrum_id)
 
         if spectrum is not None:
             # Permissions check
@@ -1,5 +1,8 @@
 from baselayer.app.access import auth_or_token
 from ..base import BaseHandler
+from .internal.plot import photometry_plot_cache, plot_executor, run_airmass_cache
+from .internal.scanning import bundle_cache
+from .source import finder_executor, finder_image_cache, offsets_executor
 
 
 class SysInfoHandler(BaseHandler):
@@ -19,5 +22,31 @@ class SysInfoHandler(BaseHandler):
                       properties:
                         data:
                           type: object
+                          properties:
+                            caches:
+                              type: object
+                              description: |
+                                Size and hit/miss counts of the in-memory caches
+                                of the app process that handled the request, and
+                                of the on-disk caches (shared by all processes)
+                            executors:
+                              type: object
+                              description: |
+                                Numbers of running, queued, completed and rejected
+                                tasks of the app process' worker pools
         """
-        return self.success(data={})
+        return self.success(
+            data={
+                'caches': {
+                    'photometry_plot': photometry_plot_cache.stats,
+                    'scanning_bundle': bundle_cache.stats,
+                    'run_airmass': run_airmass_cache.stats,
+                    'finder_images': finder_image_cache.stats,
+                },
+                'executors': {
+                    'plots': plot_executor.stats,
+                    'offsets': offsets_executor.stats,
+                    'finder': finder_executor.stats,
+                },
+            }
+        )
@@ -1,13 +1,34 @@
 import os
 import io
 import base64
+import hashlib
 from pathlib import Path
+import sqlalchemy as sa
 from marshmallow.exceptions import ValidationError
 from sqlalchemy.exc import StatementError
 from PIL import Image, UnidentifiedImageError
 from baselayer.app.access import permissions, auth_or_token
+from baselayer.app.env import load_env
 from ..base import BaseHandler
 from ...models import DBSession, Photometry, Obj, Source, Thumbnail
+from ...utils.thumbnail_store import thumbnail_store
+
+
+env, cfg = load_env()
+
+# Relative local paths are relative to the SkyPortal directory
+basedir = Path(os.path.dirname(__file__)) / '..' / '..'
+if os.path.abspath(basedir).endswith('skyportal/skyportal'):
+    basedir = basedir / '..'
+store = thumbnail_store(
+    backend=cfg['thumbnails.backend'],
+    local_path=basedir / cfg['thumbnails.local_path'],
+    url_prefix=cfg['thumbnails.url_prefix'],
+    s3_bucket=cfg['thumbnails.s3_bucket'],
+    s3_prefix=cfg['thumbnails.s3_prefix'],
+    s3_endpoint_url=cfg['thumbnails.s3_endpoint_url'],
+    s3_public_url=cfg['thumbnails.s3_public_url'],
+)
 
 
 class ThumbnailHandler(BaseHandler):
@@ -87,7 +108,12 @@ class ThumbnailHandler(BaseHandler):
                 return self.error(f"Error creating new thumbnail: {e}")
         except UnidentifiedImageError as e:
             return self.error(f"Invalid file type: {e}")
-        DBSession().commit()
+        file_uri = t.file_uri
+        try:
+            DBSession().commit()
+        except Exception:
+            discard_thumbnail_file(file_uri)
+            raise
 
         return self.success(data={"id": t.id})
 
@@ -192,21 +218,22 @@ class ThumbnailHandler(BaseHandler):
         # Ensure user/token has access to parent source
         _ = Source.get_obj_if_owned_by(t.obj.id, self.current_user)
 
+        file_uri = t.file_uri
         DBSession().query(Thumbnail).filter(Thumbnail.id == int(thumbnail_id)).delete()
         DBSession().commit()
+        release_thumbnail_files([file_uri])
 
         return self.success()
 
 
+def _lock_file_uri(file_uri):
+    """Serialize, until the end of the transaction, the storage and release
+    of the file at `file_uri` (see `release_thumbnail_files`)."""
+    key = int(hashlib.sha256(file_uri.encode()).hexdigest()[:15], 16)
+    DBSession().execute(sa.text('SELECT pg_advisory_xact_lock(:key)'), {'key': key})
+
+
 def create_thumbnail(thumbnail_data, thumbnail_type, obj_id, photometry_obj):
-    basedir = Path(os.path.dirname(__file__)) / '..' / '..'
-    if os.path.abspath(basedir).endswith('skyportal/skyportal'):
-        basedir = basedir / '..'
-    file_uri = os.path.abspath(
-        basedir / f'static/thumbnails/{obj_id}_{thumbnail_type}.png'
-    )
-    if not os.path.exists(os.path.dirname(file_uri)):
-        (basedir / 'static/thumbnails').mkdir(parents=True)
     file_bytes = base64.b64decode(thumbnail_data)
     im = Image.open(io.BytesIO(file_bytes))
     if im.format != 'PNG':
@@ -216,15 +243,46 @@ def create_thumbnail(thumbnail_data, thumbnail_type, obj_id, photometry_obj):
             'Invalid thumbnail size. Only thumbnails '
             'between (16, 16) and (500, 500) allowed.'
         )
+
+    # Thumbnails are stored by content, so identical images share a file;
+    # the lock (held until the caller commits) keeps the file from being
+    # released while the new row referencing it is added
+    _lock_file_uri(store.file_uri(file_bytes))
+    file_uri, public_url = store.put(file_bytes)
     t = Thumbnail(
         type=thumbnail_type,
         photometry=photometry_obj,
         file_uri=file_uri,
-        public_url=f'/static/thumbnails/{obj_id}_{thumbnail_type}.png',
+        public_url=public_url,
     )
-    DBSession().add(t)
-    DBSession().flush()
-
-    with open(file_uri, 'wb') as f:
-        f.write(file_bytes)
+    try:
+        DBSession().add(t)
+        DBSession().flush()
+    except Exception:
+        discard_thumbnail_file(file_uri)
+        raise
     return t
+
+
+def discard_thumbnail_file(file_uri):
+    """Roll back the failed addition of a thumbnail stored at `file_uri`,
+    deleting the stored file unless other thumbnails use it."""
+    DBSession().rollback()
+    release_thumbnail_files([file_uri])
+
+
+def release_thumbnail_files(file_uris):
+    """Delete the stored files at `file_uris` that are no longer used by any
+    thumbnail. Call after committing the deletion of thumbnails (directly,
+    or by deleting their photometry)."""
+    for file_uri in sorted({uri for uri in file_uris if uri is not None}):
+        _lock_file_uri(file_uri)
+        if (
+            DBSession()
+            .query(Thumbnail.id)
+            .filter(Thumbnail.file_uri == file_uri)
+            .first()
+            is None
+        ):
+            store.delete(file_uri)
+        DBSession().commit()
@@ -85,6 +85,9 @@ if __name__ == "__main__":
     ):
         create_tables()
 
+    with status("Creating indexes"):
+        model_util.setup_indexes()
+
     for model in Base.metadata.tables:
         print('    -', model)
 
@@ -1,5 +1,15 @@
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
 from social_tornado.models import TornadoStorage
-from skyportal.models import DBSession, ACL, Role, User, Group, Token
+from skyportal.models import (
+    DBSession,
+    ACL,
+    Role,
+    User,
+    Group,
+    Token,
+    altdata_expression,
+)
 from baselayer.app.env import load_env
 
 all_acl_ids = [
@@ -112,6 +122,51 @@ def setup_permissions():
     DBSession().commit()
 
 
+# Columns added to existing tables, which `create_tables` does not alter.
+# Each statement must be idempotent.
+column_ddl = ['ALTER TABLE telescopes ADD COLUMN IF NOT EXISTS timezone VARCHAR']
+
+# Extensions and indexes that `create_tables` cannot add to existing tables.
+# Each statement must be idempotent.
+extension_and_index_ddl = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    # Trigram index serving substring/prefix (`LIKE '%...%'`) matches on IDs
+    'CREATE INDEX IF NOT EXISTS ix_objs_id_trgm ON objs USING gin (id gin_trgm_ops)',
+    # Thumbnails sharing a stored file are counted by `file_uri`
+    'CREATE INDEX IF NOT EXISTS ix_thumbnails_file_uri ON thumbnails (file_uri)',
+]
+
+
+def altdata_index_ddl(name, path, lowercase=False):
+    """DDL for the expression index backing a configured `altdata_indexes`
+    entry."""
+    expr = altdata_expression(
+        sa.column('altdata', postgresql.JSONB), path, lowercase=lowercase
+    ).compile(dialect=postgresql.dialect(), compile_kwargs={'literal_binds': True})
+    return f'CREATE INDEX IF NOT EXISTS ix_objs_altdata_{name} ON objs (({expr}))'
+
+
+def setup_indexes():
+    """Add new columns to existing tables, and create PostgreSQL extensions
+    and indexes needed by the application, including the expression indexes
+    for the configured `altdata_indexes`.
+
+    Existing columns/extensions/indexes are skipped, so this can be run
+    against both new and existing databases."""
+    statements = column_ddl + extension_and_index_ddl
+    statements += [
+        altdata_index_ddl(name, **params)
+        for name, params in (cfg.get('altdata_indexes') or {}).items()
+    ]
+    for statement in statements:
+        try:
+            DBSession().execute(statement)
+            DBSession().commit()
+        except sa.exc.DBAPIError as e:
+            DBSession().rollback()
+            print(f'Could not execute "{statement}": {e.orig}')
+
+
 def create_token(ACLs, user_id, name):
     t = Token(permissions=ACLs, name=name)
     u = User.query.get(user_id)
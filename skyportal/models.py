@@ -1,4 +1,5 @@
 import arrow
+import functools
 import uuid
 import re
 from datetime import datetime, timezone
@@ -10,8 +11,9 @@ import sqlalchemy as sa
 from sqlalchemy import cast
 from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.dialects import postgresql as psql
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import deferred, relationship, undefer_group
 from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy_utils import ArrowType, URLType
 
@@ -33,6 +35,7 @@ from baselayer.app.custom_exceptions import AccessError
 import timezonefinder
 
 from . import schema
+from .utils.visibility import pickering_airmass, rise_set_times
 from .enum_types import (
     allowed_bandpasses,
     thumbnail_types,
@@ -343,21 +346,8 @@ class Obj(Base, ha.Point):
         output_shape = np.shape(time)
         time = np.atleast_1d(time)
         altitude = self.altitude(telescope, time).to('degree').value
-        above = altitude > 0
-
-        # use Pickering (2002) interpolation to calculate the airmass
-        # The Pickering interpolation tends toward 38.7494 as the altitude
-        # approaches zero.
-        sinarg = np.zeros_like(altitude)
-        airmass = np.ones_like(altitude) * np.inf
-        sinarg[above] = altitude[above] + 244 / (165 + 47 * altitude[above] ** 1.1)
-        airmass[above] = 1.0 / np.sin(np.deg2rad(sinarg[above]))
-
-        # set objects below the horizon to an airmass of infinity
-        airmass[~above] = below_horizon
-        airmass = airmass.reshape(output_shape)
-
-        return airmass
+        airmass = pickering_airmass(altitude, below_horizon=below_horizon)
+        return airmass.reshape(output_shape)
 
     def altitude(self, telescope, time):
         """Return the altitude of the object at a given time.
@@ -379,6 +369,42 @@ class Obj(Base, ha.Point):
         return telescope.observer.altaz(time, self.target).alt
 
 
+def altdata_expression(column, path, lowercase=False):
+    """Return the SQL expression for the text value at `path` in a JSONB
+    `altdata` column, e.g. `['simbad', 'class']` for
+    `(altdata -> 'simbad') ->> 'class'`.
+
+    The same expression is used to declare the corresponding expression
+    index, so that filters built with it can use that index.
+    """
+    expr = column
+    for key in path[:-1]:
+        expr = expr[key]
+    expr = expr[path[-1]].astext
+    return sa.func.lower(expr) if lowercase else expr
+
+
+# Tables declared on this base are never created by `create_tables`; they are
+# created on demand inside a transaction and dropped by PostgreSQL at commit.
+TemporaryBase = declarative_base()
+
+
+class CrossmatchPosition(TemporaryBase, ha.Point):
+    """Temporary table of positions to crossmatch against `Obj` in a single
+    set-based query."""
+
+    __tablename__ = 'crossmatch_positions'
+    __table_args__ = {'prefixes': ['TEMPORARY'], 'postgresql_on_commit': 'DROP'}
+
+    id = sa.Column(
+        sa.Integer,
+        primary_key=True,
+        autoincrement=False,
+        doc='Index of the position in the submitted arrays.',
+    )
+    radius = sa.Column(sa.Float, nullable=False, doc='Match radius in deg.')
+
+
 class Filter(Base):
     name = sa.Column(sa.String, nullable=False, unique=False)
     stream_id = sa.Column(
@@ -520,16 +546,17 @@ def get_obj_classifications_owned_by(self, user_or_token):
 Obj.get_classifications_owned_by = get_obj_classifications_owned_by
 
 
-def get_photometry_owned_by_user(obj_id, user_or_token):
-    return (
-        Photometry.query.filter(Photometry.obj_id == obj_id)
-        .filter(
-            Photometry.groups.any(
-                Group.id.in_([g.id for g in user_or_token.accessible_groups])
-            )
+def get_photometry_owned_by_user(obj_id, user_or_token, min_mjd=None, max_mjd=None):
+    query = Photometry.query.filter(Photometry.obj_id == obj_id).filter(
+        Photometry.groups.any(
+            Group.id.in_([g.id for g in user_or_token.accessible_groups])
         )
-        .all()
     )
+    if min_mjd is not None:
+        query = query.filter(Photometry.mjd >= min_mjd)
+    if max_mjd is not None:
+        query = query.filter(Photometry.mjd <= max_mjd)
+    return query.all()
 
 
 Obj.get_photometry_owned_by_user = get_photometry_owned_by_user
@@ -537,7 +564,8 @@ Obj.get_photometry_owned_by_user = get_photometry_owned_by_user
 
 def get_spectra_owned_by(obj_id, user_or_token):
     return (
-        Spectrum.query.filter(Spectrum.obj_id == obj_id)
+        Spectrum.query.options(undefer_group('data'))
+        .filter(Spectrum.obj_id == obj_id)
         .filter(
             Spectrum.groups.any(
                 Group.id.in_([g.id for g in user_or_token.accessible_groups])
@@ -586,6 +614,12 @@ class Telescope(Base):
     robotic = sa.Column(
         sa.Boolean, default=False, nullable=False, doc="Is this telescope robotic?"
     )
+    timezone = sa.Column(
+        sa.String,
+        nullable=True,
+        doc="IANA time zone of the telescope's location (set automatically "
+        "from its coordinates).",
+    )
 
     instruments = relationship(
         'Instrument',
@@ -593,16 +627,65 @@ class Telescope(Base):
         cascade='save-update, merge, refresh-expire, expunge',
         passive_deletes=True,
     )
+    ephemerides = relationship(
+        'Ephemeris',
+        back_populates='telescope',
+        cascade='save-update, merge, refresh-expire, expunge',
+        passive_deletes=True,
+    )
 
     @property
     def observer(self):
-        tf = timezonefinder.TimezoneFinder()
-        local_tz = tf.timezone_at(lng=self.lon, lat=self.lat)
-        return astroplan.Observer(
-            longitude=self.lon * u.deg,
-            latitude=self.lat * u.deg,
-            elevation=self.elevation * u.m,
-            timezone=local_tz,
+        """An `astroplan.Observer` at the telescope's location, shared by all
+        instances representing the same telescope (and position) in this
+        process."""
+        local_tz = self.timezone
+        if local_tz is None:
+            local_tz = lookup_timezone(self.lon, self.lat)
+        return get_observer(self.id, self.lon, self.lat, self.elevation, local_tz)
+
+
+@functools.lru_cache(maxsize=1)
+def get_timezone_finder():
+    """Process-wide `timezonefinder.TimezoneFinder` (which loads a large
+    amount of polygon data when created)."""
+    return timezonefinder.TimezoneFinder()
+
+
+def lookup_timezone(lon, lat):
+    """IANA time zone at the given coordinates (in degrees)."""
+    return get_timezone_finder().timezone_at(lng=lon, lat=lat)
+
+
+@functools.lru_cache(maxsize=256)
+def get_observer(telescope_id, lon, lat, elevation, local_tz):
+    """Cached `astroplan.Observer`, keyed by telescope ID and location."""
+    return astroplan.Observer(
+        longitude=lon * u.deg,
+        latitude=lat * u.deg,
+        elevation=elevation * u.m,
+        timezone=local_tz,
+    )
+
+
+@sa.event.listens_for(Telescope, 'before_insert')
+@sa.event.listens_for(Telescope, 'before_update')
+def set_telescope_timezone(mapper, connection, target):
+    """Store the time zone of a telescope's location when it is created, or
+    when its coordinates change."""
+    state = sa.inspect(target)
+    moved = (
+        state.attrs.lat.history.has_changes() or state.attrs.lon.history.has_changes()
+    )
+    if target.timezone is None or moved:
+        if target.lat is None or target.lon is None:
+            target.timezone = None
+        else:
+            target.timezone = lookup_timezone(target.lon, target.lat)
+    if moved and target.id is not None:
+        # Stored ephemerides were computed for the old location
+        connection.execute(
+            Ephemeris.__table__.delete().where(Ephemeris.telescope_id == target.id)
         )
 
 
@@ -924,9 +1007,12 @@ GroupPhotometry = join_model("group_photometry", Group, Photometry)
 class Spectrum(Base):
     __tablename__ = 'spectra'
     # TODO better numpy integration
-    wavelengths = sa.Column(NumpyArray, nullable=False)
-    fluxes = sa.Column(NumpyArray, nullable=False)
-    errors = sa.Column(NumpyArray)
+    # The data arrays are only loaded when accessed (or when the query
+    # undefers the `data` group), so that queries for spectrum metadata
+    # stay light
+    wavelengths = deferred(sa.Column(NumpyArray, nullable=False), group='data')
+    fluxes = deferred(sa.Column(NumpyArray, nullable=False), group='data')
+    errors = deferred(sa.Column(NumpyArray), group='data')
 
     obj_id = sa.Column(
         sa.ForeignKey('objs.id', ondelete='CASCADE'), nullable=False, index=True
@@ -1004,11 +1090,16 @@ User.followup_requests = relationship('FollowupRequest', back_populates='request
 
 
 class Thumbnail(Base):
-    # TODO delete file after deleting row
     type = sa.Column(
         thumbnail_types, doc='Thumbnail type (e.g., ref, new, sub, dr8, ...)'
     )
-    file_uri = sa.Column(sa.String(), nullable=True, index=False, unique=False)
+    file_uri = sa.Column(
+        sa.String(),
+        nullable=True,
+        index=True,
+        unique=False,
+        doc='Location of the stored image (shared by identical thumbnails)',
+    )
     public_url = sa.Column(sa.String(), nullable=True, index=False, unique=False)
     origin = sa.Column(sa.String, nullable=True)
     photometry_id = sa.Column(
@@ -1024,6 +1115,119 @@ class Thumbnail(Base):
     )
 
 
+class Ephemeris(Base):
+    """Sun set, rise and twilight times (UTC) at a telescope for the night
+    starting on a calendar date (local time), computed once and stored."""
+
+    __tablename__ = 'ephemerides'
+    __table_args__ = (sa.UniqueConstraint('telescope_id', 'calendar_date'),)
+
+    EVENTS = (
+        'sunset',
+        'sunrise',
+        'twilight_evening_nautical',
+        'twilight_morning_nautical',
+        'twilight_evening_astronomical',
+        'twilight_morning_astronomical',
+    )
+
+    telescope_id = sa.Column(
+        sa.ForeignKey('telescopes.id', ondelete='CASCADE'), nullable=False, index=True
+    )
+    telescope = relationship('Telescope', back_populates='ephemerides')
+    calendar_date = sa.Column(sa.Date, nullable=False)
+
+    sunset_utc = sa.Column(sa.DateTime)
+    sunrise_utc = sa.Column(sa.DateTime)
+    twilight_evening_nautical_utc = sa.Column(sa.DateTime)
+    twilight_morning_nautical_utc = sa.Column(sa.DateTime)
+    twilight_evening_astronomical_utc = sa.Column(sa.DateTime)
+    twilight_morning_astronomical_utc = sa.Column(sa.DateTime)
+
+    def time(self, event):
+        """The time of `event` (one of `EVENTS`) as an `astropy.time.Time`,
+        or None if it does not occur on this night."""
+        value = getattr(self, f'{event}_utc')
+        return None if value is None else ap_time.Time(value, scale='utc')
+
+    @classmethod
+    def compute(cls, telescope, calendar_date):
+        """Compute the column values of the ephemeris of `telescope` on
+        `calendar_date`."""
+        observer = telescope.observer
+        noon = datetime(
+            year=calendar_date.year,
+            month=calendar_date.month,
+            day=calendar_date.day,
+            hour=12,
+            tzinfo=observer.timezone,
+        )
+        noon = noon.astimezone(timezone.utc).timestamp()
+        noon = ap_time.Time(noon, format='unix')
+
+        values = {'telescope_id': telescope.id, 'calendar_date': calendar_date}
+        for event in cls.EVENTS:
+            if event in ('sunset', 'sunrise'):
+                method = getattr(observer, f'sun_{event[3:]}_time')
+            else:
+                method = getattr(observer, event)
+            time = method(noon, which='next')
+            values[f'{event}_utc'] = (
+                None if np.ma.is_masked(time.value) else time.datetime
+            )
+        return values
+
+
+def load_ephemerides(runs):
+    """Attach its `Ephemeris` to each of `runs` (as `run.ephemeris`).
+
+    Stored ephemerides are fetched in a single query. Missing ones are
+    computed and stored (in their own transaction, so as not to commit
+    the caller's session) for subsequent requests.
+    """
+    keys = {(run.instrument.telescope_id, run.calendar_date) for run in runs}
+    if len(keys) == 0:
+        return
+
+    def fetch(keys):
+        return {
+            (e.telescope_id, e.calendar_date): e
+            for e in Ephemeris.query.filter(
+                sa.tuple_(Ephemeris.telescope_id, Ephemeris.calendar_date).in_(
+                    list(keys)
+                )
+            )
+        }
+
+    ephemerides = fetch(keys)
+    missing = keys - set(ephemerides)
+    if missing:
+        telescopes = {
+            run.instrument.telescope_id: run.instrument.telescope
+            for run in runs
+            if (run.instrument.telescope_id, run.calendar_date) in missing
+        }
+        values = [
+            Ephemeris.compute(telescopes[telescope_id], calendar_date)
+            for telescope_id, calendar_date in missing
+        ]
+        now = datetime.utcnow()
+        for v in values:
+            v['created_at'] = v['modified'] = now
+        with DBSession().bind.begin() as connection:
+            connection.execute(
+                psql.insert(Ephemeris.__table__)
+                .values(values)
+                .on_conflict_do_nothing(
+                    index_elements=['telescope_id', 'calendar_date']
+                )
+            )
+        ephemerides.update(fetch(missing))
+
+    for run in runs:
+        run._ephemeris = ephemerides[(run.instrument.telescope_id, run.calendar_date)]
+
+
 class ObservingRun(Base):
 
     instrument_id = sa.Column(
@@ -1063,54 +1267,36 @@ class ObservingRun(Base):
     calendar_date = sa.Column(sa.Date, nullable=False, index=True)
 
     @property
-    def _calendar_noon(self):
-        observer = self.instrument.telescope.observer
-        year = self.calendar_date.year
-        month = self.calendar_date.month
-        day = self.calendar_date.day
-        hour = 12
-        noon = datetime(
-            year=year, month=month, day=day, hour=hour, tzinfo=observer.timezone
-        )
-        noon = noon.astimezone(timezone.utc).timestamp()
-        noon = ap_time.Time(noon, format='unix')
-        return noon
+    def ephemeris(self):
+        """The `Ephemeris` of the run's telescope on the night starting on
+        the run's calendar date."""
+        if getattr(self, '_ephemeris', None) is None:
+            load_ephemerides([self])
+        return self._ephemeris
 
     @property
     def sunset(self):
-        return self.instrument.telescope.observer.sun_set_time(
-            self._calendar_noon, which='next'
-        )
+        return self.ephemeris.time('sunset')
 
     @property
     def sunrise(self):
-        return self.instrument.telescope.observer.sun_rise_time(
-            self._calendar_noon, which='next'
-        )
+        return self.ephemeris.time('sunrise')
 
     @property
     def twilight_evening_nautical(self):
-        return self.instrument.telescope.observer.twilight_evening_nautical(
-            self._calendar_noon, which='next'
-        )
+        return self.ephemeris.time('twilight_evening_nautical')
 
     @property
     def twilight_morning_nautical(self):
-        return self.instrument.telescope.observer.twilight_morning_nautical(
-            self._calendar_noon, which='next'
-        )
+        return self.ephemeris.time('twilight_morning_nautical')
 
     @property
     def twilight_evening_astronomical(self):
-        return self.instrument.telescope.observer.twilight_evening_astronomical(
-            self._calendar_noon, which='next'
-        )
+        return self.ephemeris.time('twilight_evening_astronomical')
 
     @property
     def twilight_morning_astronomical(self):
-        return self.instrument.telescope.observer.twilight_morning_astronomical(
-            self._calendar_noon, which='next'
-        )
+        return self.ephemeris.time('twilight_morning_astronomical')
 
 
 User.observing_runs = relationship(
@@ -1157,20 +1343,50 @@ class ClassicalAssignment(Base):
     @property
     def rise_time(self):
         """The time at which the object rises on this run."""
-        observer = self.instrument.telescope.observer
-        target = self.obj.target
-        return observer.target_rise_time(
-            self.run.sunset, target, which='next', horizon=30 * u.degree
-        )
+        return self.rise_set_times[0]
 
     @property
     def set_time(self):
         """The time at which the object sets on this run."""
-        observer = self.instrument.telescope.observer
-        target = self.obj.target
-        return observer.target_set_time(
-            self.rise_time, target, which='next', horizon=30 * u.degree
+        return self.rise_set_times[1]
+
+    @property
+    def rise_set_times(self):
+        """The times (`astropy.time.Time`, or None) at which the object rises
+        above, and then sets below, 30 degrees altitude after sunset on this
+        run."""
+        if getattr(self, '_rise_set_times', None) is None:
+            load_rise_set_times([self])
+        return self._rise_set_times
+
+
+def load_rise_set_times(assignments):
+    """Compute the rise and set times of all `assignments` (as
+    `assignment.rise_set_times`), evaluating the targets of each observing
+    run together."""
+    by_run = {}
+    for assignment in assignments:
+        by_run.setdefault(assignment.run_id, []).append(assignment)
+
+    for run_assignments in by_run.values():
+        run = run_assignments[0].run
+        sunset = run.sunset
+        if sunset is None:
+            for assignment in run_assignments:
+                assignment._rise_set_times = (None, None)
+            continue
+        rise, set_ = rise_set_times(
+            run.instrument.telescope.observer.location,
+            [a.obj.ra for a in run_assignments],
+            [a.obj.dec for a in run_assignments],
+            sunset,
+            horizon=30 * u.degree,
         )
+        for assignment, rise_jd, set_jd in zip(run_assignments, rise, set_):
+            assignment._rise_set_times = tuple(
+                None if np.isnan(jd) else ap_time.Time(jd, format='jd')
+                for jd in (rise_jd, set_jd)
+            )
 
 
 User.assignments = relationship(
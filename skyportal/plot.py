@@ -12,9 +12,14 @@ from bokeh.plotting import figure, ColumnDataSource
 from bokeh.util.compiler import bundle_all_models
 from bokeh.util.serialization import make_id
 
+from sqlalchemy.orm import joinedload, undefer_group
+
 from matplotlib import cm
 from matplotlib.colors import rgb2hex
 
+import functools
+import hashlib
+import json
 import os
 from skyportal.models import (
     DBSession,
@@ -23,14 +28,19 @@ from skyportal.models import (
     Group,
     Instrument,
     Telescope,
+    Spectrum,
     PHOT_ZP,
 )
+from skyportal.utils import stack_photometry
 
 import sncosmo
 
 
 DETECT_THRESH = 5  # sigma
 
+# Bin sizes (days) selectable with the photometry plots' binsize sliders
+STACK_BINSIZES = list(range(1, 16))
+
 SPEC_LINES = {
     'H': ([3970, 4102, 4341, 4861, 6563], '#ff0000'),
     'He': ([3886, 4472, 5876, 6678, 7065], '#002157'),
@@ -125,6 +135,24 @@ export class CheckboxWithLegendGroup extends CheckboxGroup
 """
 
 
+@functools.lru_cache(maxsize=None)
+def custom_models_bundle():
+    """Compile the JS implementations of the custom Bokeh models used in
+    plots (e.g., `CheckboxWithLegendGroup`).
+
+    The bundle never changes while the app is running, so it is only built
+    once per process.
+
+    Returns
+    -------
+    (str, str)
+        The JS bundle and its SHA-256 digest (hex), which identifies it for
+        caching by the browser.
+    """
+    js = bundle_all_models()
+    return js, hashlib.sha256(js.encode()).hexdigest()
+
+
 # TODO replace with (script, div) method
 def _plot_to_json(plot):
     """Convert plot to JSON objects necessary for rendering with `bokehJS`.
@@ -135,7 +163,9 @@ def _plot_to_json(plot):
     Returns
     -------
     (str, str)
-        Returns (docs_json, render_items) json for the desired plot.
+        Returns (docs_json, render_items) json for the desired plot. The
+        custom models the plot relies on are provided separately, by
+        `custom_models_bundle`.
     """
     render_items = [{'docid': plot._id, 'elementid': make_id()}]
 
@@ -146,9 +176,8 @@ def _plot_to_json(plot):
 
     docs_json = serialize_json(docs_json)
     render_items = serialize_json(render_items)
-    custom_model_js = bundle_all_models()
 
-    return docs_json, render_items, custom_model_js
+    return docs_json, render_items
 
 
 tooltip_format = [
@@ -163,27 +192,198 @@ tooltip_format = [
     ('stacked', '@stacked'),
 ]
 cmap = cm.get_cmap('jet_r')
+CMAP_LIMITS = (3000.0, 10000.0)
+ZTF_COLORS = {'ztfg': 'green', 'ztfi': 'orange', 'ztfr': 'red'}
 
+# Table of bandpass colors, generated by `make dependencies` (or
+# regenerated by `make bandpass_colors`; see tools/bandpass_colors.py) so
+# that plotting does not have to load bandpasses. Bandpasses missing from
+# it are loaded with sncosmo.
+BANDPASS_COLORS_FILE = os.path.join(os.path.dirname(__file__), 'bandpass_colors.json')
 
-def get_color(bandpass_name, cmap_limits=(3000.0, 10000.0)):
+
+def compute_bandpass_color(bandpass_name, cmap_limits=CMAP_LIMITS):
+    """Color of a bandpass on the `cmap` scale, based on its effective
+    wavelength."""
     if bandpass_name.startswith('ztf'):
-        return {'ztfg': 'green', 'ztfi': 'orange', 'ztfr': 'red'}[bandpass_name]
-    else:
-        bandpass = sncosmo.get_bandpass(bandpass_name)
-        wave = bandpass.wave_eff
-        rgb = cmap((cmap_limits[1] - wave) / (cmap_limits[1] - cmap_limits[0]))[:3]
-        bandcolor = rgb2hex(rgb)
+        return ZTF_COLORS[bandpass_name]
+    bandpass = sncosmo.get_bandpass(bandpass_name)
+    wave = bandpass.wave_eff
+    rgb = cmap((cmap_limits[1] - wave) / (cmap_limits[1] - cmap_limits[0]))[:3]
+    return rgb2hex(rgb)
+
+
+def load_bandpass_colors(path=BANDPASS_COLORS_FILE):
+    try:
+        with open(path) as f:
+            colors = json.load(f)
+    except FileNotFoundError:
+        colors = {}
+    colors.update(ZTF_COLORS)
+    return colors
+
+
+BANDPASS_COLORS = load_bandpass_colors()
+
+
+@functools.lru_cache(maxsize=None)
+def get_color(bandpass_name, cmap_limits=CMAP_LIMITS):
+    if cmap_limits == CMAP_LIMITS and bandpass_name in BANDPASS_COLORS:
+        return BANDPASS_COLORS[bandpass_name]
+    return compute_bandpass_color(bandpass_name, cmap_limits)
+
+
+def bandpass_colors(filters):
+    """Map a Series of bandpass names to their colors."""
+    return filters.map({f: get_color(f) for f in filters.unique()})
+
+
+def error_bar_segments(x, y, err):
+    """Vertical error bars from `y - err` to `y + err` at each `x`, as the
+    `xs` and `ys` columns of a `multi_line` glyph."""
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    err = np.asarray(err, dtype=float)
+    xs = np.column_stack([x, x])
+    ys = np.column_stack([y - err, y + err])
+    return xs.tolist(), ys.tolist()
+
+
+def stacked_series(df, binsizes=STACK_BINSIZES):
+    """Stacked photometry of one light curve (see
+    `skyportal.utils.stack_photometry`) for each of `binsizes`, as the data
+    of a ColumnDataSource with a `binsize` column."""
+    columns = ['mjd', 'flux', 'fluxerr', 'mag', 'magerr', 'lim_mag', 'detected']
+    series = [
+        stack_photometry(
+            df['mjd'],
+            df['flux'],
+            df['fluxerr'],
+            np.zeros(len(df)),
+            binsize,
+            PHOT_ZP,
+            detect_thresh=DETECT_THRESH,
+        )
+        for binsize in binsizes
+    ]
+    data = {
+        column: np.concatenate([stacked[column] for stacked in series])
+        for column in columns
+    }
+    data['binsize'] = np.concatenate(
+        [
+            np.full(len(stacked['mjd']), binsize, dtype=float)
+            for binsize, stacked in zip(binsizes, series)
+        ]
+    )
+    return data
+
+
+def downsample_photometry(data, max_points):
+    """Reduce photometry to roughly `max_points` time bins, by binning each
+    light curve (rows sharing a `label`) in time, with each light curve
+    getting a share of the bins proportional to its number of points.
+
+    In each bin, points with a flux are replaced by one point at their
+    median MJD and median flux, with the flux error propagated to the
+    median (sqrt(pi / 2) * sqrt(sum(fluxerr**2)) / n). Of the points
+    without a flux (upper limits), only the deepest is kept. Other columns
+    are taken from the first point of each bin, and `n_points` records
+    how many points each row represents.
+    """
+    if len(data) <= max_points:
+        return data.assign(n_points=1)
+
+    bins = np.zeros(len(data), dtype=int)
+    mjd = data['mjd'].values
+    for indices in data.groupby('label', sort=False).indices.values():
+        n_bins = max(1, int(round(max_points * len(indices) / len(data))))
+        edges = np.linspace(mjd[indices].min(), mjd[indices].max(), n_bins + 1)
+        bins[indices] = np.clip(
+            np.searchsorted(edges, mjd[indices], side='right') - 1, 0, n_bins - 1
+        )
+    data = data.assign(_bin=bins, _var=data['fluxerr'] ** 2)
+    hasflux = data['flux'].notna()
+
+    detections = data[hasflux].groupby(['label', '_bin'], sort=False)
+    binned = detections.first()
+    n_points = detections.size()
+    binned['mjd'] = detections['mjd'].median()
+    binned['flux'] = detections['flux'].median()
+    binned['fluxerr'] = (
+        np.where(n_points > 1, np.sqrt(np.pi / 2), 1.0)
+        * np.sqrt(detections['_var'].sum())
+        / n_points
+    )
+    binned['n_points'] = n_points
+    binned = binned.reset_index()
+
+    limits = data[~hasflux]
+    limit_groups = limits.groupby(['label', '_bin'], sort=False)
+    deepest = limits.loc[limit_groups['fluxerr'].idxmin()]
+    deepest = deepest.assign(
+        n_points=limit_groups.size()
+        .loc[list(zip(deepest['label'], deepest['_bin']))]
+        .values
+    )
 
-        return bandcolor
+    return (
+        pd.concat([binned, deepest], sort=False)
+        .drop(columns=['_bin', '_var'])
+        .sort_values('mjd')
+        .reset_index(drop=True)
+    )
 
 
-# TODO make async so that thread isn't blocked
-def photometry_plot(obj_id, user, width=600, height=300):
+def downsample_spectrum(wavelengths, fluxes, max_points):
+    """Reduce a spectrum to at most `max_points` points, keeping the minimum
+    and maximum flux of each of `max_points // 2` consecutive runs of
+    points, so that features narrower than a run (at screen resolution,
+    a pixel) are preserved.
+
+    Returns
+    -------
+    (numpy.ndarray, numpy.ndarray)
+        The downsampled wavelengths and fluxes, in their original order.
+    """
+    wavelengths = np.asarray(wavelengths)
+    fluxes = np.asarray(fluxes)
+    n_runs = max(1, max_points // 2)
+    if len(fluxes) <= max_points:
+        return wavelengths, fluxes
+
+    # Pad with NaN so that the points split into `n_runs` runs of equal
+    # length (NaNs are ignored by nanargmin/nanargmax)
+    run_length = -(-len(fluxes) // n_runs)
+    padded = np.full(n_runs * run_length, np.nan)
+    padded[: len(fluxes)] = fluxes
+    runs = padded.reshape(n_runs, run_length)
+    valid = ~np.all(np.isnan(runs), axis=1)
+    offsets = np.arange(n_runs)[valid] * run_length
+    keep = np.unique(
+        np.concatenate(
+            [
+                offsets + np.nanargmin(runs[valid], axis=1),
+                offsets + np.nanargmax(runs[valid], axis=1),
+            ]
+        )
+    )
+    return wavelengths[keep], fluxes[keep]
+
+
+def photometry_plot(obj_id, group_ids, width=600, height=300, max_points=None):
     """Create scatter plot of photometry for object.
     Parameters
     ----------
     obj_id : str
         ID of Obj to be plotted.
+    group_ids : list of int
+        IDs of the groups whose photometry is plotted (those accessible to
+        the requesting user).
+    max_points : int, optional
+        If the object has more photometry points than this, the light
+        curves are downsampled to about this many points (see
+        `downsample_photometry`).
     Returns
     -------
     (str, str)
@@ -200,21 +400,23 @@ def photometry_plot(obj_id, user, width=600, height=300):
         .join(Instrument, Instrument.id == Photometry.instrument_id)
         .join(Telescope, Telescope.id == Instrument.telescope_id)
         .filter(Photometry.obj_id == obj_id)
-        .filter(
-            Photometry.groups.any(Group.id.in_([g.id for g in user.accessible_groups]))
-        )
+        .filter(Photometry.groups.any(Group.id.in_(group_ids)))
         .statement,
         DBSession().bind,
     )
 
     if data.empty:
-        return None, None, None
+        return None, None
 
-    data['color'] = [get_color(f) for f in data['filter']]
+    data['color'] = bandpass_colors(data['filter'])
     data['label'] = [
         f'{i} {f}-band' for i, f in zip(data['instrument'], data['filter'])
     ]
 
+    n_original_points = len(data)
+    if max_points is not None:
+        data = downsample_photometry(data, max_points)
+
     data['zp'] = PHOT_ZP
     data['magsys'] = 'ab'
     data['alpha'] = 1.0
@@ -252,24 +454,37 @@ def photometry_plot(obj_id, user, width=600, height=300):
     lower = np.min(fdata['flux']) * 0.95
     upper = np.max(fdata['flux']) * 1.05
 
+    title = None
+    if len(data) < n_original_points:
+        title = (
+            f'{n_original_points} points, binned to {len(data)}; '
+            'query the photometry by MJD range for full resolution'
+        )
+
     plot = figure(
         plot_width=width,
         plot_height=height,
         active_drag='box_zoom',
         tools='box_zoom,wheel_zoom,pan,reset,save',
         y_range=(lower, upper),
+        title=title,
     )
 
     imhover = HoverTool(tooltips=tooltip_format)
     plot.add_tools(imhover)
 
     model_dict = {}
+    stack_sources = []
 
     for i, (label, sdf) in enumerate(split):
 
         # for the flux plot, we only show things that have a flux value
         df = sdf[sdf['hasflux']]
 
+        # the stacked light curves shown for each binsize slider value
+        stack_sources.append(ColumnDataSource(data=stacked_series(df)))
+        model_dict[f'stacks{i}'] = stack_sources[-1]
+
         key = f'obs{i}'
         model_dict[key] = plot.scatter(
             x='mjd',
@@ -309,16 +524,7 @@ def photometry_plot(obj_id, user, width=600, height=300):
         imhover.renderers.append(model_dict[key])
 
         key = 'obserr' + str(i)
-        y_err_x = []
-        y_err_y = []
-
-        for d, ro in df.iterrows():
-            px = ro['mjd']
-            py = ro['flux']
-            err = ro['fluxerr']
-
-            y_err_x.append((px, px))
-            y_err_y.append((py - err, py + err))
+        y_err_x, y_err_y = error_bar_segments(df['mjd'], df['flux'], df['fluxerr'])
 
         model_dict[key] = plot.multi_line(
             xs='xs',
@@ -359,7 +565,13 @@ def photometry_plot(obj_id, user, width=600, height=300):
         ).read(),
     )
 
-    slider = Slider(start=0.0, end=15.0, value=0.0, step=1.0, title='Binsize (days)')
+    slider = Slider(
+        start=0.0,
+        end=float(STACK_BINSIZES[-1]),
+        value=0.0,
+        step=1.0,
+        title='Binsize (days)',
+    )
 
     callback = CustomJS(
         args={'slider': slider, 'toggle': toggle, **model_dict},
@@ -367,8 +579,7 @@ def photometry_plot(obj_id, user, width=600, height=300):
             os.path.join(os.path.dirname(__file__), '../static/js/plotjs', 'stackf.js')
         )
         .read()
-        .replace('default_zp', str(PHOT_ZP))
-        .replace('detect_thresh', str(DETECT_THRESH)),
+        .replace('default_zp', str(PHOT_ZP)),
     )
 
     slider.js_on_change('value', callback)
@@ -503,16 +714,8 @@ def photometry_plot(obj_id, user, width=600, height=300):
         imhover.renderers.append(model_dict[key])
 
         key = 'obserr' + str(i)
-        y_err_x = []
-        y_err_y = []
-
-        for d, ro in df[df['obs']].iterrows():
-            px = ro['mjd']
-            py = ro['mag']
-            err = ro['magerr']
-
-            y_err_x.append((px, px))
-            y_err_y.append((py - err, py + err))
+        obs = df[df['obs']]
+        y_err_x, y_err_y = error_bar_segments(obs['mjd'], obs['mag'], obs['magerr'])
 
         model_dict[key] = plot.multi_line(
             xs='xs',
@@ -521,10 +724,7 @@ def photometry_plot(obj_id, user, width=600, height=300):
             alpha='alpha',
             source=ColumnDataSource(
                 data=dict(
-                    xs=y_err_x,
-                    ys=y_err_y,
-                    color=df[df['obs']]['color'],
-                    alpha=[1.0] * len(df[df['obs']]),
+                    xs=y_err_x, ys=y_err_y, color=obs['color'], alpha=[1.0] * len(obs),
                 )
             ),
         )
@@ -566,6 +766,8 @@ def photometry_plot(obj_id, user, width=600, height=300):
         key = f'all{i}'
         model_dict[key] = ColumnDataSource(df)
 
+        model_dict[f'stacks{i}'] = stack_sources[i]
+
         key = f'bold{i}'
         model_dict[key] = ColumnDataSource(
             df[
@@ -603,7 +805,13 @@ def photometry_plot(obj_id, user, width=600, height=300):
         ).read(),
     )
 
-    slider = Slider(start=0.0, end=15.0, value=0.0, step=1.0, title='Binsize (days)')
+    slider = Slider(
+        start=0.0,
+        end=float(STACK_BINSIZES[-1]),
+        value=0.0,
+        step=1.0,
+        title='Binsize (days)',
+    )
 
     button = Button(label="Export Bold Light Curve to CSV")
     button.callback = CustomJS(
@@ -625,8 +833,7 @@ def photometry_plot(obj_id, user, width=600, height=300):
             os.path.join(os.path.dirname(__file__), '../static/js/plotjs', 'stackm.js')
         )
         .read()
-        .replace('default_zp', str(PHOT_ZP))
-        .replace('detect_thresh', str(DETECT_THRESH)),
+        .replace('default_zp', str(PHOT_ZP)),
     )
     slider.js_on_change('value', callback)
 
@@ -639,30 +846,45 @@ def photometry_plot(obj_id, user, width=600, height=300):
     return _plot_to_json(tabs)
 
 
-# TODO make async so that thread isn't blocked
-def spectroscopy_plot(obj_id, spec_id=None):
-    """TODO normalization? should this be handled at data ingestion or plot-time?"""
+def spectroscopy_plot(obj_id, spec_id=None, max_points=None):
+    """TODO normalization? should this be handled at data ingestion or plot-time?
+
+    Spectra with more than `max_points` points are downsampled (see
+    `downsample_spectrum`)."""
     obj = Obj.query.get(obj_id)
-    spectra = Obj.query.get(obj_id).spectra
+    if obj is None:
+        return None, None
+    query = (
+        Spectrum.query.options(
+            undefer_group('data'),
+            joinedload(Spectrum.instrument).joinedload(Instrument.telescope),
+        )
+        .filter(Spectrum.obj_id == obj_id)
+        .order_by(Spectrum.observed_at)
+    )
     if spec_id is not None:
-        spectra = [spec for spec in spectra if spec.id == int(spec_id)]
+        query = query.filter(Spectrum.id == int(spec_id))
+    spectra = query.all()
     if len(spectra) == 0:
-        return None, None, None
+        return None, None
 
     color_map = dict(zip([s.id for s in spectra], viridis(len(spectra))))
-    data = pd.concat(
-        [
+    frames = []
+    for s in spectra:
+        wavelengths, fluxes = s.wavelengths, s.fluxes
+        if max_points is not None:
+            wavelengths, fluxes = downsample_spectrum(wavelengths, fluxes, max_points)
+        frames.append(
             pd.DataFrame(
                 {
-                    'wavelength': s.wavelengths,
-                    'flux': s.fluxes,
+                    'wavelength': wavelengths,
+                    'flux': fluxes,
                     'id': s.id,
                     'instrument': s.instrument.telescope.nickname,
                 }
             )
-            for i, s in enumerate(spectra)
-        ]
-    )
+        )
+    data = pd.concat(frames)
     split = data.groupby('id')
     hover = HoverTool(
         tooltips=[('wavelength', '$x'), ('flux', '$y'), ('instrument', '@instrument')]
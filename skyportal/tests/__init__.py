@@ -8,7 +8,15 @@ from baselayer.app.env import load_env
 IS_CI_BUILD = "TRAVIS" in os.environ or "GITHUB_ACTIONS" in os.environ
 
 
-def api(method, endpoint, data=None, host=None, token=None, raw_response=False):
+def api(
+    method,
+    endpoint,
+    data=None,
+    host=None,
+    token=None,
+    raw_response=False,
+    headers=None,
+):
     """Make a SkyPortal API call.
 
     Parameters
@@ -28,6 +36,8 @@ def api(method, endpoint, data=None, host=None, token=None, raw_response=False):
         `Authorization` header.
     raw_response : bool
         Return the response object, instead of the status code and parsed json.
+    headers : dict
+        Additional request headers.
 
     Returns
     -------
@@ -40,7 +50,9 @@ def api(method, endpoint, data=None, host=None, token=None, raw_response=False):
         env, cfg = load_env()
         host = f'http://localhost:{cfg["ports.app"]}'
     url = urllib.parse.urljoin(host, f'/api/{endpoint}')
-    headers = {'Authorization': f'token {token}'} if token else None
+    headers = dict(headers or {})
+    if token:
+        headers['Authorization'] = f'token {token}'
     response = requests.request(method, url, json=data, headers=headers)
 
     if raw_response:
@@ -0,0 +1,29 @@
+from skyportal.tests import api
+
+
+def test_source_id_autocomplete(view_only_token, public_source):
+    partial_id = public_source.id[2:10]
+    status, data = api(
+        'GET', f'internal/autocomplete/sources?q={partial_id}', token=view_only_token
+    )
+    assert status == 200
+    assert data['status'] == 'success'
+    assert public_source.id in data['data']
+
+    status, data = api(
+        'GET',
+        f'internal/autocomplete/sources?q={public_source.id[:8]}&limit=1',
+        token=view_only_token,
+    )
+    assert status == 200
+    assert data['data'] == [public_source.id]
+
+
+def test_source_id_autocomplete_no_access(view_only_token, public_source_group2):
+    status, data = api(
+        'GET',
+        f'internal/autocomplete/sources?q={public_source_group2.id}',
+        token=view_only_token,
+    )
+    assert status == 200
+    assert data['data'] == []
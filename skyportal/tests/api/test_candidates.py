@@ -9,6 +9,33 @@ def test_candidate_list(view_only_token, public_candidate):
     assert data["status"] == "success"
 
 
+def test_candidate_list_sparse_fields(view_only_token, public_candidate):
+    status, data = api(
+        "GET",
+        "candidates?include=ra,dec,last_detected&numPerPage=100",
+        token=view_only_token,
+    )
+    assert status == 200
+    assert all(
+        set(c.keys()) == {"id", "ra", "dec", "last_detected"}
+        for c in data["data"]["candidates"]
+    )
+    assert public_candidate.id in [c["id"] for c in data["data"]["candidates"]]
+
+    status, data = api(
+        "GET", "candidates?exclude=altdata,thumbnails", token=view_only_token
+    )
+    assert status == 200
+    candidate = data["data"]["candidates"][0]
+    assert "altdata" not in candidate
+    assert "thumbnails" not in candidate
+    assert all(k in candidate for k in ["ra", "dec", "is_source", "last_detected"])
+
+    status, data = api("GET", "candidates?include=not_a_field", token=view_only_token)
+    assert status == 400
+    assert "Invalid field(s)" in data["message"]
+
+
 def test_token_user_retrieving_candidate(view_only_token, public_candidate):
     status, data = api(
         "GET", f"candidates/{public_candidate.id}", token=view_only_token
@@ -1,4 +1,8 @@
+import json
+import uuid
+
 from skyportal.tests import api
+from skyportal.tests.fixtures import InstrumentFactory, TelescopeFactory
 
 
 def test_token_user_add_new_observing_run(
@@ -138,3 +142,140 @@ def test_unauthorized_user_modify_unowned_observing_run(
 
     assert status == 400
     assert data['status'] == 'error'
+
+
+def test_observing_run_ephemeris(lris, upload_data_token, red_transients_group):
+    run_details = {
+        'instrument_id': lris.id,
+        'pi': 'Danny Goldstein',
+        'observers': 'D. Goldstein, P. Nugent',
+        'group_id': red_transients_group.id,
+        'calendar_date': '2020-02-16',
+    }
+
+    status, data = api(
+        'POST', 'observing_run', data=run_details, token=upload_data_token
+    )
+    assert status == 200
+    run_id = data['data']['id']
+
+    status, data = api('GET', f'observing_run/{run_id}', token=upload_data_token)
+    assert status == 200
+    ephemeris = data['data']['ephemeris']
+    # Sunset on Maunakea on 2020-02-16 (local) is at about 04:30 UTC
+    assert ephemeris['sunset_utc'].startswith('2020-02-17T04')
+    events = [
+        'sunset_utc',
+        'twilight_evening_nautical_utc',
+        'twilight_evening_astronomical_utc',
+        'twilight_morning_astronomical_utc',
+        'twilight_morning_nautical_utc',
+        'sunrise_utc',
+    ]
+    times = [ephemeris[event] for event in events]
+    assert times == sorted(times)
+
+    status, data = api('GET', 'observing_run', token=upload_data_token)
+    assert status == 200
+    run = next(r for r in data['data'] if r['id'] == run_id)
+    assert run['ephemeris'] == ephemeris
+
+
+def test_observing_run_midnight_sun(upload_data_token, red_transients_group):
+    telescope = TelescopeFactory(
+        name=f'Polar telescope_{uuid.uuid4()}', lat=80.0, lon=15.0, elevation=10.0
+    )
+    instrument = InstrumentFactory(telescope=telescope)
+    run_details = {
+        'instrument_id': instrument.id,
+        'pi': 'Danny Goldstein',
+        'observers': 'D. Goldstein, P. Nugent',
+        'group_id': red_transients_group.id,
+        'calendar_date': '2020-06-21',
+    }
+
+    status, data = api(
+        'POST', 'observing_run', data=run_details, token=upload_data_token
+    )
+    assert status == 200
+    run_id = data['data']['id']
+
+    # The Sun neither sets nor rises; such runs are listed last
+    status, data = api('GET', 'observing_run', token=upload_data_token)
+    assert status == 200
+    run = next(r for r in data['data'] if r['id'] == run_id)
+    assert run['ephemeris']['sunset_utc'] is None
+    assert run['ephemeris']['sunrise_utc'] is None
+    no_sunrise = [r['ephemeris']['sunrise_utc'] is None for r in data['data']]
+    assert no_sunrise == sorted(no_sunrise)
+
+
+def test_observing_run_starlist(
+    red_transients_run, public_source, manage_sources_token, upload_data_token
+):
+    status, data = api(
+        'PUT',
+        f'sources/{public_source.id}',
+        data={'ra': 234.22, 'dec': -22.33},
+        token=manage_sources_token,
+    )
+    assert status == 200
+
+    status, data = api(
+        'POST',
+        'assignment',
+        data={
+            'run_id': red_transients_run.id,
+            'obj_id': public_source.id,
+            'priority': '3',
+        },
+        token=upload_data_token,
+    )
+    assert status == 200
+    assignment_id = data['data']['id']
+
+    obstime = '2020-02-17T10:00:00'
+    status, data = api(
+        'GET',
+        f'observing_run/{red_transients_run.id}/starlist'
+        f'?facility=P200&how_many=1&obstime={obstime}',
+        token=upload_data_token,
+    )
+    assert status == 200
+    assert data['data']['facility'] == 'P200'
+    target = data['data']['targets'][0]
+    assert target['assignment_id'] == assignment_id
+    assert target['obj_id'] == public_source.id
+    assert target['noffsets'] == 1
+
+    # Same offsets as for the source on its own
+    status, source_data = api(
+        'GET',
+        f'sources/{public_source.id}/offsets'
+        f'?facility=P200&how_many=1&obstime={obstime}',
+        token=upload_data_token,
+    )
+    assert status == 200
+    assert target['starlist_info'] == source_data['data']['starlist_info']
+    assert data['data']['starlist_str'] == source_data['data']['starlist_str']
+
+    response = api(
+        'GET',
+        f'observing_run/{red_transients_run.id}/starlist'
+        f'?facility=P200&how_many=1&obstime={obstime}&stream=true',
+        token=upload_data_token,
+        raw_response=True,
+    )
+    assert response.status_code == 200
+    assert response.headers['Content-Type'] == 'application/x-ndjson'
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line['target'] for line in lines[:-1]] == data['data']['targets']
+    assert lines[-1]['status'] == 'success'
+    assert lines[-1]['data']['starlist_str'] == data['data']['starlist_str']
+
+    status, data = api(
+        'GET',
+        f'observing_run/{red_transients_run.id}/starlist?facility=Palomar',
+        token=upload_data_token,
+    )
+    assert status == 400
@@ -1026,3 +1026,83 @@ def test_token_user_big_post(
     )
     assert status == 200
     assert data['status'] == 'success'
+
+
+def test_get_photometry_by_mjd_range(
+    upload_data_token, public_source, public_group, ztf_camera
+):
+    status, data = api(
+        'POST',
+        'photometry',
+        data={
+            'obj_id': str(public_source.id),
+            'mjd': [59000.0, 59001.0, 59002.0],
+            'instrument_id': ztf_camera.id,
+            'flux': [12.24, 13.1, 14.2],
+            'fluxerr': [0.031, 0.032, 0.033],
+            'zp': 25.0,
+            'magsys': 'ab',
+            'filter': 'ztfg',
+            'group_ids': [public_group.id],
+        },
+        token=upload_data_token,
+    )
+    assert status == 200
+
+    status, data = api(
+        'GET',
+        f'sources/{public_source.id}/photometry?minMJD=59000.5&maxMJD=59001.5',
+        token=upload_data_token,
+    )
+    assert status == 200
+    assert [p['mjd'] for p in data['data']] == [59001.0]
+
+    status, data = api(
+        'GET',
+        f'sources/{public_source.id}/photometry?minMJD=yesterday',
+        token=upload_data_token,
+    )
+    assert status == 400
+
+
+def test_get_stacked_photometry(
+    upload_data_token, public_source, public_group, ztf_camera
+):
+    status, data = api(
+        'POST',
+        'photometry',
+        data={
+            'obj_id': str(public_source.id),
+            'mjd': [59100.1, 59100.2, 59100.3],
+            'instrument_id': ztf_camera.id,
+            'flux': [10.0, 12.0, 14.0],
+            'fluxerr': [1.0, 1.0, 1.0],
+            'zp': 23.9,
+            'magsys': 'ab',
+            'filter': 'ztfr',
+            'group_ids': [public_group.id],
+        },
+        token=upload_data_token,
+    )
+    assert status == 200
+
+    status, data = api(
+        'GET',
+        f'sources/{public_source.id}/photometry'
+        '?minMJD=59100&maxMJD=59101&binsize=1&format=flux',
+        token=upload_data_token,
+    )
+    assert status == 200
+    assert len(data['data']) == 1
+    point = data['data'][0]
+    assert point['stacked'] and point['n_points'] == 3
+    np.testing.assert_allclose(point['flux'], 12.0)
+    np.testing.assert_allclose(point['fluxerr'], 1 / np.sqrt(3))
+    np.testing.assert_allclose(point['mjd'], 59100.2)
+
+    status, data = api(
+        'GET',
+        f'sources/{public_source.id}/photometry?binsize=-1',
+        token=upload_data_token,
+    )
+    assert status == 400
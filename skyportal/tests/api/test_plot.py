@@ -0,0 +1,142 @@
+import numpy as np
+
+from skyportal.tests import api
+from skyportal.tests.fixtures import ObservingRunFactory
+
+
+def test_photometry_plot_reflects_new_photometry(
+    upload_data_token, public_source, public_group, ztf_camera
+):
+    status, data = api(
+        'GET', f'internal/plot/photometry/{public_source.id}', token=upload_data_token
+    )
+    assert status == 200
+    original_docs_json = data['data']['docs_json']
+
+    status, data = api(
+        'GET', f'internal/plot/photometry/{public_source.id}', token=upload_data_token
+    )
+    assert status == 200
+    assert data['data']['docs_json'] == original_docs_json
+
+    status, data = api(
+        'POST',
+        'photometry',
+        data={
+            'obj_id': str(public_source.id),
+            'mjd': 58001.0,
+            'instrument_id': ztf_camera.id,
+            'flux': 12.24,
+            'fluxerr': 0.031,
+            'zp': 25.0,
+            'magsys': 'ab',
+            'filter': 'ztfg',
+            'group_ids': [public_group.id],
+        },
+        token=upload_data_token,
+    )
+    assert status == 200
+
+    status, data = api(
+        'GET', f'internal/plot/photometry/{public_source.id}', token=upload_data_token
+    )
+    assert status == 200
+    assert data['data']['docs_json'] != original_docs_json
+
+    status, data = api('GET', 'sysinfo', token=upload_data_token)
+    assert status == 200
+    assert 'hits' in data['data']['caches']['photometry_plot']
+
+
+def test_plot_custom_models_served_by_reference(upload_data_token, public_source):
+    status, data = api(
+        'GET', f'internal/plot/photometry/{public_source.id}', token=upload_data_token
+    )
+    assert status == 200
+    assert 'custom_model_js' not in data['data']
+    model_url = data['data']['custom_model_url']
+    assert model_url.startswith('/api/internal/plot/models/')
+
+    response = api('GET', model_url.split('/api/', 1)[1], raw_response=True)
+    assert response.status_code == 200
+    assert 'CheckboxWithLegendGroup' in response.text
+    assert 'immutable' in response.headers['Cache-Control']
+
+    response = api('GET', 'internal/plot/models/0123abcd.js', raw_response=True)
+    assert response.status_code == 404
+
+
+def test_spectroscopy_plot_full_resolution(upload_data_token, public_source):
+    for query in ['', '?fullResolution=true']:
+        status, data = api(
+            'GET',
+            f'internal/plot/spectroscopy/{public_source.id}{query}',
+            token=upload_data_token,
+        )
+        assert status == 200
+        assert data['data']['docs_json'] is not None
+
+    # Spectrum data arrays are still returned by the spectra API
+    status, data = api(
+        'GET', f'sources/{public_source.id}/spectra', token=upload_data_token
+    )
+    assert status == 200
+    assert len(data['data'][0]['wavelengths']) > 0
+
+
+def test_run_airmass_curves(red_transients_run, public_source, upload_data_token):
+    status, data = api(
+        'POST',
+        'assignment',
+        data={
+            'run_id': red_transients_run.id,
+            'obj_id': public_source.id,
+            'priority': '3',
+        },
+        token=upload_data_token,
+    )
+    assert status == 200
+    assignment_id = data['data']['id']
+
+    status, data = api(
+        'GET',
+        f'internal/plot/airmass/run/{red_transients_run.id}',
+        token=upload_data_token,
+    )
+    assert status == 200
+    curve = data['data'][str(assignment_id)]
+
+    status, data = api(
+        'GET', f'internal/plot/airmass/{assignment_id}', token=upload_data_token
+    )
+    assert status == 200
+    assert [p['time'] for p in curve] == [p['time'] for p in data['data']]
+    np.testing.assert_allclose(
+        [p['airmass'] for p in curve], [p['airmass'] for p in data['data']]
+    )
+
+    status, data = api(
+        'GET',
+        f'internal/plot/airmass/run/{red_transients_run.id}?resolution=20',
+        token=upload_data_token,
+    )
+    assert status == 200
+    assert len(data['data'][str(assignment_id)]) == 20
+
+    status, data = api(
+        'GET',
+        f'internal/plot/airmass/run/{red_transients_run.id}?resolution=1',
+        token=upload_data_token,
+    )
+    assert status == 400
+
+
+def test_run_airmass_curves_midnight_sun(upload_data_token):
+    run = ObservingRunFactory(
+        instrument__telescope__lat=80.0, calendar_date='2020-06-21'
+    )
+    status, data = api(
+        'GET', f'internal/plot/airmass/run/{run.id}', token=upload_data_token
+    )
+    assert status == 400
+    assert 'does not both set and rise' in data['message']
@@ -0,0 +1,29 @@
+from skyportal.tests import api
+
+
+def test_scanning_bundle(view_only_token, public_candidate):
+    status, data = api(
+        "GET", "internal/scanning_bundle?numPerPage=100", token=view_only_token
+    )
+    assert status == 200
+    assert data["status"] == "success"
+    candidate = next(
+        c for c in data["data"]["candidates"] if c["id"] == public_candidate.id
+    )
+    assert all(
+        k in candidate
+        for k in ["thumbnails", "is_source", "last_detected", "passing_group_ids"]
+    )
+    photometry = candidate["photometry"]
+    summary = candidate["photometry_summary"]
+    assert len(photometry["mjd"]) == summary["n_points"] == len(photometry["mag"])
+    assert summary["n_points"] == len(public_candidate.photometry)
+    assert photometry["mjd"] == sorted(photometry["mjd"])
+
+
+def test_scanning_bundle_page_out_of_range(view_only_token, public_candidate):
+    status, data = api(
+        "GET", "internal/scanning_bundle?pageNumber=100000", token=view_only_token
+    )
+    assert status == 400
+    assert "Page number out of range" in data["message"]
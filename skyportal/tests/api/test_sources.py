@@ -1,4 +1,5 @@
 import pytest
+import numpy as np
 import numpy.testing as npt
 import uuid
 from skyportal.tests import api
@@ -10,6 +11,23 @@ def test_source_list(view_only_token):
     assert data['status'] == 'success'
 
 
+def test_source_list_sparse_fields(view_only_token, public_source):
+    status, data = api(
+        'GET', 'sources?include=ra,dec,last_detected', token=view_only_token
+    )
+    assert status == 200
+    assert all(
+        set(s.keys()) == {'id', 'ra', 'dec', 'last_detected'}
+        for s in data['data']['sources']
+    )
+    assert public_source.id in [s['id'] for s in data['data']['sources']]
+
+    status, data = api(
+        'GET', 'sources?include=ra&exclude=altdata', token=view_only_token
+    )
+    assert status == 400
+
+
 def test_token_user_retrieving_source(view_only_token, public_source):
     status, data = api('GET', f'sources/{public_source.id}', token=view_only_token)
     assert status == 200
@@ -177,3 +195,137 @@ def test_finder(manage_sources_token, public_source):
         token=manage_sources_token,
     )
     assert status == 400
+
+
+@pytest.mark.xfail(strict=False)
+def test_finder_cache(manage_sources_token, public_source):
+    status, data = api(
+        'PUT',
+        f'sources/{public_source.id}',
+        data={'ra': 234.22, 'dec': -22.33},
+        token=manage_sources_token,
+    )
+    assert status == 200
+
+    endpoint = f'sources/{public_source.id}/finder?imsize=2&obstime='
+    response = api(
+        'GET',
+        endpoint + '2020-11-01T10:12:13',
+        token=manage_sources_token,
+        raw_response=True,
+    )
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+
+    # Observation times in the same window get the same chart
+    response = api(
+        'GET',
+        endpoint + '2020-11-01T10:45:00',
+        token=manage_sources_token,
+        raw_response=True,
+        headers={'If-None-Match': etag},
+    )
+    assert response.status_code == 304
+    assert response.content == b''
+
+    # Moving the source invalidates its charts
+    status, data = api(
+        'PUT',
+        f'sources/{public_source.id}',
+        data={'ra': 234.23, 'dec': -22.33},
+        token=manage_sources_token,
+    )
+    assert status == 200
+    response = api(
+        'GET',
+        endpoint + '2020-11-01T10:12:13',
+        token=manage_sources_token,
+        raw_response=True,
+        headers={'If-None-Match': etag},
+    )
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+
+def test_filter_sources_by_indexed_altdata(
+    upload_data_token, view_only_token, public_group
+):
+    obj_id = str(uuid.uuid4())
+    tns_name = f'2020{uuid.uuid4().hex[:6]}'
+    status, data = api(
+        'POST',
+        'sources',
+        data={
+            'id': obj_id,
+            'ra': 234.22,
+            'dec': -22.33,
+            'altdata': {'simbad': {'class': 'RRLyr'}, 'tns': {'name': tns_name}},
+            'transient': False,
+            'ra_dis': 2.3,
+            'group_ids': [public_group.id],
+        },
+        token=upload_data_token,
+    )
+    assert status == 200
+
+    status, data = api(
+        'GET', f'sources?altdata.tns_name={tns_name}', token=view_only_token
+    )
+    assert status == 200
+    assert [s['id'] for s in data['data']['sources']] == [obj_id]
+
+    status, data = api(
+        'GET',
+        f'sources?altdata.simbad_class=rrlyr&hasTNSname=true&sourceID={obj_id}',
+        token=view_only_token,
+    )
+    assert status == 200
+    assert [s['id'] for s in data['data']['sources']] == [obj_id]
+
+    status, data = api('GET', 'sources?altdata.nonexistent=1', token=view_only_token)
+    assert status == 400
+    assert 'Invalid altdata filter' in data['message']
+
+
+def test_crossmatch_sources(manage_sources_token, view_only_token, public_source):
+    status, data = api(
+        'PUT',
+        f'sources/{public_source.id}',
+        data={'ra': 234.22, 'dec': -22.33},
+        token=manage_sources_token,
+    )
+    assert status == 200
+
+    status, data = api(
+        'POST',
+        'crossmatch',
+        data={
+            'ra': [12.0, 234.22 + 1 / 3600, 234.22],
+            'dec': [-22.33, -22.33, -22.33],
+            'radius': [1 / 60, 5 / 3600, 0.5 / 3600],
+        },
+        token=view_only_token,
+    )
+    assert status == 200
+    assert data['status'] == 'success'
+    matches = data['data']
+    assert len(matches['position_index']) == len(matches['obj_id'])
+    matched_positions = [
+        i
+        for i, obj_id in zip(matches['position_index'], matches['obj_id'])
+        if obj_id == public_source.id
+    ]
+    assert matched_positions == [1, 2]
+    sep = matches['separation'][matches['obj_id'].index(public_source.id)]
+    npt.assert_allclose(sep, np.cos(np.deg2rad(22.33)), rtol=1e-3)
+
+
+def test_crossmatch_sources_invalid_input(view_only_token):
+    status, data = api(
+        'POST',
+        'crossmatch',
+        data={'ra': [1.0, 2.0], 'dec': [1.0], 'radius': 1.0},
+        token=view_only_token,
+    )
+    assert status == 400
+    assert data['status'] == 'error'
@@ -131,3 +131,36 @@ def test_token_user_delete_telescope(upload_data_token, manage_sources_token):
 
     status, data = api('GET', f'telescope/{telescope_id}', token=upload_data_token)
     assert status == 400
+
+
+def test_telescope_timezone_follows_coordinates(
+    upload_data_token, manage_sources_token
+):
+    name = str(uuid.uuid4())
+    post_data = {
+        'name': name,
+        'nickname': name,
+        'lat': 33.3563,
+        'lon': -116.8650,
+        'elevation': 1712.0,
+        'diameter': 5.1,
+    }
+    status, data = api('POST', 'telescope', data=post_data, token=upload_data_token)
+    assert status == 200
+    telescope_id = data['data']['id']
+
+    status, data = api('GET', f'telescope/{telescope_id}', token=upload_data_token)
+    assert status == 200
+    assert data['data']['timezone'] == 'America/Los_Angeles'
+
+    status, data = api(
+        'PUT',
+        f'telescope/{telescope_id}',
+        data={**post_data, 'lat': 19.8260, 'lon': -155.4747},
+        token=manage_sources_token,
+    )
+    assert status == 200
+
+    status, data = api('GET', f'telescope/{telescope_id}', token=upload_data_token)
+    assert status == 200
+    assert data['data']['timezone'] == 'Pacific/Honolulu'
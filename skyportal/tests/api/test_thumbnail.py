@@ -1,8 +1,21 @@
 import os
+import io
 import uuid
 import base64
+import numpy as np
+from PIL import Image
 from skyportal.tests import api
 from skyportal.models import DBSession, Obj, Thumbnail
+from skyportal.handlers.api.thumbnail import store
+
+
+def random_png():
+    """A base64-encoded PNG image unique to the calling test, so that no
+    other thumbnail shares its stored file."""
+    image = Image.fromarray(np.random.randint(0, 256, (32, 32), dtype=np.uint8))
+    buf = io.BytesIO()
+    image.save(buf, format='PNG')
+    return buf.getvalue()
 
 
 def test_token_user_post_get_thumbnail(upload_data_token, public_group, ztf_camera):
@@ -288,6 +301,23 @@ def test_cannot_post_thumbnail_invalid_ttype(
     assert 'is not among the defined enum values' in data['message']
 
 
+def test_invalid_thumbnail_file_not_kept(upload_data_token, public_source):
+    png = random_png()
+    status, data = api(
+        'POST',
+        'thumbnail',
+        data={
+            'obj_id': public_source.id,
+            'data': base64.b64encode(png),
+            'ttype': 'invalid_ttype',
+        },
+        token=upload_data_token,
+    )
+    assert status == 400
+    # The image is stored before the thumbnail is added, but is not kept
+    assert not store.exists(store.file_uri(png))
+
+
 def test_cannot_post_thumbnail_invalid_image_type(
     upload_data_token, public_group, ztf_camera
 ):
@@ -448,3 +478,78 @@ def test_cannot_post_thumbnail_invalid_file_type(
     assert status == 400
     assert data['status'] == 'error'
     assert 'cannot identify image file' in data['message']
+
+
+def test_thumbnail_files_shared_and_released(
+    upload_data_token, manage_sources_token, public_group, ztf_camera
+):
+    png = base64.b64encode(random_png())
+
+    thumbnail_ids = []
+    photometry_ids = []
+    for _ in range(2):
+        obj_id = str(uuid.uuid4())
+        status, data = api(
+            'POST',
+            'sources',
+            data={
+                'id': obj_id,
+                'ra': 234.22,
+                'dec': -22.33,
+                'redshift': 3,
+                'transient': False,
+                'ra_dis': 2.3,
+                'group_ids': [public_group.id],
+            },
+            token=upload_data_token,
+        )
+        assert status == 200
+
+        status, data = api(
+            'POST',
+            'photometry',
+            data={
+                'obj_id': obj_id,
+                'mjd': 58000.0,
+                'instrument_id': ztf_camera.id,
+                'flux': 12.24,
+                'fluxerr': 0.031,
+                'zp': 25.0,
+                'magsys': 'ab',
+                'filter': 'ztfg',
+                'group_ids': [public_group.id],
+            },
+            token=upload_data_token,
+        )
+        assert status == 200
+        photometry_ids.append(data['data']['ids'][0])
+
+        status, data = api(
+            'POST',
+            'thumbnail',
+            data={'obj_id': obj_id, 'data': png, 'ttype': 'new'},
+            token=upload_data_token,
+        )
+        assert status == 200
+        thumbnail_ids.append(data['data']['id'])
+
+    # Both thumbnails use the same file
+    thumbnails = [DBSession.query(Thumbnail).get(i) for i in thumbnail_ids]
+    file_uri = thumbnails[0].file_uri
+    assert thumbnails[1].file_uri == file_uri
+    assert thumbnails[0].public_url == thumbnails[1].public_url
+    assert os.path.exists(file_uri)
+
+    # The file is kept while a thumbnail uses it...
+    status, data = api(
+        'DELETE', f'thumbnail/{thumbnail_ids[0]}', token=manage_sources_token
+    )
+    assert status == 200
+    assert os.path.exists(file_uri)
+
+    # ...and deleted with the last one (here, along with its photometry)
+    status, data = api(
+        'DELETE', f'photometry/{photometry_ids[1]}', token=manage_sources_token
+    )
+    assert status == 200
+    assert not os.path.exists(file_uri)
@@ -0,0 +1,108 @@
+import multiprocessing
+import time
+
+from skyportal.utils.cache import DiskCache, LRUCache
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+    assert 'b' not in cache
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert cache.get('b') is None
+    assert cache.stats == {'size': 2, 'maxsize': 2, 'hits': 3, 'misses': 1}
+
+
+def test_lru_cache_ttl():
+    cache = LRUCache(maxsize=2, ttl=0.05)
+    cache.set('a', 1)
+    assert cache.get('a') == 1
+    time.sleep(0.1)
+    assert 'a' not in cache
+    assert cache.get('a', 'default') == 'default'
+
+
+def test_lru_cache_invalidate_where():
+    cache = LRUCache()
+    for key in [('x', 1), ('x', 2), ('y', 1)]:
+        cache.set(key, key)
+    cache.invalidate_where(lambda key: key[0] == 'x')
+    assert len(cache) == 1
+    assert ('y', 1) in cache
+
+
+def test_disk_cache_evicts_least_recently_used(tmp_path):
+    cache = DiskCache(tmp_path, max_entries=2)
+    cache.set('a', b'1')
+    cache.set('b', b'2')
+    assert cache.get('a') == b'1'
+    cache.set('c', b'3')
+    assert 'b' not in cache
+    assert cache.get('a') == b'1'
+    assert cache.get('c') == b'3'
+    assert cache.get('b') is None
+    assert cache.stats == {
+        'size': 2,
+        'maxsize': 2,
+        'bytes': 2,
+        'max_bytes': None,
+        'hits': 3,
+        'misses': 1,
+        'evictions': 1,
+    }
+    # Evicted and replaced values' files are removed
+    cache.set('a', b'4')
+    assert cache.get('a') == b'4'
+    assert len([f for f in tmp_path.iterdir() if f.suffix != '.sqlite']) == 2
+
+
+def test_disk_cache_size_bound(tmp_path):
+    cache = DiskCache(tmp_path, max_size=10)
+    cache.set('a', b'x' * 4)
+    cache.set('b', b'x' * 4)
+    cache.get('a')
+    cache.set('c', b'x' * 4)
+    assert sorted(cache.keys()) == ['a', 'c']
+    assert cache.stats['bytes'] == 8
+
+    # Values larger than the cache are not kept
+    cache.set('d', b'x' * 11)
+    assert len(cache) == 0
+
+
+def test_disk_cache_missing_file(tmp_path):
+    cache = DiskCache(tmp_path)
+    cache.set('a', b'1')
+    for f in tmp_path.iterdir():
+        if not f.name.startswith('index.sqlite'):
+            f.unlink()
+    assert cache.get('a', b'default') == b'default'
+    assert 'a' not in cache
+
+
+def _use_disk_cache(path, worker):
+    cache = DiskCache(path, max_entries=5)
+    for i in range(50):
+        key = str((worker + i) % 8)
+        value = cache.get(key)
+        if value is None:
+            cache.set(key, key.encode() * 1000)
+        else:
+            assert value == key.encode() * 1000
+
+
+def test_disk_cache_shared_between_processes(tmp_path):
+    with multiprocessing.Pool(4) as pool:
+        pool.starmap(_use_disk_cache, [(str(tmp_path), worker) for worker in range(4)])
+
+    cache = DiskCache(tmp_path, max_entries=5)
+    stats = cache.stats
+    assert stats['size'] <= 5
+    assert stats['hits'] + stats['misses'] == 200
+    assert stats['hits'] > 0
+    files = [f for f in tmp_path.iterdir() if not f.name.startswith('index.sqlite')]
+    assert len(files) == stats['size']
@@ -0,0 +1,93 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import BrokenExecutor
+
+import pytest
+
+from skyportal.utils.executors import BoundedExecutor, ExecutorSaturated
+
+
+def wait_until_idle(executor, timeout=5):
+    # Futures' results are available just before their done callbacks, which
+    # update the executor's counts, have run
+    deadline = time.monotonic() + timeout
+    while executor.stats['in_flight'] > 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_bounded_executor_rejects_when_saturated():
+    release = threading.Event()
+    torn_down = []
+    executor = BoundedExecutor(
+        max_workers=1, max_queued=1, teardown=lambda: torn_down.append(True)
+    )
+
+    running = executor.submit(release.wait)
+    queued = executor.submit(lambda: 'done')
+    assert executor.stats['in_flight'] == 2
+    assert executor.stats['queued'] == 1
+
+    with pytest.raises(ExecutorSaturated):
+        executor.submit(lambda: 'rejected')
+    assert executor.stats['rejected'] == 1
+
+    release.set()
+    assert running.result(timeout=5)
+    assert queued.result(timeout=5) == 'done'
+    wait_until_idle(executor)
+    assert executor.stats['in_flight'] == 0
+    assert executor.stats['completed'] == 2
+    assert len(torn_down) == 2
+
+    # capacity is available again once tasks finish
+    assert executor.submit(lambda: 1).result(timeout=5) == 1
+
+
+def test_bounded_executor_run():
+    executor = BoundedExecutor(max_workers=2, max_queued=0)
+
+    def fail():
+        raise ValueError('failed')
+
+    async def run():
+        assert await executor.run(sum, [1, 2, 3]) == 6
+        with pytest.raises(ValueError):
+            await executor.run(fail)
+
+    asyncio.run(run())
+    wait_until_idle(executor)
+    assert executor.stats['completed'] == 1
+    assert executor.stats['failed'] == 1
+
+
+def test_bounded_process_executor():
+    executor = BoundedExecutor(max_workers=1, max_queued=0, processes=True)
+
+    running = executor.submit(time.sleep, 0.5)
+    with pytest.raises(ExecutorSaturated):
+        executor.submit(pow, 2, 10)
+    assert running.result(timeout=30) is None
+
+    wait_until_idle(executor)
+    assert executor.submit(pow, 2, 10).result(timeout=30) == 1024
+
+    with pytest.raises(ValueError):
+        BoundedExecutor(1, 0, teardown=lambda: None, processes=True)
+
+
+def test_bounded_process_executor_restarts_broken_pool():
+    executor = BoundedExecutor(max_workers=1, max_queued=1, processes=True)
+
+    # A worker process dying breaks the pool...
+    with pytest.raises(BrokenExecutor):
+        executor.submit(os._exit, 1).result(timeout=30)
+    wait_until_idle(executor)
+    assert executor.stats['failed'] == 1
+
+    # ...which is replaced when the next task is submitted
+    assert executor.submit(pow, 2, 10).result(timeout=30) == 1024
+    assert executor.stats['restarts'] == 1
+    assert executor.submit(pow, 2, 3).result(timeout=30) == 8
+    assert executor.stats['restarts'] == 1
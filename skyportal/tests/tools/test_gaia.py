@@ -0,0 +1,117 @@
+import numpy as np
+import pandas as pd
+import pytest
+from astropy import units as u
+from astropy_healpix import HEALPix
+
+from skyportal.utils.cache import DiskCache
+from skyportal.utils.gaia import (
+    COLUMNS,
+    GAIA_SOURCE_ID_FACTOR,
+    GaiaCatalog,
+    GaiaParquetBackend,
+    cell_source_id_range,
+    source_cells,
+)
+
+
+def fake_gaia_sources(ra, dec, n=2000, radius_degrees=0.2, seed=0):
+    """Random sources around (ra, dec), with source IDs encoding their
+    level-12 HEALPix cells as Gaia's do."""
+    rng = np.random.default_rng(seed)
+    ras = ra + rng.uniform(-radius_degrees, radius_degrees, n) / np.cos(np.deg2rad(dec))
+    decs = dec + rng.uniform(-radius_degrees, radius_degrees, n)
+    cells = HEALPix(nside=2 ** 12, order='nested').lonlat_to_healpix(
+        ras * u.deg, decs * u.deg
+    )
+    return pd.DataFrame(
+        {
+            'source_id': cells.astype(np.int64) * GAIA_SOURCE_ID_FACTOR + np.arange(n),
+            'ra': ras,
+            'dec': decs,
+            'ref_epoch': 2015.5,
+            'phot_rp_mean_mag': rng.uniform(8, 22, n),
+            'pmra': rng.normal(0, 5, n),
+            'pmdec': rng.normal(0, 5, n),
+            'parallax': rng.uniform(0, 2, n),
+        }
+    )
+
+
+class InMemoryBackend:
+    def __init__(self, sources, level=9):
+        self.data = sources
+        self.level = level
+        self.requested_cells = []
+
+    def sources(self, cells, mag_min, mag_max):
+        self.requested_cells.extend(cells)
+        in_cells = np.isin(source_cells(self.data['source_id'], self.level), cells)
+        mag = self.data['phot_rp_mean_mag']
+        return self.data[in_cells & (mag > mag_min) & (mag < mag_max)]
+
+
+def test_cell_source_id_ranges():
+    source_ids = fake_gaia_sources(123.0, 33.3)['source_id']
+    cells = source_cells(source_ids, 9)
+    for source_id, cell in zip(source_ids, cells):
+        low, high = cell_source_id_range(cell, 9)
+        assert low <= source_id <= high
+
+
+def test_gaia_catalog_cone_is_served_from_cache(tmp_path):
+    sources = fake_gaia_sources(123.0, 33.3)
+    backend = InMemoryBackend(sources)
+    catalog = GaiaCatalog(backend, cache=DiskCache(tmp_path))
+
+    result = catalog.cone(123.0, 33.3, 2 / 60, 10.0, 20.0)
+    assert len(backend.requested_cells) > 0
+    assert (result['dist'] <= 2 / 60).all()
+    assert result['phot_rp_mean_mag'].is_monotonic_increasing
+    assert result['phot_rp_mean_mag'].between(10.0, 20.0).all()
+
+    # Compare with a brute-force search of all the sources
+    dist = np.rad2deg(
+        np.arccos(
+            np.clip(
+                np.sin(np.deg2rad(33.3)) * np.sin(np.deg2rad(sources['dec']))
+                + np.cos(np.deg2rad(33.3))
+                * np.cos(np.deg2rad(sources['dec']))
+                * np.cos(np.deg2rad(sources['ra'] - 123.0)),
+                -1,
+                1,
+            )
+        )
+    )
+    mag = sources['phot_rp_mean_mag']
+    expected = sources[(dist <= 2 / 60) & (mag > 10.0) & (mag < 20.0)]
+    assert set(result['source_id']) == set(expected['source_id'])
+
+    # A repeated search, and one with a narrower magnitude range within the
+    # same whole magnitudes, are served from the cache
+    n_requested = len(backend.requested_cells)
+    catalog.cone(123.0, 33.3, 2 / 60, 10.0, 20.0)
+    catalog.cone(123.0, 33.3, 1 / 60, 10.5, 19.5, max_rows=5)
+    assert len(backend.requested_cells) == n_requested
+
+    # A new process (sharing the cache directory) does not query either
+    other_backend = InMemoryBackend(sources)
+    other_catalog = GaiaCatalog(other_backend, cache=DiskCache(tmp_path))
+    other_result = other_catalog.cone(123.0, 33.3, 2 / 60, 10.0, 20.0)
+    assert other_backend.requested_cells == []
+    pd.testing.assert_frame_equal(other_result, result)
+
+
+def test_gaia_parquet_backend(tmp_path):
+    pytest.importorskip('pyarrow')
+    sources = fake_gaia_sources(123.0, 33.3)
+    for cell, data in sources.groupby(source_cells(sources['source_id'], 9)):
+        data[COLUMNS].to_parquet(tmp_path / f'{cell}.parquet')
+
+    offline = GaiaCatalog(GaiaParquetBackend(str(tmp_path), level=9))
+    in_memory = GaiaCatalog(InMemoryBackend(sources))
+    result = offline.cone(123.0, 33.3, 2 / 60, 10.0, 20.0, max_rows=30)
+    assert len(result) == 30
+    pd.testing.assert_frame_equal(
+        result, in_memory.cone(123.0, 33.3, 2 / 60, 10.0, 20.0, max_rows=30)
+    )
@@ -1,10 +1,15 @@
+import numpy as np
 import pytest
 import requests
+from astropy import units as u
+from astropy.coordinates import SkyCoord
+from astropy.table import Table
+from astropy.time import Time
 from requests.exceptions import HTTPError, Timeout, ConnectionError
 
 from skyportal.utils import get_nearby_offset_stars, get_finding_chart, get_ztfref_url
 
-from skyportal.utils.offset import irsa
+from skyportal.utils.offset import irsa, select_offset_stars
 
 
 ztfref_url = irsa['url_search']
@@ -83,3 +88,61 @@ def test_get_finding_chart():
     rez = get_finding_chart(123.0, 33.3, "testSource", image_source='zomg_telescope')
     assert isinstance(rez, dict)
     assert not rez["success"]
+
+
+def test_select_offset_stars():
+    rng = np.random.default_rng(0)
+    n = 300
+    stars = Table(
+        {
+            'ra': 123.0 + rng.uniform(-0.05, 0.05, n),
+            'dec': 33.3 + rng.uniform(-0.05, 0.05, n),
+            'pmra': rng.normal(0, 20, n),
+            'pmdec': rng.normal(0, 20, n),
+            'parallax': rng.uniform(-0.5, 2, n),
+            'phot_rp_mean_mag': rng.uniform(10, 20, n),
+        }
+    )
+    obstime = Time('2020-06-01T00:00:00')
+    center = SkyCoord(123.0, 33.3, unit='deg', obstime=obstime)
+    stars['dist'] = center.separation(
+        SkyCoord(stars['ra'], stars['dec'], unit='deg')
+    ).deg
+    min_sep = 20 * u.arcsec
+
+    selected = select_offset_stars(stars, center, 18.0, min_sep, 'J2015.5')
+
+    # Compare with checking each star separately
+    all_stars = SkyCoord(stars['ra'], stars['dec'], unit='deg')
+    expected = []
+    for star in stars:
+        c = SkyCoord(
+            ra=star['ra'],
+            dec=star['dec'],
+            unit=(u.degree, u.degree),
+            pm_ra_cosdec=np.cos(np.deg2rad(star['dec'])) * star['pmra'] * u.mas / u.yr,
+            pm_dec=star['pmdec'] * u.mas / u.yr,
+            distance=min(abs(1 / star['parallax']), 10) * u.kpc,
+            obstime='J2015.5',
+        )
+        if (
+            sum(c.separation(all_stars) < min_sep) == 1
+            and star['phot_rp_mean_mag'] <= 18.0
+        ):
+            dra, ddec = c.apply_space_motion(new_obstime=obstime).spherical_offsets_to(
+                center
+            )
+            expected.append((star['dist'], dra.to(u.arcsec), ddec.to(u.arcsec)))
+    expected.sort(key=lambda e: e[0])
+
+    assert 0 < len(selected) < n
+    assert len(selected) == len(expected)
+    for (dist, _, star, dra, ddec), (exp_dist, exp_dra, exp_ddec) in zip(
+        selected, expected
+    ):
+        assert dist == exp_dist
+        assert star['dist'] == dist
+        assert abs((dra - exp_dra).to(u.arcsec).value) < 1e-6
+        assert abs((ddec - exp_ddec).to(u.arcsec).value) < 1e-6
+
+    assert select_offset_stars(stars[:0], center, 18.0, min_sep, 'J2015.5') == []
@@ -0,0 +1,142 @@
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from skyportal.plot import (
+    error_bar_segments,
+    downsample_photometry,
+    bandpass_colors,
+    compute_bandpass_color,
+    downsample_spectrum,
+)
+
+
+def iterrows_error_bar_segments(df):
+    # Reference implementation: the row-by-row loop previously used in
+    # `photometry_plot`
+    y_err_x = []
+    y_err_y = []
+    for _, ro in df.iterrows():
+        px = ro['mjd']
+        py = ro['flux']
+        err = ro['fluxerr']
+        y_err_x.append((px, px))
+        y_err_y.append((py - err, py + err))
+    return y_err_x, y_err_y
+
+
+def light_curve(n_points=20_000):
+    rng = np.random.default_rng(0)
+    return pd.DataFrame(
+        {
+            'mjd': np.sort(rng.uniform(58000, 59000, n_points)),
+            'flux': rng.normal(100, 10, n_points),
+            'fluxerr': rng.uniform(1, 5, n_points),
+            'filter': 'ztfg',
+        }
+    )
+
+
+def test_error_bar_segments():
+    df = light_curve()
+    expected_xs, expected_ys = iterrows_error_bar_segments(df)
+    xs, ys = error_bar_segments(df['mjd'], df['flux'], df['fluxerr'])
+    np.testing.assert_allclose(xs, expected_xs)
+    np.testing.assert_allclose(ys, expected_ys)
+
+
+@pytest.mark.skipif(
+    not os.environ.get('SKYPORTAL_BENCHMARK'),
+    reason='benchmarks run only with SKYPORTAL_BENCHMARK set',
+)
+def test_error_bar_segments_benchmark():
+    # Run with `SKYPORTAL_BENCHMARK=1 pytest -s` to see the timings; no
+    # speedup is asserted, as it depends on the load of the machine
+    df = light_curve()
+
+    start = time.perf_counter()
+    iterrows_error_bar_segments(df)
+    loop_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    error_bar_segments(df['mjd'], df['flux'], df['fluxerr'])
+    vectorized_time = time.perf_counter() - start
+
+    print(
+        f'\n{len(df)} error bars: iterrows {loop_time * 1e3:.1f} ms, '
+        f'vectorized {vectorized_time * 1e3:.1f} ms '
+        f'({loop_time / vectorized_time:.0f}x)'
+    )
+
+
+def test_error_bar_segments_empty():
+    xs, ys = error_bar_segments([], [], [])
+    assert xs == [] and ys == []
+
+
+def test_downsample_photometry():
+    rng = np.random.default_rng(0)
+    n_points = 50_000
+    df = pd.DataFrame(
+        {
+            'mjd': rng.uniform(58000, 59000, n_points),
+            'flux': rng.normal(100, 10, n_points),
+            'fluxerr': np.full(n_points, 2.0),
+            'label': rng.choice(['ZTF ztfg-band', 'ZTF ztfr-band'], n_points),
+        }
+    )
+    df.loc[rng.random(n_points) < 0.1, 'flux'] = np.nan
+
+    binned = downsample_photometry(df, 1000)
+    # at most one detection and one upper limit per bin
+    assert len(binned) <= 2 * 1000 + 2
+    assert binned['n_points'].sum() == n_points
+    assert set(binned['label']) == set(df['label'])
+    assert np.all(np.diff(binned['mjd']) >= 0)
+
+    detections = binned[binned['flux'].notna() & (binned['n_points'] > 1)]
+    np.testing.assert_allclose(detections['flux'], 100, atol=10)
+    # error of the median of n points with equal errors
+    np.testing.assert_allclose(
+        detections['fluxerr'],
+        np.sqrt(np.pi / 2) * 2.0 / np.sqrt(detections['n_points']),
+    )
+
+    small = df.head(100)
+    assert len(downsample_photometry(small, 1000)) == 100
+
+
+def test_bandpass_colors():
+    filters = pd.Series(['ztfg', 'sdssr', 'ztfg', 'sdssr', 'ztfr'])
+    colors = bandpass_colors(filters)
+    assert list(colors) == [
+        'green',
+        compute_bandpass_color('sdssr'),
+        'green',
+        compute_bandpass_color('sdssr'),
+        'red',
+    ]
+    assert colors[1].startswith('#')
+
+
+def test_downsample_spectrum_keeps_extremes():
+    wavelengths = np.linspace(3000, 10000, 100_001)
+    fluxes = np.sin(wavelengths / 100)
+    line = np.argmin(np.abs(wavelengths - 6563))
+    fluxes[line] = 50.0
+
+    ds_wavelengths, ds_fluxes = downsample_spectrum(wavelengths, fluxes, 1000)
+    assert len(ds_fluxes) <= 1000
+    assert np.all(np.diff(ds_wavelengths) > 0)
+    assert ds_fluxes.max() == 50.0
+    assert ds_wavelengths[ds_fluxes.argmax()] == wavelengths[line]
+    assert ds_fluxes.min() == fluxes.min()
+
+    # Spectra that are already small enough are unchanged
+    ds_wavelengths, ds_fluxes = downsample_spectrum(
+        wavelengths[:500], fluxes[:500], 1000
+    )
+    assert np.array_equal(ds_fluxes, fluxes[:500])
@@ -0,0 +1,57 @@
+import numpy as np
+
+from skyportal.utils import stack_photometry
+
+
+def test_stack_photometry_inverse_variance_mean():
+    stacked = stack_photometry(
+        mjd=[58000.1, 58000.2, 58000.9, 58003.5],
+        flux=[100.0, 110.0, 90.0, 50.0],
+        fluxerr=[1.0, 2.0, 1.0, 1.0],
+        groups=['ztfg', 'ztfg', 'ztfr', 'ztfg'],
+        binsize=1.0,
+        zp=23.9,
+    )
+    np.testing.assert_array_equal(stacked['group'], ['ztfg', 'ztfg', 'ztfr'])
+    np.testing.assert_array_equal(stacked['n_points'], [2, 1, 1])
+
+    weights = np.array([1.0, 0.25])
+    expected_flux = np.sum(weights * [100.0, 110.0]) / weights.sum()
+    np.testing.assert_allclose(stacked['flux'][0], expected_flux)
+    np.testing.assert_allclose(stacked['fluxerr'][0], weights.sum() ** -0.5)
+    np.testing.assert_allclose(
+        stacked['mjd'][0], np.sum(weights * [58000.1, 58000.2]) / weights.sum()
+    )
+    np.testing.assert_allclose(stacked['mag'], -2.5 * np.log10(stacked['flux']) + 23.9)
+    assert stacked['detected'].all()
+
+
+def test_stack_photometry_limits():
+    stacked = stack_photometry(
+        mjd=[58000.1, 58000.5, 58002.5, 58002.6],
+        flux=[np.nan, np.nan, 3.0, np.nan],
+        fluxerr=[2.0, 2.0, 1.0, 5.0],
+        groups=[0, 0, 0, 0],
+        binsize=1.0,
+        zp=23.9,
+        detect_thresh=5.0,
+    )
+    # two limits combine into a deeper limit
+    assert np.isnan(stacked['flux'][0])
+    assert not stacked['detected'][0]
+    np.testing.assert_allclose(stacked['fluxerr'][0], np.sqrt(2.0))
+    np.testing.assert_allclose(
+        stacked['lim_mag'][0], -2.5 * np.log10(5 * np.sqrt(2.0)) + 23.9
+    )
+    # limits don't contribute to bins with flux measurements; this one is
+    # below the detection threshold, so only has a limiting magnitude
+    np.testing.assert_allclose(stacked['flux'][1], 3.0)
+    np.testing.assert_allclose(stacked['fluxerr'][1], 1.0)
+    assert not stacked['detected'][1]
+    assert np.isnan(stacked['mag'][1])
+    np.testing.assert_array_equal(stacked['n_points'], [2, 2])
+
+
+def test_stack_photometry_empty():
+    stacked = stack_photometry([], [], [], [], 1.0, 23.9)
+    assert all(len(v) == 0 for v in stacked.values())
@@ -0,0 +1,92 @@
+import pytest
+
+from skyportal.utils.thumbnail_store import (
+    LocalThumbnailStore,
+    S3ThumbnailStore,
+    content_key,
+    thumbnail_store,
+)
+
+
+def test_local_thumbnail_store(tmp_path):
+    store = LocalThumbnailStore(tmp_path / 'thumbnails', url_prefix='/thumbs/')
+
+    file_uri, public_url = store.put(b'image')
+    assert public_url == f'/thumbs/{content_key(b"image")}'
+    assert store.file_uri(b'image') == file_uri
+    assert store.exists(file_uri)
+
+    # Identical data is stored once; other data gets its own file
+    assert store.put(b'image') == (file_uri, public_url)
+    other_uri, _ = store.put(b'other image')
+    assert other_uri != file_uri
+    assert len(list((tmp_path / 'thumbnails').iterdir())) == 2
+
+    store.delete(file_uri)
+    assert not store.exists(file_uri)
+    assert store.exists(other_uri)
+    store.delete(file_uri)
+
+    # Files outside the store are left alone
+    outside = tmp_path / 'outside.png'
+    outside.write_bytes(b'image')
+    store.delete(str(outside))
+    assert outside.exists()
+
+
+def test_thumbnail_store_config(tmp_path):
+    assert isinstance(thumbnail_store(local_path=tmp_path), LocalThumbnailStore)
+    store = thumbnail_store(
+        backend='s3', s3_bucket='bucket', s3_endpoint_url='http://localhost:9000'
+    )
+    assert isinstance(store, S3ThumbnailStore)
+    assert store.public_url == 'http://localhost:9000/bucket/thumbnails'
+    with pytest.raises(ValueError):
+        thumbnail_store(backend='s3')
+    with pytest.raises(ValueError):
+        thumbnail_store(backend='nfs')
+
+
+def test_s3_thumbnail_store():
+    boto3 = pytest.importorskip('boto3')
+    server = pytest.importorskip('moto.server')
+
+    # A local stand-in for S3
+    moto = server.ThreadedMotoServer(port=0)
+    moto.start()
+    try:
+        host, port = moto.get_host_and_port()
+        endpoint_url = f'http://{host}:{port}'
+        client = boto3.client(
+            's3',
+            endpoint_url=endpoint_url,
+            region_name='us-east-1',
+            aws_access_key_id='testing',
+            aws_secret_access_key='testing',
+        )
+        client.create_bucket(Bucket='skyportal')
+        store = S3ThumbnailStore('skyportal', endpoint_url=endpoint_url, client=client)
+
+        file_uri, public_url = store.put(b'image')
+        key = content_key(b'image')
+        assert file_uri == f's3://skyportal/thumbnails/{key}'
+        assert public_url == f'{endpoint_url}/skyportal/thumbnails/{key}'
+        assert store.exists(file_uri)
+        stored = client.get_object(Bucket='skyportal', Key=f'thumbnails/{key}')
+        assert stored['Body'].read() == b'image'
+        assert stored['ContentType'] == 'image/png'
+
+        assert store.put(b'image') == (file_uri, public_url)
+        assert (
+            client.list_objects_v2(Bucket='skyportal', Prefix='thumbnails/')['KeyCount']
+            == 1
+        )
+
+        store.delete(file_uri)
+        assert not store.exists(file_uri)
+        # Objects outside the store's prefix are left alone
+        client.put_object(Bucket='skyportal', Key='other/image.png', Body=b'')
+        store.delete('s3://skyportal/other/image.png')
+        client.head_object(Bucket='skyportal', Key='other/image.png')
+    finally:
+        moto.stop()
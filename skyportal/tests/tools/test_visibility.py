@@ -0,0 +1,41 @@
+import astroplan
+import numpy as np
+from astropy import coordinates as ap_coord
+from astropy import units as u
+from astropy.time import Time
+
+from skyportal.utils.visibility import pickering_airmass, rise_set_times
+
+
+def test_rise_set_times_match_astroplan():
+    observer = astroplan.Observer(
+        longitude=-155.4747 * u.deg, latitude=19.8260 * u.deg, elevation=4145 * u.m
+    )
+    rng = np.random.default_rng(1)
+    ra = rng.uniform(0, 360, 20)
+    # The last target never rises above 30 degrees
+    dec = np.append(rng.uniform(-30, 80, 19), -85)
+    start = Time('2020-02-17T04:30:00')
+
+    rise, set_ = rise_set_times(observer.location, ra, dec, start)
+    assert np.isnan(rise[-1]) and np.isnan(set_[-1])
+
+    for i in range(len(ra) - 1):
+        target = astroplan.FixedTarget(ap_coord.SkyCoord(ra[i], dec[i], unit='deg'))
+        expected_rise = observer.target_rise_time(
+            start, target, which='next', horizon=30 * u.degree
+        )
+        expected_set = observer.target_set_time(
+            expected_rise, target, which='next', horizon=30 * u.degree
+        )
+        # astroplan itself interpolates on a coarser grid
+        assert abs(rise[i] - expected_rise.jd) * 86400 < 60
+        assert abs(set_[i] - expected_set.jd) * 86400 < 60
+
+
+def test_pickering_airmass():
+    airmass = pickering_airmass([[90.0, 30.0], [0.5, -10.0]], below_horizon=99.0)
+    assert airmass.shape == (2, 2)
+    np.testing.assert_allclose(airmass[0], [1.0, 1.993], atol=1e-3)
+    assert 30 < airmass[1, 0] < 38.75
+    assert airmass[1, 1] == 99.0
@@ -0,0 +1,127 @@
+import pickle
+
+import pandas as pd
+import pytest
+
+from skyportal.utils import ztf
+from skyportal.utils.cache import DiskCache
+from skyportal.utils.ztf import ZTFRefLocator, footprint_refs, load_footprints
+
+
+def square_footprint(ra, dec, half_size, **ref):
+    return {
+        **ref,
+        'ra1': ra - half_size,
+        'dec1': dec - half_size,
+        'ra2': ra + half_size,
+        'dec2': dec - half_size,
+        'ra3': ra + half_size,
+        'dec3': dec + half_size,
+        'ra4': ra - half_size,
+        'dec4': dec + half_size,
+    }
+
+
+@pytest.fixture()
+def footprints_path(tmp_path):
+    footprints = pd.DataFrame(
+        [
+            square_footprint(
+                123.0, 33.0, 0.2, field=1, filtercode='zr', ccdid=1, qid=1
+            ),
+            square_footprint(
+                123.0, 33.0, 0.2, field=1, filtercode='zg', ccdid=1, qid=1
+            ),
+            square_footprint(
+                123.3, 33.0, 0.2, field=2, filtercode='zr', ccdid=5, qid=3
+            ),
+            square_footprint(
+                0.0, -10.0, 0.2, field=3, filtercode='zg', ccdid=16, qid=4
+            ),
+        ]
+    )
+    path = tmp_path / 'footprints.csv'
+    footprints.to_csv(path, index=False)
+    return path
+
+
+def test_footprint_refs(footprints_path):
+    footprints = load_footprints(footprints_path)
+
+    # Overlapping quadrants: the best centered first, then in table order
+    refs = footprint_refs(footprints, 123.12, 33.0)
+    assert [(r['field'], r['filtercode']) for r in refs] == [
+        (1, 'zr'),
+        (1, 'zg'),
+        (2, 'zr'),
+    ]
+    refs = footprint_refs(footprints, 123.25, 33.1)
+    assert [(r['field'], r['filtercode']) for r in refs] == [(2, 'zr')]
+    assert refs[0] == {'field': 2, 'filtercode': 'zr', 'ccdid': 5, 'qid': 3}
+
+    # Quadrants straddling RA = 0
+    assert [r['field'] for r in footprint_refs(footprints, 359.9, -10.1)] == [3]
+    assert footprint_refs(footprints, 359.7, -10.1) == []
+    assert footprint_refs(footprints, 200.0, 33.0) == []
+
+
+def test_load_footprints_missing_columns(tmp_path):
+    path = tmp_path / 'footprints.csv'
+    pd.DataFrame([{'field': 1, 'ra1': 0.0}]).to_csv(path, index=False)
+    with pytest.raises(ValueError):
+        load_footprints(path)
+
+
+def test_ztfref_locator_footprints(footprints_path, monkeypatch):
+    def query(*args, **kwargs):
+        raise AssertionError('IRSA should not be queried')
+
+    monkeypatch.setattr(ztf, 'query_ref_quadrants', query)
+    locator = ZTFRefLocator(footprints_path=str(footprints_path))
+    assert locator.lookup(123.25, 33.1)['field'] == 2
+    assert locator.lookup(200.0, 33.0) is None
+
+    # The table is loaded once per process, and not sent along with the
+    # locator
+    other = pickle.loads(pickle.dumps(locator))
+    assert not any(isinstance(value, pd.DataFrame) for value in vars(other).values())
+    assert other.footprints is locator.footprints
+
+
+def test_ztfref_locator_cache(tmp_path, monkeypatch):
+    queries = []
+
+    def query(ra, dec, timeout=None):
+        queries.append((ra, dec))
+        return [{'field': 1, 'filtercode': 'zr', 'ccdid': 1, 'qid': 1}]
+
+    monkeypatch.setattr(ztf, 'query_ref_quadrants', query)
+    locator = ZTFRefLocator(cache=DiskCache(tmp_path), level=14)
+
+    ref = locator.lookup(123.0, 33.0)
+    assert ref == {'field': 1, 'filtercode': 'zr', 'ccdid': 1, 'qid': 1}
+    # Positions in the same pixel, including from another process, are
+    # looked up in the cache
+    assert locator.lookup(123.0 + 1e-5, 33.0) == ref
+    other = ZTFRefLocator(cache=DiskCache(tmp_path), level=14)
+    assert other.lookup(123.0, 33.0) == ref
+    assert len(queries) == 1
+
+    locator.lookup(124.0, 33.0)
+    assert len(queries) == 2
+
+
+def test_ztfref_locator_no_ref_not_cached(tmp_path, monkeypatch):
+    queries = []
+
+    def query(ra, dec, timeout=None):
+        queries.append((ra, dec))
+        return []
+
+    monkeypatch.setattr(ztf, 'query_ref_quadrants', query)
+    locator = ZTFRefLocator(cache=DiskCache(tmp_path), level=14)
+
+    # A reference image may be added later, so IRSA is asked again
+    assert locator.lookup(123.0, 33.0) is None
+    assert locator.lookup(123.0, 33.0) is None
+    assert len(queries) == 2
@@ -5,3 +5,4 @@ from .offset import (
     get_finding_chart,
     get_ztfref_url,
 )
+from .photometry import stack_photometry
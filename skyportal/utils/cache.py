@@ -0,0 +1,284 @@
+import contextlib
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+
+
+class LRUCache:
+    """Thread-safe, in-memory least-recently-used cache.
+
+    Parameters
+    ----------
+    maxsize : int
+        Maximum number of entries; the least recently used entry is evicted
+        when this is exceeded.
+    ttl : float, optional
+        Number of seconds after which an entry expires. Entries never
+        expire if not provided.
+    """
+
+    def __init__(self, maxsize=128, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        """Return the value cached under `key`, or `default` if there is none
+        (or it has expired)."""
+        with self._lock:
+            try:
+                value, expires = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            if expires is not None and expires < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        expires = None if self.ttl is None else time.monotonic() + self.ttl
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __contains__(self, key):
+        with self._lock:
+            if key not in self._data:
+                return False
+            expires = self._data[key][1]
+            return expires is None or expires >= time.monotonic()
+
+    def __len__(self):
+        return len(self._data)
+
+    def invalidate(self, key):
+        """Remove the entry for `key`, if any."""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def invalidate_where(self, predicate):
+        """Remove all entries whose key satisfies `predicate(key)`."""
+        with self._lock:
+            for key in [k for k in self._data if predicate(k)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    @property
+    def stats(self):
+        """Cache size and hit/miss counts."""
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+class DiskCache:
+    """Persistent least-recently-used cache of byte strings, shared between
+    processes.
+
+    Each value is stored in its own file under `path`; an SQLite database
+    in the same directory indexes them, and records when each was last
+    read. Files are written under a temporary name and renamed into place
+    before being indexed, and every write gets a new file, so readers never
+    see partial or replaced values. Hit, miss and eviction counts are kept
+    in the index too, so they cover all the processes using the cache.
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+        Cache directory (created if needed).
+    max_entries : int, optional
+        Maximum number of entries.
+    max_size : int, optional
+        Maximum total size of the values, in bytes.
+
+    When either bound is exceeded, the least recently used entries are
+    evicted. The cache is unbounded if neither is provided.
+    """
+
+    COUNTERS = ('hits', 'misses', 'evictions')
+
+    def __init__(self, path, max_entries=None, max_size=None):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._index = self.path / 'index.sqlite'
+        with self._connect() as db:
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS entries ('
+                'key TEXT PRIMARY KEY, filename TEXT NOT NULL, '
+                'size INTEGER NOT NULL, accessed REAL NOT NULL)'
+            )
+            db.execute(
+                'CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)'
+            )
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS counters ('
+                'name TEXT PRIMARY KEY, value INTEGER NOT NULL)'
+            )
+            db.executemany(
+                'INSERT OR IGNORE INTO counters (name, value) VALUES (?, 0)',
+                [(name,) for name in self.COUNTERS],
+            )
+
+    def _connect(self):
+        # Autocommit mode; transactions are begun explicitly where needed
+        return contextlib.closing(
+            sqlite3.connect(str(self._index), timeout=30, isolation_level=None)
+        )
+
+    def _count(self, db, name, n=1):
+        db.execute('UPDATE counters SET value = value + ? WHERE name = ?', (n, name))
+
+    def _remove_files(self, filenames):
+        for filename in filenames:
+            try:
+                os.remove(self.path / filename)
+            except FileNotFoundError:
+                pass
+
+    def get(self, key, default=None):
+        """Return the bytes cached under `key`, or `default`."""
+        with self._connect() as db:
+            row = db.execute(
+                'SELECT filename FROM entries WHERE key = ?', (key,)
+            ).fetchone()
+            if row is not None:
+                try:
+                    data = (self.path / row[0]).read_bytes()
+                except FileNotFoundError:
+                    db.execute(
+                        'DELETE FROM entries WHERE key = ? AND filename = ?',
+                        (key, row[0]),
+                    )
+                    row = None
+            if row is None:
+                self._count(db, 'misses')
+                return default
+            db.execute(
+                'UPDATE entries SET accessed = ? WHERE key = ?', (time.time(), key)
+            )
+            self._count(db, 'hits')
+        return data
+
+    def set(self, key, data):
+        """Cache `data` (bytes) under `key`, evicting the least recently
+        used entries if the cache grows past its bounds."""
+        with tempfile.NamedTemporaryFile(
+            dir=self.path, prefix='.tmp-', delete=False
+        ) as f:
+            f.write(data)
+        filename = f'{hashlib.sha256(key.encode()).hexdigest()}-{uuid.uuid4().hex}'
+        os.replace(f.name, self.path / filename)
+
+        with self._connect() as db:
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                stale = db.execute(
+                    'SELECT filename FROM entries WHERE key = ?', (key,)
+                ).fetchall()
+                db.execute(
+                    'INSERT OR REPLACE INTO entries (key, filename, size, accessed) '
+                    'VALUES (?, ?, ?, ?)',
+                    (key, filename, len(data), time.time()),
+                )
+                evicted = self._evict(db)
+                db.execute('COMMIT')
+            except BaseException:
+                db.execute('ROLLBACK')
+                self._remove_files([filename])
+                raise
+        self._remove_files([row[0] for row in stale] + evicted)
+
+    def _evict(self, db):
+        """Delete the least recently used entries past the cache's bounds
+        from the index, returning their files."""
+        count, size = db.execute(
+            'SELECT count(*), coalesce(sum(size), 0) FROM entries'
+        ).fetchone()
+        evicted = []
+        if (self.max_entries is None or count <= self.max_entries) and (
+            self.max_size is None or size <= self.max_size
+        ):
+            return evicted
+        rows = db.execute('SELECT key, filename, size FROM entries ORDER BY accessed')
+        for key, filename, entry_size in rows.fetchall():
+            if (self.max_entries is None or count <= self.max_entries) and (
+                self.max_size is None or size <= self.max_size
+            ):
+                break
+            evicted.append((key, filename))
+            count -= 1
+            size -= entry_size
+        db.executemany('DELETE FROM entries WHERE key = ?', [(k,) for k, _ in evicted])
+        self._count(db, 'evictions', len(evicted))
+        return [filename for _, filename in evicted]
+
+    def __contains__(self, key):
+        with self._connect() as db:
+            return (
+                db.execute('SELECT 1 FROM entries WHERE key = ?', (key,)).fetchone()
+                is not None
+            )
+
+    def __len__(self):
+        with self._connect() as db:
+            return db.execute('SELECT count(*) FROM entries').fetchone()[0]
+
+    def keys(self, prefix=''):
+        """Keys of the cached values, optionally only those starting with
+        `prefix`."""
+        with self._connect() as db:
+            rows = db.execute(
+                "SELECT key FROM entries WHERE substr(key, 1, ?) = ?",
+                (len(prefix), prefix),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def invalidate(self, key):
+        """Remove the entry for `key`, if any."""
+        with self._connect() as db:
+            rows = db.execute(
+                'SELECT filename FROM entries WHERE key = ?', (key,)
+            ).fetchall()
+            db.execute('DELETE FROM entries WHERE key = ?', (key,))
+        self._remove_files([row[0] for row in rows])
+
+    @property
+    def stats(self):
+        """Number of entries and their total size (in bytes), the cache's
+        bounds, and hit/miss/eviction counts (across all processes)."""
+        with self._connect() as db:
+            count, size = db.execute(
+                'SELECT count(*), coalesce(sum(size), 0) FROM entries'
+            ).fetchone()
+            counters = dict(db.execute('SELECT name, value FROM counters'))
+        return {
+            'size': count,
+            'maxsize': self.max_entries,
+            'bytes': size,
+            'max_bytes': self.max_size,
+            **{name: counters.get(name, 0) for name in self.COUNTERS},
+        }
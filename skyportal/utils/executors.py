@@ -0,0 +1,136 @@
+import asyncio
+import threading
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor, ThreadPoolExecutor
+
+
+class ExecutorSaturated(Exception):
+    """Raised when work is submitted to a `BoundedExecutor` that already has
+    as many tasks in flight as it allows."""
+
+
+class BoundedExecutor:
+    """Thread (or process) pool that rejects new work, instead of queueing
+    it without bound, once `max_workers + max_queued` tasks are running or
+    waiting.
+
+    Parameters
+    ----------
+    max_workers : int
+        Number of worker threads.
+    max_queued : int
+        Number of tasks allowed to wait for a free worker.
+    name : str
+        Prefix of the worker thread names.
+    teardown : callable, optional
+        Called (without arguments) in the worker thread after each task,
+        e.g. to release thread-local database sessions. Not supported for
+        process pools.
+    processes : bool, optional
+        Run tasks in worker processes rather than threads, for CPU-bound
+        work. Tasks, their arguments and their results must be picklable.
+        If a worker process dies (e.g. killed for using too much memory),
+        the tasks in the pool fail and the pool is replaced.
+    """
+
+    def __init__(
+        self, max_workers, max_queued, name='worker', teardown=None, processes=False
+    ):
+        if processes and teardown is not None:
+            raise ValueError('teardown is not supported for process pools')
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.name = name
+        self.teardown = teardown
+        self.processes = processes
+        self._executor = self._new_executor()
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.restarts = 0
+
+    def _new_executor(self):
+        if self.processes:
+            return ProcessPoolExecutor(max_workers=self.max_workers)
+        return ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix=self.name
+        )
+
+    def _restart(self, broken):
+        """Replace the `broken` pool, unless that was already done."""
+        with self._lock:
+            if self._executor is not broken:
+                return
+            self._executor = self._new_executor()
+            self.restarts += 1
+        broken.shutdown(wait=False)
+
+    def _submit(self, fn, args, kwargs):
+        executor = self._executor
+        try:
+            if self.processes:
+                return executor.submit(fn, *args, **kwargs)
+            return executor.submit(self._run, fn, args, kwargs)
+        except BrokenExecutor:
+            self._restart(executor)
+            raise
+
+    def _run(self, fn, args, kwargs):
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            if self.teardown is not None:
+                self.teardown()
+
+    def _done(self, future):
+        with self._lock:
+            self.in_flight -= 1
+            if future.cancelled() or future.exception() is not None:
+                self.failed += 1
+            else:
+                self.completed += 1
+
+    def submit(self, fn, *args, **kwargs):
+        """Schedule `fn(*args, **kwargs)`, returning a
+        `concurrent.futures.Future`. Raises `ExecutorSaturated` if too many
+        tasks are already in flight."""
+        with self._lock:
+            if self.in_flight >= self.max_workers + self.max_queued:
+                self.rejected += 1
+                raise ExecutorSaturated(
+                    f'{self.in_flight} tasks already running or queued'
+                )
+            self.in_flight += 1
+        try:
+            try:
+                future = self._submit(fn, args, kwargs)
+            except BrokenExecutor:
+                # A worker process died during an earlier task; the pool
+                # has been replaced, so try again
+                future = self._submit(fn, args, kwargs)
+        except Exception:
+            with self._lock:
+                self.in_flight -= 1
+            raise
+        future.add_done_callback(self._done)
+        return future
+
+    async def run(self, fn, *args, **kwargs):
+        """Run `fn(*args, **kwargs)` in the pool and await its result."""
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    @property
+    def stats(self):
+        """Pool size, number of tasks running or queued, and counts of
+        completed, failed and rejected tasks and of pool restarts."""
+        return {
+            'max_workers': self.max_workers,
+            'max_queued': self.max_queued,
+            'in_flight': self.in_flight,
+            'queued': max(0, self.in_flight - self.max_workers),
+            'completed': self.completed,
+            'failed': self.failed,
+            'rejected': self.rejected,
+            'restarts': self.restarts,
+        }
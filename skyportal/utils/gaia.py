@@ -0,0 +1,246 @@
+import math
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+from astropy import units as u
+from astropy.coordinates import SkyCoord
+from astropy_healpix import HEALPix
+from astroquery.gaia import Gaia
+
+from .cache import DiskCache
+
+
+# Gaia source IDs encode the (nested) index of the level-12 HEALPix cell
+# containing the source: source_id // 2**35
+GAIA_SOURCE_ID_LEVEL = 12
+GAIA_SOURCE_ID_FACTOR = 2 ** 35
+
+COLUMNS = [
+    'source_id',
+    'ra',
+    'dec',
+    'ref_epoch',
+    'phot_rp_mean_mag',
+    'pmra',
+    'pmdec',
+    'parallax',
+]
+
+
+def cell_source_id_range(cell, level):
+    """Range (inclusive) of the Gaia source IDs of sources in a HEALPix
+    (nested) cell at `level` (<= 12)."""
+    n = GAIA_SOURCE_ID_FACTOR * 4 ** (GAIA_SOURCE_ID_LEVEL - level)
+    return cell * n, (cell + 1) * n - 1
+
+
+def source_cells(source_ids, level):
+    """HEALPix (nested) cells at `level` of sources with the given Gaia
+    source IDs."""
+    n = GAIA_SOURCE_ID_FACTOR * 4 ** (GAIA_SOURCE_ID_LEVEL - level)
+    return np.asarray(source_ids, dtype=np.int64) // n
+
+
+def cone_cells(ra, dec, radius_degrees, level):
+    """HEALPix (nested) cells at `level` overlapping a cone."""
+    healpix = HEALPix(nside=2 ** level, order='nested')
+    return sorted(
+        int(cell)
+        for cell in healpix.cone_search_lonlat(
+            ra * u.deg, dec * u.deg, radius_degrees * u.deg
+        )
+    )
+
+
+class GaiaArchiveBackend:
+    """Fetch sources from the Gaia archive (with `astroquery`), one ADQL
+    query per request covering all the requested cells.
+
+    Parameters
+    ----------
+    level : int, optional
+        HEALPix level of the cells in which sources are fetched.
+    table : str, optional
+        Gaia archive table to query.
+    """
+
+    def __init__(self, level=9, table='gaiadr2.gaia_source'):
+        self.level = level
+        self.table = table
+
+    def query_string(self, cells, mag_min, mag_max):
+        cell_conditions = ' OR '.join(
+            'source_id BETWEEN {} AND {}'.format(
+                *cell_source_id_range(cell, self.level)
+            )
+            for cell in cells
+        )
+        return f"""
+                  SELECT {', '.join(COLUMNS)}
+                  FROM {self.table}
+                  WHERE ({cell_conditions})
+                  AND phot_rp_mean_mag < {mag_max}
+                  AND phot_rp_mean_mag > {mag_min}
+                  AND parallax < 250
+                """
+
+    def sources(self, cells, mag_min, mag_max):
+        """Sources in `cells` with `mag_min < phot_rp_mean_mag < mag_max`,
+        as a `pandas.DataFrame`."""
+        # Whole cells may hold more rows than synchronous jobs return
+        job = Gaia.launch_job_async(self.query_string(cells, mag_min, mag_max))
+        return job.get_results().to_pandas()[COLUMNS]
+
+
+class GaiaParquetBackend:
+    """Read sources from a local extract of Gaia, partitioned in HEALPix
+    cells: one Parquet file, `<path>/<cell>.parquet`, per (nested) cell at
+    `level`, with (at least) the `COLUMNS` of the Gaia source table. Cells
+    without a file have no sources.
+
+    Reading Parquet files requires `pyarrow` (or `fastparquet`).
+    """
+
+    def __init__(self, path, level=9):
+        self.path = path
+        self.level = level
+
+    def sources(self, cells, mag_min, mag_max):
+        frames = []
+        for cell in cells:
+            filename = os.path.join(self.path, f'{cell}.parquet')
+            if os.path.exists(filename):
+                frames.append(pd.read_parquet(filename, columns=COLUMNS))
+        if len(frames) == 0:
+            return pd.DataFrame(columns=COLUMNS)
+        data = pd.concat(frames, ignore_index=True)
+        mag = data['phot_rp_mean_mag']
+        return data[(mag > mag_min) & (mag < mag_max) & (data['parallax'] < 250)]
+
+
+class GaiaCatalog:
+    """Cone searches of Gaia sources, served from a cache of the sources in
+    HEALPix cells where possible.
+
+    Sources are fetched from `backend` for whole cells (at `backend.level`)
+    and magnitude ranges widened to whole magnitudes, and stored in `cache`
+    (a `skyportal.utils.cache.DiskCache`) keyed by cell and magnitude
+    range. Later searches overlapping the same cells, within a magnitude
+    range covered by a cached one, do not use the backend.
+
+    Parameters
+    ----------
+    backend : GaiaArchiveBackend or GaiaParquetBackend
+        Where sources come from.
+    cache : skyportal.utils.cache.DiskCache, optional
+        Cache of the sources in each cell. Sources are not cached if not
+        provided.
+    """
+
+    def __init__(self, backend, cache=None):
+        self.backend = backend
+        self.cache = cache
+
+    def _cache_prefix(self, cell):
+        return f'gaia/{self.backend.level}/{cell}/'
+
+    def _cached_cell(self, cell, mag_min, mag_max):
+        prefix = self._cache_prefix(cell)
+        for key in self.cache.keys(prefix):
+            cached_min, cached_max = map(float, key.split('/')[-2:])
+            if cached_min <= mag_min and cached_max >= mag_max:
+                data = self.cache.get(key)
+                if data is not None:
+                    return pickle.loads(data)
+        return None
+
+    def cell_sources(self, cells, mag_min, mag_max):
+        """Sources in `cells` with magnitudes in (at least) the range
+        `(mag_min, mag_max)`."""
+        if self.cache is None:
+            return self.backend.sources(cells, mag_min, mag_max)
+
+        frames = []
+        missing = []
+        for cell in cells:
+            data = self._cached_cell(cell, mag_min, mag_max)
+            if data is None:
+                missing.append(cell)
+            else:
+                frames.append(data)
+
+        if missing:
+            fetch_min, fetch_max = math.floor(mag_min), math.ceil(mag_max)
+            fetched = self.backend.sources(missing, fetch_min, fetch_max)
+            cells_fetched = source_cells(fetched['source_id'], self.backend.level)
+            for cell in missing:
+                data = fetched[cells_fetched == cell].reset_index(drop=True)
+                self.cache.set(
+                    f'{self._cache_prefix(cell)}{fetch_min}/{fetch_max}',
+                    pickle.dumps(data),
+                )
+            frames.append(fetched)
+
+        if len(frames) == 0:
+            return pd.DataFrame(columns=COLUMNS)
+        return pd.concat(frames, ignore_index=True)
+
+    def cone(self, ra, dec, radius_degrees, mag_min, mag_max, max_rows=None):
+        """Sources within `radius_degrees` of (`ra`, `dec`), with
+        `mag_min < phot_rp_mean_mag < mag_max` and parallax < 250 mas,
+        brightest first.
+
+        Returns
+        -------
+        pandas.DataFrame
+            The `COLUMNS` of the Gaia source table, and `dist`, the
+            distance (in degrees) of each source from the center.
+        """
+        cells = cone_cells(ra, dec, radius_degrees, self.backend.level)
+        data = self.cell_sources(cells, mag_min, mag_max)
+        mag = data['phot_rp_mean_mag'].astype(float)
+        data = data[
+            (mag > mag_min) & (mag < mag_max) & (data['parallax'].astype(float) < 250)
+        ]
+        center = SkyCoord(ra, dec, unit='deg')
+        coords = SkyCoord(
+            data['ra'].values.astype(float),
+            data['dec'].values.astype(float),
+            unit='deg',
+        )
+        data = data.assign(dist=center.separation(coords).deg)
+        data = data[data['dist'] <= radius_degrees].sort_values(
+            'phot_rp_mean_mag', kind='mergesort'
+        )
+        if max_rows is not None:
+            data = data.head(max_rows)
+        return data.reset_index(drop=True)
+
+
+def gaia_catalog(backend='archive', level=9, parquet_path=None, cache_dir=None):
+    """Create a `GaiaCatalog` from configuration values.
+
+    Parameters
+    ----------
+    backend : {'archive', 'parquet'}
+        Query the Gaia archive, or read a local Parquet extract (at
+        `parquet_path`).
+    level : int
+        HEALPix level of the cells in which sources are fetched and cached
+        (or in which the extract is partitioned).
+    parquet_path : str, optional
+        Location of the Parquet extract.
+    cache_dir : str, optional
+        Directory of the on-disk cache of fetched cells. Not used for
+        Parquet extracts, which are already local.
+    """
+    if backend == 'parquet':
+        if parquet_path is None:
+            raise ValueError('A path is required for the Parquet Gaia backend')
+        return GaiaCatalog(GaiaParquetBackend(parquet_path, level=level))
+    if backend != 'archive':
+        raise ValueError(f'Unknown Gaia backend: {backend}')
+    cache = DiskCache(cache_dir) if cache_dir is not None else None
+    return GaiaCatalog(GaiaArchiveBackend(level=level), cache=cache)
@@ -1,11 +1,8 @@
 import io
 import os
-from pathlib import Path
 import datetime
-import hashlib
 import warnings
 
-import pandas as pd
 import requests
 import matplotlib.pyplot as plt
 import seaborn as sns
@@ -13,8 +10,8 @@ import numpy as np
 from scipy.ndimage.filters import gaussian_filter
 
 from astropy import units as u
-from astropy.coordinates import SkyCoord
-from astroquery.gaia import Gaia
+from astropy.coordinates import SkyCoord, search_around_sky
+from astropy.table import Table
 from astropy.time import Time
 from astropy.utils.exceptions import AstropyWarning
 
@@ -24,6 +21,9 @@ from astropy.io import fits
 from astropy.visualization import ImageNormalize, ZScaleInterval
 from reproject import reproject_adaptive
 
+from .gaia import GaiaArchiveBackend, GaiaCatalog
+from .ztf import ZTFRefLocator, irsa
+
 warnings.simplefilter('ignore', category=AstropyWarning)
 
 facility_parameters = {
@@ -47,20 +47,14 @@ facility_parameters = {
     },
 }
 
-# ZTF ref grabber URLs. See get_ztfref_url() below
-irsa = {
-    "url_data": "https://irsa.ipac.caltech.edu/ibe/data/ztf/products/",
-    "url_search": "https://irsa.ipac.caltech.edu/ibe/search/ztf/products/",
-}
-
 
-def get_ztfref_url(ra, dec, imsize, *args, **kwargs):
+def get_ztfref_url(ra, dec, imsize, *args, timeout=None, locator=None, **kwargs):
     """
     From:
     https://gist.github.com/dmitryduev/634bd2b21a77e2b1de89e0bfd39d14b9
 
     Returns the URL that points to the ZTF reference image for the
-    requested position
+    requested position (one containing it)
 
     Parameters
     ----------
@@ -72,27 +66,31 @@ def get_ztfref_url(ra, dec, imsize, *args, **kwargs):
         Requested image size (on a size) in arcmin
     *args : optional
         Extra args (not needed here)
+    timeout : float, optional
+        Timeout (in seconds) of the request to the IRSA search service
+    locator : skyportal.utils.ztf.ZTFRefLocator, optional
+        How to find the reference image (e.g. from a cache or a local
+        footprint table). Defaults to searching IRSA.
     **kwargs : optional
         Extra kwargs (not needed here)
 
     Returns
     -------
-    str
-        the URL to download the ZTF image
+    str or None
+        the URL to download the ZTF image, or None if there is no
+        reference image of the position
 
     """
-    imsize_deg = imsize / 60
+    if locator is None:
+        locator = ZTFRefLocator()
+    ref = locator.lookup(ra, dec, timeout=timeout)
+    if ref is None:
+        return None
 
-    url_ref_meta = os.path.join(
-        irsa['url_search'], f"ref?POS={ra:f},{dec:f}&SIZE={imsize_deg:f}&ct=csv"
-    )
-    s = requests.get(url_ref_meta).content
-    c = pd.read_csv(io.StringIO(s.decode('utf-8')))
-
-    field = f"{c.loc[0, 'field']:06d}"
-    filt = c.loc[0, 'filtercode']
-    quad = f"{c.loc[0, 'qid']}"
-    ccd = f"{c.loc[0, 'ccdid']:02d}"
+    field = f"{ref['field']:06d}"
+    filt = ref['filtercode']
+    quad = f"{ref['qid']}"
+    ccd = f"{ref['ccdid']:02d}"
 
     path_ursa_ref = os.path.join(
         irsa['url_data'],
@@ -138,6 +136,84 @@ source_image_parameters = {
 }
 
 
+def select_offset_stars(stars, center, mag_limit, min_sep, star_obstime):
+    """Select isolated, bright enough offset stars and compute their offsets
+    to a source.
+
+    Parameters
+    ----------
+    stars : astropy.table.Table
+        Gaia sources, with (at least) `ra`, `dec`, `pmra`, `pmdec`,
+        `parallax`, `phot_rp_mean_mag` and `dist` columns.
+    center : astropy.coordinates.SkyCoord
+        Position of the source, at the time of the observation.
+    mag_limit : float
+        Faintest magnitude allowed for an offset star.
+    min_sep : astropy.units.Quantity
+        Stars with another star within this distance are rejected.
+    star_obstime : str or astropy.time.Time
+        Epoch of the star positions.
+
+    Returns
+    -------
+    list of tuple
+        `(dist, coord, star, dra, ddec)` for each selected star, nearest
+        to the source first: its distance to the source (in degrees), its
+        position at `star_obstime`, its row of `stars`, and the offsets
+        from the star (moved to the time of the observation) to the source.
+    """
+    if len(stars) == 0:
+        return []
+
+    ra = np.asarray(stars['ra'], dtype=float)
+    dec = np.asarray(stars['dec'], dtype=float)
+
+    # Count each star's neighbours (including itself) with a single
+    # KD-tree search of the whole table
+    positions = SkyCoord(ra, dec, unit=(u.degree, u.degree), frame='icrs')
+    idx, _, _, _ = search_around_sky(positions, positions, min_sep)
+    n_neighbours = np.bincount(idx, minlength=len(stars))
+
+    mag = np.asarray(stars['phot_rp_mean_mag'], dtype=float)
+    with np.errstate(invalid='ignore'):
+        good = np.flatnonzero((n_neighbours == 1) & (mag <= mag_limit))
+    if len(good) == 0:
+        return []
+    good = good[np.argsort(np.asarray(stars['dist'], dtype=float)[good], kind='stable')]
+
+    with np.errstate(divide='ignore'):
+        distance = np.minimum(
+            np.abs(1 / np.asarray(stars['parallax'][good], dtype=float)), 10
+        )
+    coords = SkyCoord(
+        ra=ra[good],
+        dec=dec[good],
+        unit=(u.degree, u.degree),
+        pm_ra_cosdec=(
+            np.cos(dec[good] * np.pi / 180.0)
+            * np.asarray(stars['pmra'][good], dtype=float)
+            * u.mas
+            / u.yr
+        ),
+        pm_dec=np.asarray(stars['pmdec'][good], dtype=float) * u.mas / u.yr,
+        frame='icrs',
+        distance=distance * u.kpc,
+        obstime=star_obstime,
+    )
+
+    # precess the positions forward to the source obstime and get offsets
+    # suitable for spectroscopy
+    # TODO: put this in geocentric coords to account for parallax
+    moved = coords.apply_space_motion(new_obstime=center.obstime)
+    dra, ddec = moved.spherical_offsets_to(center)
+    dra, ddec = dra.to(u.arcsec), ddec.to(u.arcsec)
+
+    return [
+        (stars['dist'][i], coords[j], stars[i], dra[j], ddec[j])
+        for j, i in enumerate(good)
+    ]
+
+
 def get_nearby_offset_stars(
     source_ra,
     source_dec,
@@ -152,6 +228,7 @@ def get_nearby_offset_stars(
     use_source_pos_in_starlist=True,
     allowed_queries=2,
     queries_issued=0,
+    catalog=None,
 ):
     """Finds good list of nearby offset stars for spectroscopy
        and returns info about those stars, including their
@@ -187,6 +264,9 @@ def get_nearby_offset_stars(
         before giving up on getting the number of offset stars we desire?
     queries_issued : int, optional
         How many times have we issued a query? Bookkeeping parameter.
+    catalog : skyportal.utils.gaia.GaiaCatalog, optional
+        Where to look for offset stars. Defaults to (uncached) queries of
+        the Gaia archive.
 
     Returns
     -------
@@ -234,44 +314,25 @@ def get_nearby_offset_stars(
                   AND parallax < 250
                   ORDER BY phot_rp_mean_mag ASC
                 """
-    # TODO possibly: save the offset data (cache)
-    job = Gaia.launch_job(query_string)
-    r = job.get_results()
-    queries_issued += 1
-
-    catalog = SkyCoord.guess_from_table(r)
-
-    # star needs to be this far away
-    # from another star
-    min_sep = min_sep_arcsec * u.arcsec
-    good_list = []
-    for source in r:
-        c = SkyCoord(
-            ra=source["ra"],
-            dec=source["dec"],
-            unit=(u.degree, u.degree),
-            pm_ra_cosdec=(
-                np.cos(source["dec"] * np.pi / 180.0) * source['pmra'] * u.mas / u.yr
-            ),
-            pm_dec=source["pmdec"] * u.mas / u.yr,
-            frame='icrs',
-            distance=min(abs(1 / source["parallax"]), 10) * u.kpc,
-            obstime=gaia_obstime,
+    # `query_string` is the ADQL equivalent of this search, returned for
+    # reference; the catalog fetches (and caches) sources by HEALPix cell
+    if catalog is None:
+        catalog = GaiaCatalog(GaiaArchiveBackend())
+    r = Table.from_pandas(
+        catalog.cone(
+            source_ra,
+            source_dec,
+            radius_degrees,
+            mag_min,
+            mag_limit + fainter_diff,
+            max_rows=how_many * search_multipler,
         )
+    )
+    queries_issued += 1
 
-        d2d = c.separation(catalog)  # match it to the catalog
-        if sum(d2d < min_sep) == 1 and source["phot_rp_mean_mag"] <= mag_limit:
-            # this star is not near another star and is bright enough
-            # precess it's position forward to the source obstime and
-            # get offsets suitable for spectroscopy
-            # TODO: put this in geocentric coords to account for parallax
-            cprime = c.apply_space_motion(new_obstime=source_obstime)
-            dra, ddec = cprime.spherical_offsets_to(center)
-            good_list.append(
-                (source["dist"], c, source, dra.to(u.arcsec), ddec.to(u.arcsec))
-            )
-
-    good_list.sort()
+    good_list = select_offset_stars(
+        r, center, mag_limit, min_sep_arcsec * u.arcsec, gaia_obstime
+    )
 
     # if we got less than we asked for, relax the criteria
     if (len(good_list) < how_many) and (queries_issued < allowed_queries):
@@ -289,6 +350,7 @@ def get_nearby_offset_stars(
             use_source_pos_in_starlist=use_source_pos_in_starlist,
             queries_issued=queries_issued,
             allowed_queries=allowed_queries,
+            catalog=catalog,
         )
 
     # default to keck star list
@@ -388,9 +450,9 @@ def fits_image(
     center_dec,
     imsize=4.0,
     image_source="desi",
-    cache=True,
-    cachedir="./skyportal_image_cache/",
-    max_cache=5,
+    cache=None,
+    timeout=None,
+    ztfref_locator=None,
 ):
 
     """Returns an opened FITS image centered on the source
@@ -406,12 +468,14 @@ def fits_image(
         Requested image size (on a size) in arcmin
     image_source : str, optional
         Survey where the image comes from "desi" or "dss" (more to be added)
-    cache : bool, optional
-        Use a cache version of the image and save to a cache if True
-    cachedir : str, optional
-        Where should the cache live?
-    max_cache : int, optional
-        How many older files in the cache should we keep?
+    cache : skyportal.utils.cache.DiskCache, optional
+        Cache of downloaded images, keyed by position, size and survey.
+        Images are not cached if not provided.
+    timeout : float, optional
+        Timeout (in seconds) of each request to the survey server. If the
+        server does not respond in time, None is returned.
+    ztfref_locator : skyportal.utils.ztf.ZTFRefLocator, optional
+        How to find ZTF reference images
 
     Returns
     -------
@@ -424,6 +488,12 @@ def fits_image(
     if image_source not in source_image_parameters:
         raise Exception("do not know how to grab image source")
 
+    cache_key = f"image/{image_source}/{center_ra}/{center_dec}/{imsize}"
+    if cache is not None:
+        data = cache.get(cache_key)
+        if data is not None:
+            return fits.open(io.BytesIO(data))[0]
+
     pixscale = 60 * imsize / source_image_parameters[image_source].get("npixels", 256)
 
     if isinstance(source_image_parameters[image_source]["url"], str):
@@ -432,53 +502,34 @@ def fits_image(
         )
     else:
         # use the URL field as a function
-        url = source_image_parameters[image_source]["url"](
-            ra=center_ra, dec=center_dec, imsize=imsize
-        )
+        try:
+            url = source_image_parameters[image_source]["url"](
+                ra=center_ra,
+                dec=center_dec,
+                imsize=imsize,
+                timeout=timeout,
+                locator=ztfref_locator,
+            )
+        except requests.RequestException:
+            return None
+        if url is None:
+            return None
 
-    cachedir = Path(cachedir)
-    if not cachedir.is_dir():
-        cachedir.mkdir()
+    try:
+        response = requests.get(url, stream=True, allow_redirects=True, timeout=timeout)
+    except requests.RequestException:
+        return None
+    if response.status_code != 200:
+        return None
 
-    def get_hdu(url):
-        response = requests.get(url, stream=True, allow_redirects=True)
-        if response.status_code == 200:
-            hdu = fits.open(io.BytesIO(response.content))[0]
-            return hdu
-        else:
-            return None
+    hdu = fits.open(io.BytesIO(response.content))[0]
+    if np.count_nonzero(hdu.data) == 0:
+        return None
 
-    if cache:
-        m = hashlib.md5()
-        m.update(f"{center_ra}{center_dec}{imsize}{image_source}".encode('utf-8'))
-        hash_name = "image" + m.hexdigest()
-        image_file = cachedir / hash_name
-        if image_file.exists():
-            print("Opening cached image")
-            image_file.touch()
-            hdu = fits.open(image_file)[0]
-        else:
-            hdu = get_hdu(url)
-            if np.count_nonzero(hdu.data) > 0:
-                hdu.writeto(image_file)
-            else:
-                hdu = None
-
-        if max_cache > 1:
-            cached_files = []
-            for item in Path(cachedir).glob('*'):
-                if item.is_file():
-                    cached_files.append((item.stat().st_mtime, item.name))
-            if len(cached_files) > max_cache:
-                for t, f in cached_files[-max_cache:]:
-                    try:
-                        os.remove(cachedir / f)
-                    except FileNotFoundError:
-                        pass
-    else:
-        hdu = get_hdu(url)
-        if np.count_nonzero(hdu.data) > 0:
-            hdu = None
+    if cache is not None:
+        buf = io.BytesIO()
+        hdu.writeto(buf)
+        cache.set(cache_key, buf.getvalue())
 
     return hdu
 
@@ -493,6 +544,9 @@ def get_finding_chart(
     tick_offset=0.02,
     tick_length=0.03,
     fallback_image_source='dss',
+    download_timeout=None,
+    image_cache=None,
+    ztfref_locator=None,
     **offset_star_kwargs,
 ):
 
@@ -521,6 +575,13 @@ def get_finding_chart(
     fallback_image_source : str, optional
         Where what `image_source` should we fall back to if the
         one requested fails
+    download_timeout : float, optional
+        Timeout (in seconds) of requests to survey servers; the image source
+        is considered to have failed if a request times out
+    image_cache : skyportal.utils.cache.DiskCache, optional
+        Cache of downloaded images
+    ztfref_locator : skyportal.utils.ztf.ZTFRefLocator, optional
+        How to find ZTF reference images
     **offset_star_kwargs : dict, optional
         Other parameters passed to `get_nearby_offset_stars`
 
@@ -570,7 +631,15 @@ def get_finding_chart(
     # set the pixelscale in arcsec (typically about 1 arcsec/pixel)
     pixscale = 60 * imsize / npixels
 
-    hdu = fits_image(source_ra, source_dec, imsize=imsize, image_source=image_source)
+    hdu = fits_image(
+        source_ra,
+        source_dec,
+        imsize=imsize,
+        image_source=image_source,
+        cache=image_cache,
+        timeout=download_timeout,
+        ztfref_locator=ztfref_locator,
+    )
 
     # skeleton WCS - this is the field that the user requested
     wcs = WCS(naxis=2)
@@ -612,6 +681,7 @@ def get_finding_chart(
         if fallback_image_source is not None:
             if fallback_image_source != image_source:
                 print(f"Falling back on image source {fallback_image_source}")
+                plt.close(fig)
                 return get_finding_chart(
                     source_ra,
                     source_dec,
@@ -622,6 +692,9 @@ def get_finding_chart(
                     tick_offset=tick_offset,
                     tick_length=tick_length,
                     fallback_image_source=None,
+                    download_timeout=download_timeout,
+                    image_cache=image_cache,
+                    ztfref_locator=ztfref_locator,
                     **offset_star_kwargs,
                 )
 
@@ -653,6 +726,7 @@ def get_finding_chart(
     )
 
     if not isinstance(star_list, list) or len(star_list) == 0:
+        plt.close(fig)
         return {
             'success': False,
             'reason': 'failure to get star list',
@@ -811,6 +885,9 @@ def get_finding_chart(
 
     buf = io.BytesIO()
     fig.savefig(buf, format=output_format)
+    # Finding charts are made in long-lived worker processes; release the
+    # figure so that pyplot does not keep every chart in memory
+    plt.close(fig)
     buf.seek(0)
 
     return {
@@ -0,0 +1,112 @@
+import numpy as np
+
+
+def stack_photometry(mjd, flux, fluxerr, groups, binsize, zp, detect_thresh=5.0):
+    """Stack photometry in bins of `binsize` days.
+
+    Points are binned separately for each distinct value of `groups` (e.g.
+    an instrument/filter combination), with each group's first bin starting
+    at its earliest point. Within a bin, points with a flux are combined
+    into their inverse-variance weighted mean flux and MJD. Points without a
+    flux (upper limits) only contribute to bins without any flux
+    measurement, whose depth is that of the limits combined in quadrature.
+
+    Parameters
+    ----------
+    mjd, flux, fluxerr : array-like
+        Photometry (flux and error in the system with zeropoint `zp`);
+        `flux` is NaN for upper limits. Points without a positive, finite
+        `fluxerr` are ignored.
+    groups : array-like
+        Group of each point.
+    binsize : float
+        Bin width in days.
+    zp : float
+        Zeropoint of the fluxes.
+    detect_thresh : float, optional
+        S/N above which a stacked flux is considered a detection, i.e. has
+        a magnitude; also the significance of the stacked limiting
+        magnitudes.
+
+    Returns
+    -------
+    dict of numpy.ndarray
+        One element per non-empty bin, ordered by group and then time:
+        `group`, `mjd`, `flux` (NaN if the bin contains only limits),
+        `fluxerr`, `n_points`, `detected`, `mag` and `magerr` (NaN if not
+        detected), and `lim_mag`.
+    """
+    mjd = np.asarray(mjd, dtype=float)
+    flux = np.asarray(flux, dtype=float)
+    fluxerr = np.asarray(fluxerr, dtype=float)
+    groups = np.asarray(groups)
+
+    with np.errstate(invalid='ignore'):
+        valid = np.isfinite(mjd) & np.isfinite(fluxerr) & (fluxerr > 0)
+    mjd, flux, fluxerr, groups = mjd[valid], flux[valid], fluxerr[valid], groups[valid]
+    if len(mjd) == 0:
+        return {
+            'group': groups,
+            'mjd': mjd,
+            'flux': flux,
+            'fluxerr': fluxerr,
+            'n_points': np.zeros(0, dtype=int),
+            'detected': np.zeros(0, dtype=bool),
+            'mag': mjd.copy(),
+            'magerr': mjd.copy(),
+            'lim_mag': mjd.copy(),
+        }
+
+    group_names, group_index = np.unique(groups, return_inverse=True)
+    group_index = group_index.ravel()
+    start = np.full(len(group_names), np.inf)
+    np.minimum.at(start, group_index, mjd)
+    bin_index = np.floor((mjd - start[group_index]) / binsize).astype(np.int64)
+    bins, inverse = np.unique(
+        np.column_stack([group_index, bin_index]), axis=0, return_inverse=True
+    )
+    inverse = inverse.ravel()
+    n_bins = len(bins)
+
+    hasflux = np.isfinite(flux)
+    ivar = fluxerr ** -2
+    flux_ivar = np.where(hasflux, ivar, 0.0)
+    flux_ivar_sum = np.bincount(inverse, flux_ivar, n_bins)
+    has_flux_bin = flux_ivar_sum > 0
+
+    # Weights for the bin MJDs: flux measurements if there are any in the
+    # bin, otherwise the limits
+    weight = np.where(has_flux_bin[inverse], flux_ivar, ivar)
+    stacked_mjd = np.bincount(inverse, weight * mjd, n_bins) / np.bincount(
+        inverse, weight, n_bins
+    )
+    with np.errstate(divide='ignore', invalid='ignore'):
+        stacked_flux = np.where(
+            has_flux_bin,
+            np.bincount(inverse, flux_ivar * np.where(hasflux, flux, 0.0), n_bins)
+            / flux_ivar_sum,
+            np.nan,
+        )
+        stacked_fluxerr = np.where(
+            has_flux_bin,
+            flux_ivar_sum ** -0.5,
+            np.bincount(inverse, ivar, n_bins) ** -0.5,
+        )
+        detected = has_flux_bin & (stacked_flux / stacked_fluxerr > detect_thresh)
+        mag = np.where(detected, -2.5 * np.log10(stacked_flux) + zp, np.nan)
+        magerr = np.where(
+            detected, 2.5 / np.log(10) * stacked_fluxerr / stacked_flux, np.nan
+        )
+    lim_mag = -2.5 * np.log10(detect_thresh * stacked_fluxerr) + zp
+
+    return {
+        'group': group_names[bins[:, 0]],
+        'mjd': stacked_mjd,
+        'flux': stacked_flux,
+        'fluxerr': stacked_fluxerr,
+        'n_points': np.bincount(inverse, minlength=n_bins),
+        'detected': detected,
+        'mag': mag,
+        'magerr': magerr,
+        'lim_mag': lim_mag,
+    }
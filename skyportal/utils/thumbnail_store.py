@@ -0,0 +1,205 @@
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+
+
+def content_key(data):
+    """Name under which thumbnail `data` (PNG bytes) is stored: the SHA-256
+    hash of its contents, so that identical thumbnails share a file and a
+    file's contents never change."""
+    return f'{hashlib.sha256(data).hexdigest()}.png'
+
+
+class LocalThumbnailStore:
+    """Store thumbnails as files in a local directory, served by the app
+    under `url_prefix`.
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+        Thumbnail directory (created if needed).
+    url_prefix : str, optional
+        URL at which the contents of `path` are served.
+    """
+
+    def __init__(self, path, url_prefix='/static/thumbnails'):
+        self.path = Path(path).resolve()
+        self.url_prefix = url_prefix.rstrip('/')
+
+    def file_uri(self, data):
+        """Location at which `data` is (or would be) stored."""
+        return str(self.path / content_key(data))
+
+    def put(self, data):
+        """Store `data` (PNG bytes), unless identical data is already stored.
+
+        Returns
+        -------
+        file_uri : str
+            Location of the stored thumbnail, for `exists` and `delete`.
+        public_url : str
+            URL at which the thumbnail is served.
+        """
+        key = content_key(data)
+        filename = Path(self.file_uri(data))
+        if not filename.exists():
+            self.path.mkdir(parents=True, exist_ok=True)
+            with tempfile.NamedTemporaryFile(
+                dir=self.path, prefix='.tmp-', delete=False
+            ) as f:
+                f.write(data)
+            os.replace(f.name, filename)
+        return str(filename), f'{self.url_prefix}/{key}'
+
+    def _filename(self, file_uri):
+        # Only files inside the store's directory are managed by it
+        filename = Path(file_uri).resolve()
+        if filename.parent != self.path:
+            return None
+        return filename
+
+    def exists(self, file_uri):
+        filename = self._filename(file_uri)
+        return filename is not None and filename.exists()
+
+    def delete(self, file_uri):
+        """Delete the thumbnail at `file_uri`, if it is in this store."""
+        filename = self._filename(file_uri)
+        if filename is None:
+            return
+        try:
+            os.remove(filename)
+        except FileNotFoundError:
+            pass
+
+
+class S3ThumbnailStore:
+    """Store thumbnails as objects in an S3 (or S3-compatible, e.g. MinIO)
+    bucket, so that they are shared by all the app's servers.
+
+    Requires `boto3`.
+
+    Parameters
+    ----------
+    bucket : str
+        Bucket name.
+    prefix : str, optional
+        Prefix of the thumbnails' object keys.
+    endpoint_url : str, optional
+        URL of an S3-compatible server (AWS S3 if not provided).
+    public_url : str, optional
+        URL at which the objects under `prefix` are served (e.g. by a CDN).
+        Defaults to the bucket's own URL; objects are then expected to be
+        publicly readable.
+    client : optional
+        S3 client to use, instead of one created with `boto3` (with
+        credentials from the environment).
+    """
+
+    def __init__(
+        self,
+        bucket,
+        prefix='thumbnails/',
+        endpoint_url=None,
+        public_url=None,
+        client=None,
+    ):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.endpoint_url = endpoint_url
+        if public_url is None:
+            if endpoint_url is None:
+                public_url = f'https://{bucket}.s3.amazonaws.com/{prefix}'
+            else:
+                public_url = f'{endpoint_url.rstrip("/")}/{bucket}/{prefix}'
+        self.public_url = public_url.rstrip('/')
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            import boto3
+
+            self._client = boto3.client('s3', endpoint_url=self.endpoint_url)
+        return self._client
+
+    def _object_key(self, file_uri):
+        # Only objects under the store's prefix are managed by it
+        bucket_uri = f's3://{self.bucket}/'
+        if file_uri is None or not file_uri.startswith(bucket_uri + self.prefix):
+            return None
+        return file_uri.replace(bucket_uri, '', 1)
+
+    def file_uri(self, data):
+        """Location at which `data` is (or would be) stored."""
+        return f's3://{self.bucket}/{self.prefix}{content_key(data)}'
+
+    def exists(self, file_uri):
+        from botocore.exceptions import ClientError
+
+        key = self._object_key(file_uri)
+        if key is None:
+            return False
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+        return True
+
+    def put(self, data):
+        """Store `data` (PNG bytes), unless identical data is already stored.
+        See `LocalThumbnailStore.put`."""
+        key = content_key(data)
+        file_uri = self.file_uri(data)
+        if not self.exists(file_uri):
+            self.client.put_object(
+                Bucket=self.bucket,
+                Key=f'{self.prefix}{key}',
+                Body=data,
+                ContentType='image/png',
+                # Objects are named by their contents, so never change
+                CacheControl='public, max-age=31536000, immutable',
+            )
+        return file_uri, f'{self.public_url}/{key}'
+
+    def delete(self, file_uri):
+        """Delete the thumbnail at `file_uri`, if it is in this store."""
+        key = self._object_key(file_uri)
+        if key is not None:
+            self.client.delete_object(Bucket=self.bucket, Key=key)
+
+
+def thumbnail_store(
+    backend='local',
+    local_path=None,
+    url_prefix='/static/thumbnails',
+    s3_bucket=None,
+    s3_prefix='thumbnails/',
+    s3_endpoint_url=None,
+    s3_public_url=None,
+):
+    """Create a thumbnail store from configuration values.
+
+    Parameters
+    ----------
+    backend : {'local', 's3'}
+        Store thumbnails in a local directory (`local_path`, served at
+        `url_prefix`), or in an S3 bucket (see `S3ThumbnailStore`).
+    """
+    if backend == 's3':
+        if not s3_bucket:
+            raise ValueError('A bucket is required for the S3 thumbnail store')
+        return S3ThumbnailStore(
+            s3_bucket,
+            prefix=s3_prefix or '',
+            endpoint_url=s3_endpoint_url,
+            public_url=s3_public_url,
+        )
+    if backend != 'local':
+        raise ValueError(f'Unknown thumbnail store backend: {backend}')
+    if local_path is None:
+        raise ValueError('A path is required for the local thumbnail store')
+    return LocalThumbnailStore(local_path, url_prefix=url_prefix)
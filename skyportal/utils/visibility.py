@@ -0,0 +1,118 @@
+import numpy as np
+from astropy import coordinates as ap_coord
+from astropy import units as u
+
+
+def altitudes(location, ra, dec, times):
+    """Altitudes of many targets at many times, in a single coordinate
+    transformation.
+
+    Parameters
+    ----------
+    location : astropy.coordinates.EarthLocation
+        Location of the observer.
+    ra, dec : array-like
+        Coordinates of the targets, in degrees.
+    times : astropy.time.Time
+        1-D array of times.
+
+    Returns
+    -------
+    numpy.ndarray
+        Altitudes in degrees, with shape `(len(ra), len(times))`.
+    """
+    coords = ap_coord.SkyCoord(
+        np.atleast_1d(ra)[:, np.newaxis], np.atleast_1d(dec)[:, np.newaxis], unit='deg'
+    )
+    frame = ap_coord.AltAz(obstime=times[np.newaxis, :], location=location)
+    return coords.transform_to(frame).alt.deg
+
+
+def _first_crossing(crossings, after):
+    """Index of the first True element of each row of `crossings` at or
+    after column `after` (per row), or -1 if there is none."""
+    columns = np.arange(crossings.shape[1])
+    crossings = crossings & (columns[np.newaxis, :] >= after[:, np.newaxis])
+    found = crossings.any(axis=1)
+    return np.where(found, crossings.argmax(axis=1), -1)
+
+
+def _interpolate_crossing(jd, alt, index, horizon):
+    """Time at which the altitude crosses `horizon` between grid points
+    `index` and `index + 1` of each row, by linear interpolation (NaN where
+    `index` is -1)."""
+    rows = np.arange(len(index))
+    valid = index >= 0
+    i = np.where(valid, index, 0)
+    a0 = alt[rows, i]
+    a1 = alt[rows, i + 1]
+    fraction = (horizon - a0) / (a1 - a0)
+    return np.where(valid, jd[i] + fraction * (jd[i + 1] - jd[i]), np.nan)
+
+
+def rise_set_times(location, ra, dec, start, horizon=30 * u.degree, points_per_day=288):
+    """Times at which targets next rise above, and then set below, an
+    altitude.
+
+    Altitudes of all targets are evaluated on a shared grid of times
+    spanning two days from `start`, and crossings are found by linear
+    interpolation between grid points. As with `astroplan.Observer`'s
+    `target_rise_time(..., which='next')` and `target_set_time`, a rise is
+    looked for in the 24 hours after `start`, and a set in the 24 hours
+    after the rise.
+
+    Parameters
+    ----------
+    location : astropy.coordinates.EarthLocation
+        Location of the observer.
+    ra, dec : array-like
+        Coordinates of the targets, in degrees.
+    start : astropy.time.Time
+        Time from which to look for rises.
+    horizon : astropy.units.Quantity, optional
+        Altitude of the horizon.
+    points_per_day : int, optional
+        Resolution of the time grid.
+
+    Returns
+    -------
+    (numpy.ndarray, numpy.ndarray)
+        Rise and set times (JD) of each target; NaN where the target does
+        not rise (or set) in the search window.
+    """
+    n_day = int(points_per_day)
+    times = start + np.linspace(0, 2, 2 * n_day + 1) * u.day
+    jd = times.jd
+    alt = altitudes(location, ra, dec, times)
+    horizon = horizon.to(u.degree).value
+
+    above = alt >= horizon
+    rising = ~above[:, :-1] & above[:, 1:]
+    setting = above[:, :-1] & ~above[:, 1:]
+
+    rise_index = _first_crossing(rising, np.zeros(len(alt), dtype=int))
+    rise_index[rise_index >= n_day] = -1
+    set_index = _first_crossing(setting, rise_index + 1)
+    set_index[(rise_index < 0) | (set_index - rise_index > n_day)] = -1
+
+    return (
+        _interpolate_crossing(jd, alt, rise_index, horizon),
+        _interpolate_crossing(jd, alt, set_index, horizon),
+    )
+
+
+def pickering_airmass(altitude, below_horizon=np.inf):
+    """Airmass at the given altitudes (in degrees), using the Pickering
+    (2002) interpolation of the Rayleigh (molecular atmosphere) airmass.
+
+    The Pickering interpolation tends toward 38.7494 as the altitude
+    approaches zero. Altitudes below zero (the horizon) are assigned an
+    airmass of `below_horizon`.
+    """
+    altitude = np.asarray(altitude, dtype=float)
+    above = altitude > 0
+    airmass = np.full(altitude.shape, below_horizon, dtype=float)
+    alt = altitude[above]
+    sinarg = alt + 244 / (165 + 47 * alt ** 1.1)
+    airmass[above] = 1.0 / np.sin(np.deg2rad(sinarg))
+    return airmass
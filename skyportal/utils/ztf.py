@@ -0,0 +1,164 @@
+import functools
+import io
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import requests
+from astropy import units as u
+from astropy_healpix import HEALPix
+
+
+# ZTF ref grabber URLs. See `skyportal.utils.offset.get_ztfref_url`
+irsa = {
+    "url_data": "https://irsa.ipac.caltech.edu/ibe/data/ztf/products/",
+    "url_search": "https://irsa.ipac.caltech.edu/ibe/search/ztf/products/",
+}
+
+# Columns identifying a reference image
+REF_COLUMNS = ['field', 'filtercode', 'ccdid', 'qid']
+CORNER_COLUMNS = [f'{c}{i}' for i in range(1, 5) for c in ('ra', 'dec')]
+
+
+def query_ref_quadrants(ra, dec, timeout=None):
+    """Reference images containing (`ra`, `dec`), from an IRSA metadata
+    search.
+
+    Returns
+    -------
+    list of dict
+        The `REF_COLUMNS` of each image, in the order returned by IRSA.
+    """
+    url = os.path.join(irsa['url_search'], f"ref?POS={ra:f},{dec:f}&ct=csv")
+    response = requests.get(url, timeout=timeout)
+    response.raise_for_status()
+    refs = pd.read_csv(io.StringIO(response.content.decode('utf-8')))
+    return [
+        {
+            'field': int(ref.field),
+            'filtercode': str(ref.filtercode),
+            'ccdid': int(ref.ccdid),
+            'qid': int(ref.qid),
+        }
+        for ref in refs[REF_COLUMNS].itertuples()
+    ]
+
+
+def _unit_vectors(ra, dec):
+    ra, dec = np.deg2rad(ra), np.deg2rad(dec)
+    return np.stack(
+        [np.cos(dec) * np.cos(ra), np.cos(dec) * np.sin(ra), np.sin(dec)], axis=-1
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def load_footprints(path):
+    """Load a table of ZTF reference-image footprints.
+
+    The table is a CSV file with a row per reference image: its
+    `REF_COLUMNS`, and the coordinates (in degrees) of the four corners of
+    its quadrant, in order around the quadrant, as `ra1, dec1, ..., ra4,
+    dec4`. Each table is only loaded once per process.
+    """
+    footprints = pd.read_csv(path)
+    missing = set(REF_COLUMNS + CORNER_COLUMNS) - set(footprints.columns)
+    if missing:
+        raise ValueError(f'Missing columns in ZTF footprints: {sorted(missing)}')
+    return footprints.reset_index(drop=True)
+
+
+def footprint_refs(footprints, ra, dec):
+    """Reference images of `footprints` (see `load_footprints`) whose
+    quadrants contain (`ra`, `dec`), those whose quadrant is best centered
+    on the position first (and in table order for the same quadrant)."""
+    corners = _unit_vectors(
+        footprints[[f'ra{i}' for i in range(1, 5)]].values,
+        footprints[[f'dec{i}' for i in range(1, 5)]].values,
+    )
+    center = corners.sum(axis=1)
+    center /= np.linalg.norm(center, axis=1)[:, np.newaxis]
+    point = _unit_vectors(ra, dec)
+
+    # A position is inside a (convex) quadrant if it is on the same side of
+    # each of its edges' great circles as the quadrant's center
+    normals = np.cross(corners, np.roll(corners, -1, axis=1))
+    inside = ((normals @ point) * np.einsum('ijk,ik->ij', normals, center) > 0).all(
+        axis=1
+    )
+
+    indices = np.flatnonzero(inside)
+    indices = indices[np.argsort(-(center[indices] @ point), kind='stable')]
+    return [
+        {
+            'field': int(row.field),
+            'filtercode': str(row.filtercode),
+            'ccdid': int(row.ccdid),
+            'qid': int(row.qid),
+        }
+        for row in footprints.iloc[indices][REF_COLUMNS].itertuples()
+    ]
+
+
+class ZTFRefLocator:
+    """Find the ZTF reference image covering a position.
+
+    Reference images are looked up in a local table of their footprints if
+    one is given, so that no request to IRSA is needed. Otherwise, IRSA's
+    metadata search is queried at the center of the HEALPix (nested) pixel
+    containing the position, and the results are stored in `cache` keyed
+    by pixel: reference images are not replaced, so each pixel with a
+    reference image is only ever looked up once.
+
+    Parameters
+    ----------
+    cache : skyportal.utils.cache.DiskCache, optional
+        Cache of the reference images of each pixel.
+    footprints_path : str, optional
+        Location of a table of reference-image footprints (see
+        `load_footprints`).
+    level : int, optional
+        HEALPix level of the pixels by which lookups are cached. Pixels are
+        about 13 arcsec across at level 14.
+    """
+
+    def __init__(self, cache=None, footprints_path=None, level=14):
+        self.cache = cache
+        self.footprints_path = footprints_path
+        self.level = level
+
+    @property
+    def footprints(self):
+        # Locators are sent to finding-chart worker processes with every
+        # task; the table is not, but loaded (once) by each process instead
+        if not self.footprints_path:
+            return None
+        return load_footprints(self.footprints_path)
+
+    def refs(self, ra, dec, timeout=None):
+        """Reference images containing (`ra`, `dec`) (see
+        `query_ref_quadrants`)."""
+        if self.footprints is not None:
+            return footprint_refs(self.footprints, ra, dec)
+
+        healpix = HEALPix(nside=2 ** self.level, order='nested')
+        pixel = int(healpix.lonlat_to_healpix(ra * u.deg, dec * u.deg))
+        key = f'ztfref/{self.level}/{pixel}'
+        if self.cache is not None:
+            data = self.cache.get(key)
+            if data is not None:
+                return json.loads(data)
+
+        lon, lat = healpix.healpix_to_lonlat(pixel)
+        refs = query_ref_quadrants(lon.deg, lat.deg, timeout=timeout)
+        # Pixels without a reference image are not cached, as one may be
+        # added later
+        if self.cache is not None and len(refs) > 0:
+            self.cache.set(key, json.dumps(refs).encode())
+        return refs
+
+    def lookup(self, ra, dec, timeout=None):
+        """The reference image to use at (`ra`, `dec`), or None if there is
+        none."""
+        refs = self.refs(ra, dec, timeout=timeout)
+        return refs[0] if refs else None
@@ -3,16 +3,18 @@ import PropTypes from "prop-types";
 import embed from "vega-embed";
 import VegaPlot from "./VegaPlot";
 
-const airmass_spec = (url, ephemeris) => ({
+const airmass_spec = (url, ephemeris, values) => ({
   $schema: "https://vega.github.io/schema/vega-lite/v4.json",
   background: "transparent",
-  data: {
-    url,
-    format: {
-      type: "json",
-      property: "data", // where on the JSON does the data live
-    },
-  },
+  data: values
+    ? { values }
+    : {
+        url,
+        format: {
+          type: "json",
+          property: "data", // where on the JSON does the data live
+        },
+      },
   layer: [
     {
       mark: { type: "line", clip: true },
@@ -42,11 +44,11 @@ const airmass_spec = (url, ephemeris) => ({
 });
 
 const AirmassPlot = React.memo((props) => {
-  const { dataUrl, ephemeris } = props;
+  const { dataUrl, ephemeris, values } = props;
   return (
     <div
       ref={(node) => {
-        embed(node, airmass_spec(dataUrl, ephemeris), {
+        embed(node, airmass_spec(dataUrl, ephemeris, values), {
           actions: false,
         });
       }}
@@ -66,6 +68,10 @@ AirmassPlot.propTypes = {
   }).isRequired,
 };
 
+AirmassPlot.defaultProps = {
+  ...VegaPlot.defaultProps,
+};
+
 AirmassPlot.displayName = "AirmassPlot";
 
 export default AirmassPlot;
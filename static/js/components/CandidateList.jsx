@@ -12,6 +12,19 @@ const VegaPlot = React.lazy(() =>
   import(/* webpackChunkName: "VegaPlot" */ "./VegaPlot")
 );
 
+// Convert the columnar light curve returned with each candidate by the
+// scanning bundle endpoint into the records plotted by VegaPlot
+const photometryRecords = (photometry) =>
+  (photometry.mjd || []).map((mjd, i) => ({
+    mjd,
+    mag: photometry.mag[i],
+    magerr: photometry.magerr[i],
+    limiting_mag: photometry.limiting_mag[i],
+    filter: photometry.filter[i],
+    instrument_name: photometry.instrument_name[i],
+    magsys: photometry.magsys,
+  }));
+
 const CandidateList = () => {
   const { candidates } = useSelector((state) => state.candidates);
 
@@ -112,9 +125,15 @@ const CandidateList = () => {
                   </td>
                   <td>
                     <Suspense fallback={<div>Loading plot...</div>}>
-                      <VegaPlot
-                        dataUrl={`/api/sources/${candidateObj.id}/photometry`}
-                      />
+                      {candidateObj.photometry ? (
+                        <VegaPlot
+                          values={photometryRecords(candidateObj.photometry)}
+                        />
+                      ) : (
+                        <VegaPlot
+                          dataUrl={`/api/sources/${candidateObj.id}/photometry`}
+                        />
+                      )}
                     </Suspense>
                   </td>
                   <td>
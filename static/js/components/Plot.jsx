@@ -15,7 +15,45 @@ import "bokehjs/bokeh-widgets.js";
 // eslint-disable-next-line import/extensions, import/no-extraneous-dependencies
 import "bokehcss/bokeh-widgets.css";
 
-function bokeh_render_plot(node, docs_json, render_items, custom_model_js) {
+// Promises for the custom Bokeh model bundles that have been (or are being)
+// loaded, keyed by URL. Bundle URLs contain a content hash, so each needs
+// to be fetched and evaluated only once per page load, and the browser
+// cache serves it thereafter.
+const customModelBundles = {};
+
+function loadCustomModels(url) {
+  if (!customModelBundles[url]) {
+    customModelBundles[url] = fetch(url, { credentials: "same-origin" })
+      .then((response) => {
+        if (!response.ok) {
+          throw new Error(`Could not load Bokeh models from ${url}`);
+        }
+        return response.text();
+      })
+      .then((custom_model_js) => {
+        // We have to give the Bokeh-generated JS snippet access to Bokeh.
+        // We do that by attaching Bokeh to the (global) Window object, and then
+        // modifying "this" (used by the universal module initializer) to point
+        // to it.
+        //
+        // The next statement may seem strange, since "Bokeh" is not defined; but the import
+        // above and/or webpack handles that for us.
+
+        // eslint-disable-next-line no-undef
+        window.Bokeh = Bokeh;
+        const js = custom_model_js.replace("this", "root");
+        // eslint-disable-next-line no-eval
+        eval(`const root = { Bokeh: window.Bokeh }; ${js}`);
+      })
+      .catch((error) => {
+        delete customModelBundles[url];
+        throw error;
+      });
+  }
+  return customModelBundles[url];
+}
+
+function bokeh_render_plot(node, docs_json, render_items) {
   // Create bokeh div element
   const bokeh_div = document.createElement("div");
   const inner_div = document.createElement("div");
@@ -28,20 +66,6 @@ function bokeh_render_plot(node, docs_json, render_items, custom_model_js) {
   }
   node.appendChild(bokeh_div);
 
-  // We have to give the Bokeh-generated JS snippet access to Bokeh.
-  // We do that by attaching Bokeh to the (global) Window object, and then
-  // modifying "this" (used by the universal module initializer) to point
-  // to it.
-  //
-  // The next statement may seem strange, since "Bokeh" is not defined; but the import
-  // above and/or webpack handles that for us.
-
-  // eslint-disable-next-line no-undef
-  window.Bokeh = Bokeh;
-  custom_model_js = custom_model_js.replace("this", "root");
-  // eslint-disable-next-line no-eval
-  eval(`const root = { Bokeh: window.Bokeh }; ${custom_model_js}`);
-
   // Generate plot
   // eslint-disable-next-line no-undef
   Bokeh.safely(() => {
@@ -54,7 +78,7 @@ const Plot = (props) => {
   const { url, className } = props;
   const dispatch = useDispatch();
   const plots = useSelector((state) => state.plots);
-  const [error] = useState(false);
+  const [error, setError] = useState(false);
   const [fetchingPlotIDs, setFetchingPlotIDs] = useState([]);
 
   const needsFetching = () =>
@@ -89,19 +113,22 @@ const Plot = (props) => {
     );
   }
 
-  const { docs_json, render_items, custom_model_js } = plotData;
+  const { docs_json, render_items, custom_model_url } = plotData;
 
   return (
     <div
       className={className}
       ref={(node) => {
         if (node) {
-          bokeh_render_plot(
-            node,
-            JSON.parse(docs_json),
-            JSON.parse(render_items),
-            custom_model_js
-          );
+          loadCustomModels(custom_model_url)
+            .then(() => {
+              bokeh_render_plot(
+                node,
+                JSON.parse(docs_json),
+                JSON.parse(render_items)
+              );
+            })
+            .catch(() => setError(true));
         }
       }}
     />
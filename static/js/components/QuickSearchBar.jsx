@@ -60,7 +60,9 @@ const QuickSearchBar = () => {
     const get = (val) =>
       dispatch(
         GET(
-          `/api/sources?sourceID=${val}&pageNumber=1&totalMatches=25`,
+          `/api/internal/autocomplete/sources?q=${encodeURIComponent(
+            val
+          )}&limit=25`,
           "skyportal/FETCH_AUTOCOMPLETE_SOURCES"
         )
       );
@@ -82,13 +84,10 @@ const QuickSearchBar = () => {
         const response = await get(debouncedInputValue);
         setLoading(false);
 
-        const matchingSources = await response.data.sources;
+        const matchingSourceIDs = await response.data;
 
-        if (matchingSources) {
-          const rez = Object.keys(matchingSources).map(
-            (key) => matchingSources[key].id
-          );
-          newOptions = [...newOptions, ...rez];
+        if (matchingSourceIDs) {
+          newOptions = [...newOptions, ...matchingSourceIDs];
         }
         cache.current[debouncedInputValue] = newOptions;
       }
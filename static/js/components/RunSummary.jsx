@@ -140,6 +140,8 @@ const RunSummary = ({ route }) => {
   // Load the observing run and its assignments if needed
   useEffect(() => {
     dispatch(Action.fetchObservingRun(route.id));
+    // Airmass curves of all the run's targets, in a single request
+    dispatch(Action.fetchRunAirmass(route.id));
   }, [route.id, dispatch]);
 
   if (!("id" in observingRun && observingRun.id === parseInt(route.id, 10))) {
@@ -177,12 +179,16 @@ const RunSummary = ({ route }) => {
               useGrid={false}
             />
             <Grid item>
-              <Suspense fallback={<div>Loading plot...</div>}>
-                <AirmassPlot
-                  dataUrl={`/api/internal/plot/airmass/${assignment.id}`}
-                  ephemeris={observingRun.ephemeris}
-                />
-              </Suspense>
+              {observingRun.airmass[assignment.id] ? (
+                <Suspense fallback={<div>Loading plot...</div>}>
+                  <AirmassPlot
+                    values={observingRun.airmass[assignment.id]}
+                    ephemeris={observingRun.ephemeris}
+                  />
+                </Suspense>
+              ) : (
+                <div>Loading plot...</div>
+              )}
             </Grid>
             <Grid item>
               <Suspense fallback={<div>Loading plot...</div>}>
@@ -2,15 +2,17 @@ import React from "react";
 import PropTypes from "prop-types";
 import embed from "vega-embed";
 
-const spec = (url) => ({
+const spec = (url, values) => ({
   $schema: "https://vega.github.io/schema/vega-lite/v4.json",
-  data: {
-    url,
-    format: {
-      type: "json",
-      property: "data", // where on the JSON does the data live
-    },
-  },
+  data: values
+    ? { values }
+    : {
+        url,
+        format: {
+          type: "json",
+          property: "data", // where on the JSON does the data live
+        },
+      },
   background: "transparent",
   layer: [
     {
@@ -167,11 +169,11 @@ const spec = (url) => ({
 });
 
 const VegaPlot = React.memo((props) => {
-  const { dataUrl } = props;
+  const { dataUrl, values } = props;
   return (
     <div
       ref={(node) => {
-        embed(node, spec(dataUrl), {
+        embed(node, spec(dataUrl, values), {
           actions: false,
         });
       }}
@@ -180,7 +182,13 @@ const VegaPlot = React.memo((props) => {
 });
 
 VegaPlot.propTypes = {
-  dataUrl: PropTypes.string.isRequired,
+  dataUrl: PropTypes.string,
+  values: PropTypes.arrayOf(PropTypes.object),
+};
+
+VegaPlot.defaultProps = {
+  dataUrl: null,
+  values: null,
 };
 
 VegaPlot.displayName = "VegaPlot";
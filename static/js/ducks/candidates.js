@@ -13,7 +13,10 @@ export const fetchCandidates = (filterParams = {}) => {
   }
   const params = new URLSearchParams(filterParams);
   const queryString = params.toString();
-  return API.GET(`/api/candidates?${queryString}`, FETCH_CANDIDATES);
+  return API.GET(
+    `/api/internal/scanning_bundle?${queryString}`,
+    FETCH_CANDIDATES
+  );
 };
 
 // Websocket message handler
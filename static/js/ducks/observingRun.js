@@ -8,9 +8,15 @@ export const REFRESH_OBSERVING_RUN = "skyportal/REFRESH_OBSERVING_RUN";
 export const FETCH_OBSERVING_RUN = "skyportal/FETCH_OBSERVING_RUN";
 export const FETCH_OBSERVING_RUN_OK = "skyportal/FETCH_OBSERVING_RUN_OK";
 
+export const FETCH_RUN_AIRMASS = "skyportal/FETCH_RUN_AIRMASS";
+export const FETCH_RUN_AIRMASS_OK = "skyportal/FETCH_RUN_AIRMASS_OK";
+
 export const fetchObservingRun = (id) =>
   API.GET(`/api/observing_run/${id}`, FETCH_OBSERVING_RUN);
 
+export const fetchRunAirmass = (id) =>
+  API.GET(`/api/internal/plot/airmass/run/${id}`, FETCH_RUN_AIRMASS);
+
 // Websocket message handler
 messageHandler.add((actionType, payload, dispatch, getState) => {
   const { observingRun } = getState();
@@ -18,11 +24,12 @@ messageHandler.add((actionType, payload, dispatch, getState) => {
     const { run_id } = payload;
     if (run_id === observingRun?.id) {
       dispatch(fetchObservingRun(run_id));
+      dispatch(fetchRunAirmass(run_id));
     }
   }
 });
 
-const reducer = (state = { assignments: [] }, action) => {
+const reducer = (state = { assignments: [], airmass: {} }, action) => {
   switch (action.type) {
     case FETCH_OBSERVING_RUN_OK: {
       const observingrun = action.data;
@@ -31,6 +38,13 @@ const reducer = (state = { assignments: [] }, action) => {
         ...observingrun,
       };
     }
+    case FETCH_RUN_AIRMASS_OK: {
+      // Airmass curves, keyed by assignment ID
+      return {
+        ...state,
+        airmass: { ...state.airmass, ...action.data },
+      };
+    }
     default:
       return state;
   }
@@ -9,9 +9,6 @@ for (let i = 0; i < toggle.labels.length; i++) {
   const fluxerrsource = eval(`obserr${i}`).data_source;
   const binerrsource = eval(`binerr${i}`).data_source;
 
-  const minmjd = Math.min.apply(Math, fluxsource.data.mjd) - 15;
-  const maxmjd = Math.max.apply(Math, fluxsource.data.mjd) + 15;
-
   binsource.data.mjd = [];
   binsource.data.flux = [];
   binsource.data.fluxerr = [];
@@ -33,75 +30,27 @@ for (let i = 0; i < toggle.labels.length; i++) {
   }
 
   if (binsize > 0) {
-    // now do the binning
-    const k = 0;
-    let curmjd = minmjd;
-    const mjdbins = [curmjd];
-
-    while (curmjd < maxmjd) {
-      curmjd += binsize;
-      mjdbins.push(curmjd);
-    }
-
-    const nbins = mjdbins.length - 1;
-    for (let l = 0; l < nbins; l++) {
-      // calculate the flux, fluxerror, and mjd of the bin
-      const flux = [];
-      const weight = [];
-      const mjd = [];
-      const limmag = [];
-      let ivarsum = 0;
-
-      for (let m = 0; m < fluxsource.get_length(); m++) {
-        if (
-          fluxsource.data.mjd[m] < mjdbins[l + 1] &&
-          fluxsource.data.mjd[m] >= mjdbins[l]
-        ) {
-          const fluxvar =
-            fluxsource.data.fluxerr[m] * fluxsource.data.fluxerr[m];
-          const ivar = 1 / fluxvar;
-
-          weight.push(ivar);
-          flux.push(fluxsource.data.flux[m]);
-          mjd.push(fluxsource.data.mjd[m]);
-          limmag.push(fluxsource.data.lim_mag);
-          ivarsum += ivar;
-        }
-      }
+    // the stacked photometry for each binsize is computed server-side
+    const stacksource = eval(`stacks${i}`);
 
-      let myflux = 0;
-      let mymjd = 0;
-
-      if (weight.length === 0) {
+    for (let m = 0; m < stacksource.get_length(); m++) {
+      if (stacksource.data.binsize[m] !== binsize) {
         continue;
       }
 
-      for (let n = 0; n < weight.length; n++) {
-        myflux += (weight[n] * flux[n]) / ivarsum;
-        mymjd += (weight[n] * mjd[n]) / ivarsum;
-      }
-
-      const myfluxerr = Math.sqrt(1 / ivarsum);
-
-      if (myflux / myfluxerr > detect_thresh) {
-        var mymag = -2.5 * Math.log10(myflux) + default_zp;
-        var mymagerr = Math.abs((-2.5 * myfluxerr) / myflux / Math.log(10));
-      } else {
-        var mymag = NaN;
-        var mymagerr = NaN;
-      }
-
-      const mymaglim =
-        -2.5 * Math.log10(detect_thresh * myfluxerr) + default_zp;
+      const mymjd = stacksource.data.mjd[m];
+      const myflux = stacksource.data.flux[m];
+      const myfluxerr = stacksource.data.fluxerr[m];
+      const detected = stacksource.data.detected[m];
 
       binsource.data.mjd.push(mymjd);
       binsource.data.flux.push(myflux);
       binsource.data.fluxerr.push(myfluxerr);
       binsource.data.filter.push(fluxsource.data.filter[0]);
       binsource.data.color.push(fluxsource.data.color[0]);
-      binsource.data.mag.push(mymag);
-      binsource.data.magerr.push(mymagerr);
-      binsource.data.lim_mag.push(mymaglim);
+      binsource.data.mag.push(detected ? stacksource.data.mag[m] : NaN);
+      binsource.data.magerr.push(detected ? stacksource.data.magerr[m] : NaN);
+      binsource.data.lim_mag.push(stacksource.data.lim_mag[m]);
       binsource.data.instrument.push(fluxsource.data.instrument[0]);
       binsource.data.stacked.push(true);
 
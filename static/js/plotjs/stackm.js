@@ -15,9 +15,6 @@ for (let i = 0; i < toggle.labels.length; i++) {
   const boldsource = eval(`bold${i}`);
   const allsource = eval(`all${i}`);
 
-  const minmjd = Math.min.apply(Math, fluxsource.data.mjd) - 15;
-  const maxmjd = Math.max.apply(Math, fluxsource.data.mjd) + 15;
-
   boldsource.data.flux = [];
   boldsource.data.fluxerr = [];
   boldsource.data.mjd = [];
@@ -95,60 +92,23 @@ for (let i = 0; i < toggle.labels.length; i++) {
   }
 
   if (binsize > 0) {
-    // now do the binning
-    const k = 0;
-    let curmjd = minmjd;
-    const mjdbins = [curmjd];
-
-    while (curmjd < maxmjd) {
-      curmjd += binsize;
-      mjdbins.push(curmjd);
-    }
-
-    const nbins = mjdbins.length - 1;
-    for (let l = 0; l < nbins; l++) {
-      // calculate the flux, fluxerror, and mjd of the bin
-      const flux = [];
-      const weight = [];
-      const mjd = [];
-      const limmag = [];
-      let ivarsum = 0;
-
-      for (let m = 0; m < allsource.get_length(); m++) {
-        if (
-          allsource.data.mjd[m] < mjdbins[l + 1] &&
-          allsource.data.mjd[m] >= mjdbins[l] &&
-          isFinite(allsource.data.flux[m])
-        ) {
-          const fluxvar = allsource.data.fluxerr[m] * allsource.data.fluxerr[m];
-          const ivar = 1 / fluxvar;
-
-          weight.push(ivar);
-          flux.push(allsource.data.flux[m]);
-          mjd.push(allsource.data.mjd[m]);
-          limmag.push(allsource.data.lim_mag[m]);
-          ivarsum += ivar;
-        }
-      }
-
-      let myflux = 0;
-      let mymjd = 0;
+    // the stacked photometry for each binsize is computed server-side
+    const stacksource = eval(`stacks${i}`);
 
-      if (weight.length === 0) {
+    for (let m = 0; m < stacksource.get_length(); m++) {
+      if (stacksource.data.binsize[m] !== binsize) {
         continue;
       }
 
-      for (let n = 0; n < weight.length; n++) {
-        myflux += (weight[n] * flux[n]) / ivarsum;
-        mymjd += (weight[n] * mjd[n]) / ivarsum;
-      }
-
-      const myfluxerr = Math.sqrt(1 / ivarsum);
-      const obs = myflux / myfluxerr > detect_thresh;
+      const mymjd = stacksource.data.mjd[m];
+      const myflux = stacksource.data.flux[m];
+      const myfluxerr = stacksource.data.fluxerr[m];
+      const mymaglim = stacksource.data.lim_mag[m];
+      const obs = stacksource.data.detected[m];
 
       if (obs) {
-        var mymag = -2.5 * Math.log10(myflux) + default_zp;
-        var mymagerr = Math.abs((-2.5 * myfluxerr) / myflux / Math.log(10));
+        var mymag = stacksource.data.mag[m];
+        var mymagerr = stacksource.data.magerr[m];
         var mysource = binsource;
 
         binerrsource.data.xs.push([mymjd, mymjd]);
@@ -160,13 +120,6 @@ for (let i = 0; i < toggle.labels.length; i++) {
         var mysource = unobsbinsource;
       }
 
-      if (weight.length > 1) {
-        var mymaglim =
-          -2.5 * Math.log10(detect_thresh * myfluxerr) + default_zp;
-      } else {
-        var mymaglim = limmag[0];
-      }
-
       mysource.data.mjd.push(mymjd);
       mysource.data.flux.push(myflux);
       mysource.data.fluxerr.push(myfluxerr);
@@ -0,0 +1,23 @@
+import json
+import os
+import tempfile
+
+from skyportal.enum_types import ALLOWED_BANDPASSES
+from skyportal.plot import BANDPASS_COLORS_FILE, compute_bandpass_color
+
+
+if __name__ == "__main__":
+    colors = {}
+    for bandpass_name in ALLOWED_BANDPASSES:
+        try:
+            colors[bandpass_name] = compute_bandpass_color(bandpass_name)
+        except Exception as e:
+            print(f'Skipping bandpass {bandpass_name}: {e}')
+
+    # Write atomically, so that an interrupted run leaves no partial table
+    with tempfile.NamedTemporaryFile(
+        'w', dir=os.path.dirname(BANDPASS_COLORS_FILE), delete=False
+    ) as f:
+        json.dump(colors, f, indent=2, sort_keys=True)
+    os.replace(f.name, BANDPASS_COLORS_FILE)
+    print(f'Wrote colors of {len(colors)} bandpasses to {BANDPASS_COLORS_FILE}')